@@ -1,17 +1,38 @@
-import shutil, datetime
-from pathlib import Path
-from database import get_db_path, get_storage_root
+import argparse
+from datetime import datetime
+from backup import run_backup, run_incremental_backup, restore_point_in_time
 
 def backup_database():
-    db_path = Path(get_db_path())
-    backup_dir = get_storage_root() / "yedek_database"
-    backup_dir.mkdir(parents=True, exist_ok=True)
+    backup_path, removed = run_backup()
+    print(f"✅ Database buraya yedeklendi: {backup_path}")
+    if removed:
+        print(f"[INFO] {len(removed)} eski yedek silindi.")
 
-    date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-    backup_path = backup_dir / f"dance_school{date_str}.db"
+def incremental_backup():
+    kind, path = run_incremental_backup()
+    if kind == "none":
+        print("[INFO] Son yedekten beri değişiklik yok.")
+    else:
+        print(f"✅ {'Tam' if kind == 'full' else 'Artımlı'} yedek: {path}")
 
-    shutil.copy(str(db_path), str(backup_path))
-    print(f"✅ Database buraya yedeklendi: {backup_path}")
+def main():
+    parser = argparse.ArgumentParser(description="dance_school.db yedekleme")
+    parser.add_argument("--incremental", action="store_true",
+                        help="günde bir tam yedek, arada sadece değişiklik (delta) dosyaları")
+    parser.add_argument("--restore", metavar="HEDEF_DOSYA",
+                        help="yedek + delta zincirinden yeni bir veritabanı dosyası oluştur")
+    parser.add_argument("--until", metavar="'YYYY-MM-DD HH:MM:SS'",
+                        help="--restore ile: bu ana kadar olan değişiklikleri uygula")
+    args = parser.parse_args()
+
+    if args.restore:
+        until = datetime.strptime(args.until, "%Y-%m-%d %H:%M:%S") if args.until else None
+        target, base, applied = restore_point_in_time(args.restore, until=until)
+        print(f"✅ {target} oluşturuldu ({base.name} + {applied} değişiklik).")
+    elif args.incremental:
+        incremental_backup()
+    else:
+        backup_database()
 
 if __name__ == "__main__":
-    backup_database()
+    main()
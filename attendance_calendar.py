@@ -1,7 +1,12 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QCalendarWidget, QLabel, QPushButton, QMessageBox, QHBoxLayout
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QCalendarWidget, QLabel, QPushButton, QMessageBox, QHBoxLayout,
+    QTableWidget, QTableWidgetItem, QHeaderView
+)
 from PyQt5.QtCore import QDate, Qt
 from PyQt5.QtGui import QPainter, QColor, QFont, QBrush
-from database import get_attendance_for_student, add_attendance, remove_attendance_for_student
+from database import get_attendance_for_student, add_attendance, remove_attendance_for_student, get_credit_history
+from sql_trace import sql_action
+from command_log import undoable
 from datetime import datetime
 
 
@@ -72,6 +77,15 @@ class AttendanceCalendar(QDialog):
         btn_layout.addWidget(remove_btn)
         layout.addLayout(btn_layout)
 
+        # Lesson credit events (credit_ledger), newest first
+        self.credit_table = QTableWidget(0, 4)
+        self.credit_table.setHorizontalHeaderLabels(["Tarih", "Hareket", "Ders", "Kaynak"])
+        self.credit_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.credit_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.credit_table.setMaximumHeight(160)
+        layout.addWidget(self.credit_table)
+        self.refresh_credits()
+
         # OK Button
         ok_btn = QPushButton("OK")
         ok_btn.clicked.connect(self.accept)
@@ -82,6 +96,20 @@ class AttendanceCalendar(QDialog):
         legend.setAlignment(Qt.AlignCenter)
         layout.addWidget(legend)
 
+    def refresh_credits(self):
+        labels = {"purchase": "Alım", "consume": "Düşüm", "adjust": "Düzeltme"}
+        rows = list(reversed(get_credit_history(self.student_id)))
+        self.credit_table.setRowCount(len(rows))
+        for r, (date_str, kind, amount, source, _note) in enumerate(rows):
+            values = [QDate.fromString(date_str, "yyyy-MM-dd").toString("dd-MM-yyyy"),
+                      labels.get(kind, kind), f"{amount:+d}", source or ""]
+            for c, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setTextAlignment(Qt.AlignCenter)
+                self.credit_table.setItem(r, c, item)
+
+    @sql_action("ui.add_attendance_for_selected_day")
+    @undoable("Yoklama")
     def add_attendance_for_selected_day(self):
         selected_date = self.calendar.selectedDate()
         date_str = selected_date.toString("yyyy-MM-dd")
@@ -89,7 +117,10 @@ class AttendanceCalendar(QDialog):
         self.attendance_dates.add(date_str)
         QMessageBox.information(self, "Success", f"Added attendance for {date_str}.")
         self.calendar.update()
+        self.refresh_credits()
 
+    @sql_action("ui.remove_attendance_for_selected_day")
+    @undoable("Yoklama silme")
     def remove_attendance_for_selected_day(self):
         selected_date = self.calendar.selectedDate()
         date_str = selected_date.toString("yyyy-MM-dd")
@@ -109,7 +140,10 @@ class AttendanceCalendar(QDialog):
             self.attendance_dates.discard(date_str)
             QMessageBox.information(self, "Attendance Removed", f"Removed attendance for {date_str}.")
             self.calendar.update()
+            self.refresh_credits()
 
+    @sql_action("ui.calendar_mark_attendance")
+    @undoable("Yoklama")
     def mark_attendance(self, student_id, class_id, table_widget):
         today_str = datetime.today().strftime("%Y-%m-%d")
         add_attendance(student_id, today_str)
@@ -0,0 +1,496 @@
+# backup.py
+"""
+Online backups of the active branch's database into
+<branch storage root>/yedek_database (database.get_branch_storage_root).
+
+Uses sqlite3.Connection.backup so the copy is consistent even while the app
+is writing, compresses the result and prunes old files with an
+hourly/daily/weekly retention policy.
+
+Between full snapshots, export_delta() writes the rows recorded in change_log
+(see database._ensure_change_log) to small .jsonl.gz delta files;
+restore_point_in_time() replays a delta chain onto a snapshot.
+
+change_log is purged here once a snapshot covers it. Installs that never back
+up are capped by database.trim_change_log (run by init_db, newest
+CHANGE_LOG_MAX_ROWS rows); if that drops rows no delta holds yet, the next
+run_incremental_backup() takes a full snapshot instead of a delta.
+
+Every file written here is also described in yedek_database/index.json
+(time, size, change_log sequence, row counts), so listing backups never has
+to open or decompress them.
+"""
+import gzip
+import json
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from database import (
+    get_connection, get_branch_storage_root, get_backup_state, set_backup_state,
+    get_change_log_since, purge_change_log,
+)
+
+BACKUP_DIR_NAME = "yedek_database"
+BACKUP_PREFIX = "dance_school_"
+DELTA_PREFIX = "dance_school_delta_"
+DELTA_SUFFIX = ".jsonl.gz"
+TIMESTAMP_FMT = "%Y-%m-%d_%H-%M-%S"
+PAGES_PER_STEP = 256  # copy in small steps so writers are never locked out for long
+
+# keep the newest backup of each of the last N hours / days / ISO weeks
+RETENTION = {"hourly": 24, "daily": 14, "weekly": 8}
+KEEP_ALL_HOURS = 6  # ...and every backup younger than this (e.g. safety copies before a restore)
+
+_SUFFIXES = {"gzip": ".db.gz", "zstd": ".db.zst"}
+
+INDEX_NAME = "index.json"
+COUNTED_TABLES = ("classes", "students", "attendance", "hesap_records")
+
+
+def get_backup_dir() -> Path:
+    backup_dir = get_branch_storage_root() / BACKUP_DIR_NAME
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    return backup_dir
+
+
+def _load_index(backup_dir: Path) -> dict:
+    try:
+        with open(Path(backup_dir) / INDEX_NAME, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(backup_dir: Path, index: dict):
+    path = Path(backup_dir) / INDEX_NAME
+    tmp_path = path.with_name(f".{INDEX_NAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(index, fh, ensure_ascii=False, indent=1, sort_keys=True)
+    tmp_path.replace(path)
+
+
+def _record_in_index(path: Path, meta: dict):
+    index = _load_index(path.parent)
+    index[path.name] = dict(meta, size=path.stat().st_size)
+    _save_index(path.parent, index)
+
+
+def _forget_in_index(backup_dir: Path, paths):
+    index = _load_index(backup_dir)
+    for p in paths:
+        index.pop(Path(p).name, None)
+    _save_index(backup_dir, index)
+
+
+def list_backups(backup_dir=None):
+    """
+    Backups with metadata from the sidecar index, newest first:
+    [{"file", "path", "kind", "created", "size", "change_seq", "row_counts"}, ...]
+    Files the index does not know (legacy copies) are listed with size only.
+    """
+    backup_dir = Path(backup_dir) if backup_dir else get_backup_dir()
+    index = _load_index(backup_dir)
+    result = []
+    for p in backup_dir.iterdir():
+        if not p.is_file() or p.name.startswith(".") or p.name == INDEX_NAME:
+            continue
+        meta = index.get(p.name)
+        if meta is None:
+            if not p.name.endswith((".db", *_SUFFIXES.values(), DELTA_SUFFIX)):
+                continue
+            ts = parse_backup_timestamp(p)
+            meta = {
+                "kind": "delta" if p.name.startswith(DELTA_PREFIX) else "full",
+                "created": (ts or datetime.fromtimestamp(p.stat().st_mtime)).strftime("%Y-%m-%d %H:%M:%S"),
+                "size": p.stat().st_size,
+                "change_seq": None,
+                "row_counts": None,
+            }
+        result.append(dict(meta, file=p.name, path=p))
+    result.sort(key=lambda m: (m["created"], m["file"]), reverse=True)
+    return result
+
+
+def _zstd():
+    """Return the optional zstandard module, or None if it is not installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _resolve_compression(compression: str) -> str:
+    if compression == "zstd" and _zstd() is None:
+        print("[WARNING] zstandard kurulu değil, gzip kullanılıyor.")
+        return "gzip"
+    if compression not in _SUFFIXES:
+        raise ValueError(f"unknown compression: {compression}")
+    return compression
+
+
+def _compress_file(src: Path, dst: Path, compression: str):
+    with open(src, "rb") as fin:
+        if compression == "zstd":
+            cctx = _zstd().ZstdCompressor(level=10)
+            with open(dst, "wb") as fout:
+                cctx.copy_stream(fin, fout)
+        else:
+            with gzip.open(dst, "wb", compresslevel=6) as fout:
+                shutil.copyfileobj(fin, fout)
+
+
+def decompress_backup(src: Path, dst: Path) -> Path:
+    """Inflate a .db.gz / .db.zst backup (or copy a plain .db) into dst."""
+    src, dst = Path(src), Path(dst)
+    if src.name.endswith(".gz"):
+        with gzip.open(src, "rb") as fin, open(dst, "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+    elif src.name.endswith(".zst"):
+        zstd = _zstd()
+        if zstd is None:
+            raise RuntimeError("zstandard kurulu değil, .zst yedeği açılamıyor")
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            zstd.ZstdDecompressor().copy_stream(fin, fout)
+    else:
+        shutil.copyfile(src, dst)
+    return dst
+
+
+def _integrity_check(conn) -> str:
+    rows = conn.execute("PRAGMA integrity_check").fetchall()
+    return "; ".join(r[0] for r in rows)
+
+
+def create_backup(compression="gzip", progress=None) -> Path:
+    """
+    Take a consistent online copy of the live DB, verify it and compress it.
+    Safe to call from a worker thread: it opens its own connections.
+    progress(status, remaining, total) is forwarded to Connection.backup.
+    """
+    compression = _resolve_compression(compression)
+    backup_dir = get_backup_dir()
+
+    stamp = datetime.now().strftime(TIMESTAMP_FMT)
+    final_path = backup_dir / f"{BACKUP_PREFIX}{stamp}{_SUFFIXES[compression]}"
+    n = 1
+    while final_path.exists():
+        final_path = backup_dir / f"{BACKUP_PREFIX}{stamp}-{n}{_SUFFIXES[compression]}"
+        n += 1
+    tmp_path = backup_dir / f".{final_path.name}.tmp"
+
+    # flush pending change_log rows first so the delta chain has no holes
+    exported_seq = export_delta()[1]
+
+    src = get_connection()
+    dst = sqlite3.connect(str(tmp_path))
+    try:
+        src.backup(dst, pages=PAGES_PER_STEP, progress=progress)
+        result = _integrity_check(dst)
+        if result != "ok":
+            raise RuntimeError(f"integrity_check başarısız: {result}")
+        snapshot_seq = _change_seq(dst)
+        row_counts = _row_counts(dst)
+    except Exception:
+        dst.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        src.close()
+    dst.close()
+
+    try:
+        _compress_file(tmp_path, final_path, compression)
+    except Exception:
+        final_path.unlink(missing_ok=True)
+        raise
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    _record_in_index(final_path, {
+        "kind": "full",
+        "created": datetime.strptime(stamp, TIMESTAMP_FMT).strftime("%Y-%m-%d %H:%M:%S"),
+        "change_seq": snapshot_seq,
+        "row_counts": row_counts,
+        "compression": compression,
+    })
+
+    # everything up to here lives in a delta file and in the snapshot
+    if snapshot_seq:
+        purge_change_log(min(exported_seq, snapshot_seq))
+    return final_path
+
+
+def _row_counts(conn) -> dict:
+    counts = {}
+    for table in COUNTED_TABLES:
+        try:
+            counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            counts[table] = None
+    return counts
+
+
+def _change_seq(conn) -> int:
+    """Last change_log sequence number recorded in the given database (0 if none)."""
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
+
+
+# === Incremental (delta) backups ===
+
+def export_delta(backup_dir=None):
+    """
+    Write change_log rows not yet exported to a small .jsonl.gz delta file.
+    Returns (path or None, last exported seq).
+    """
+    backup_dir = Path(backup_dir) if backup_dir else get_backup_dir()
+    try:
+        last_seq = int(get_backup_state("last_delta_seq", 0))
+        rows = get_change_log_since(last_seq)
+    except sqlite3.OperationalError:
+        return None, 0  # init_db has not created change_log in this DB yet
+    if not rows:
+        return None, last_seq
+
+    first, last = rows[0][0], rows[-1][0]
+    stamp = datetime.now().strftime(TIMESTAMP_FMT)
+    path = backup_dir / f"{DELTA_PREFIX}{stamp}_{first:010d}-{last:010d}{DELTA_SUFFIX}"
+    tmp_path = backup_dir / f".{path.name}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+        for seq, tbl, op, row_id, row_json, changed_at in rows:
+            fh.write(json.dumps({
+                "seq": seq, "tbl": tbl, "op": op, "row_id": row_id,
+                "row": json.loads(row_json) if row_json else None,
+                "at": changed_at,
+            }, ensure_ascii=False) + "\n")
+    tmp_path.replace(path)
+    _record_in_index(path, {
+        "kind": "delta",
+        "created": datetime.strptime(stamp, TIMESTAMP_FMT).strftime("%Y-%m-%d %H:%M:%S"),
+        "change_seq": last,
+        "first_seq": first,
+        "changes": len(rows),
+    })
+
+    set_backup_state("last_delta_seq", last)
+    return path, last
+
+
+def list_delta_files(backup_dir=None):
+    """[(first_seq, last_seq, Path), ...] ordered by sequence."""
+    backup_dir = Path(backup_dir) if backup_dir else get_backup_dir()
+    found = []
+    for p in backup_dir.glob(f"{DELTA_PREFIX}*{DELTA_SUFFIX}"):
+        seq_part = p.name[:-len(DELTA_SUFFIX)].rsplit("_", 1)[-1]
+        try:
+            first, last = (int(x) for x in seq_part.split("-"))
+        except ValueError:
+            continue
+        found.append((first, last, p))
+    found.sort()
+    return found
+
+
+def run_incremental_backup(full_every=timedelta(days=1), compression="gzip"):
+    """
+    Take a full snapshot when the newest one is older than full_every, otherwise
+    only write a delta file. Returns ("full" | "delta" | "none", path).
+    """
+    backups = list_backup_files()
+    trimmed = int(get_backup_state("change_log_trimmed_seq", 0)) > int(get_backup_state("last_delta_seq", 0))
+    if not backups or trimmed or datetime.now() - backups[0][0] >= full_every:
+        path, _ = run_backup(compression=compression)
+        return "full", path
+    path, _ = export_delta()
+    return ("delta", path) if path else ("none", None)
+
+
+def _iter_delta_entries(deltas, after_seq):
+    for _, last, path in deltas:
+        if last <= after_seq:
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry["seq"] > after_seq:
+                        yield entry
+
+
+def _apply_entry(cur, entry, columns_cache):
+    tbl = entry["tbl"]
+    if tbl not in columns_cache:
+        columns_cache[tbl] = {r[1] for r in cur.execute(f"PRAGMA table_info({tbl})").fetchall()}
+    columns = columns_cache[tbl]
+    if not columns:
+        return  # table does not exist in this snapshot
+
+    if entry["op"] == "D":
+        cur.execute(f"DELETE FROM {tbl} WHERE rowid=?", (entry["row_id"],))
+        return
+
+    # UPSERT on the rowid only: INSERT OR REPLACE would silently delete another
+    # row that collides on a secondary UNIQUE index (persons, class_sessions, ...)
+    row = {k: v for k, v in (entry["row"] or {}).items() if k in columns}
+    try:
+        if row:
+            assignments = ", ".join(f'"{k}"=?' for k in row)
+            cur.execute(f"UPDATE {tbl} SET {assignments} WHERE rowid=?", [*row.values(), entry["row_id"]])
+            if cur.rowcount:
+                return
+        names = ["rowid"] + [f'"{k}"' for k in row]
+        cur.execute(f"INSERT INTO {tbl} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+                    [entry["row_id"], *row.values()])
+    except sqlite3.IntegrityError as e:
+        raise RuntimeError(f"Delta #{entry['seq']} ({tbl}, satır {entry['row_id']}) uygulanamadı: {e}") from e
+
+
+def restore_point_in_time(target_path, until=None, backup_dir=None):
+    """
+    Rebuild the database as it was at `until` (datetime, default: newest data)
+    into target_path: newest full snapshot taken at or before `until`, plus every
+    delta entry recorded after it up to `until`. The live DB is never touched.
+    Returns (target_path, base snapshot, number of replayed changes).
+    """
+    backup_dir = Path(backup_dir) if backup_dir else get_backup_dir()
+    target_path = Path(target_path)
+    until_txt = until.strftime("%Y-%m-%d %H:%M:%S") if until else None
+
+    candidates = [(ts, p) for ts, p in list_backup_files(backup_dir) if until is None or ts <= until]
+    if not candidates:
+        raise RuntimeError("Bu tarihten önce alınmış tam yedek bulunamadı.")
+    base_ts, base_path = candidates[0]
+
+    if target_path.exists():
+        raise FileExistsError(f"Hedef dosya zaten var: {target_path}")
+    decompress_backup(base_path, target_path)
+
+    conn = sqlite3.connect(str(target_path))
+    cur = conn.cursor()
+    base_seq = _change_seq(conn)
+    applied, last_applied = 0, base_seq
+    columns_cache = {}
+    try:
+        cur.execute("BEGIN")
+        for entry in _iter_delta_entries(list_delta_files(backup_dir), base_seq):
+            if until_txt and entry["at"] > until_txt:
+                break
+            if entry["seq"] != last_applied + 1:
+                raise RuntimeError(
+                    f"Delta zincirinde boşluk var: {last_applied} sonrası {entry['seq']} geliyor."
+                )
+            _apply_entry(cur, entry, columns_cache)
+            applied += 1
+            last_applied = entry["seq"]
+
+        # the replay itself fired the change_log triggers; drop those rows and
+        # continue the sequence where the original timeline stopped
+        cur.execute("DELETE FROM change_log WHERE seq > ?", (base_seq,))
+        cur.execute("UPDATE sqlite_sequence SET seq=? WHERE name='change_log'", (last_applied,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.close()
+        target_path.unlink(missing_ok=True)
+        raise
+
+    result = _integrity_check(conn)
+    conn.close()
+    if result != "ok":
+        raise RuntimeError(f"integrity_check başarısız: {result}")
+    print(f"[INFO] {base_path.name} ({base_ts}) üzerine {applied} değişiklik uygulandı.")
+    return target_path, base_path, applied
+
+
+def parse_backup_timestamp(path: Path):
+    """Return the datetime encoded in a backup file name, or None for foreign files."""
+    name = Path(path).name
+    if not name.startswith(BACKUP_PREFIX):
+        return None
+    stem = name[len(BACKUP_PREFIX):].split(".", 1)[0]
+    try:
+        return datetime.strptime(stem[:19], TIMESTAMP_FMT)
+    except ValueError:
+        return None
+
+
+def list_backup_files(backup_dir=None):
+    """[(datetime, Path), ...] newest first; legacy dance_schoolYYYY-MM-DD.db files are ignored."""
+    backup_dir = Path(backup_dir) if backup_dir else get_backup_dir()
+    found = []
+    for p in backup_dir.iterdir():
+        if not p.is_file() or not any(p.name.endswith(s) for s in _SUFFIXES.values()):
+            continue
+        ts = parse_backup_timestamp(p)
+        if ts is not None:
+            found.append((ts, p))
+    found.sort(key=lambda t: (t[0], t[1].name), reverse=True)
+    return found
+
+
+def apply_retention(backup_dir=None, policy=None):
+    """
+    Keep every backup from the last KEEP_ALL_HOURS hours plus the newest backup
+    of each of the last N hours/days/weeks (see RETENTION); delete the rest. Returns the list of removed paths.
+    """
+    policy = policy or RETENTION
+    backups = list_backup_files(backup_dir)
+    if not backups:
+        return []
+
+    bucket_of = {
+        "hourly": lambda dt: (dt.year, dt.month, dt.day, dt.hour),
+        "daily": lambda dt: dt.date(),
+        "weekly": lambda dt: tuple(dt.isocalendar())[:2],
+    }
+
+    keep = {backups[0][1]}  # never delete the newest one
+    recent_cutoff = datetime.now() - timedelta(hours=KEEP_ALL_HOURS)
+    keep.update(path for ts, path in backups if ts >= recent_cutoff)
+    for kind, limit in policy.items():
+        seen = set()
+        for ts, path in backups:  # newest first → first file per bucket wins
+            key = bucket_of[kind](ts)
+            if key in seen:
+                continue
+            if len(seen) >= limit:
+                break
+            seen.add(key)
+            keep.add(path)
+
+    removed = []
+    for _, path in backups:
+        if path not in keep:
+            try:
+                path.unlink()
+                removed.append(path)
+            except OSError as e:
+                print(f"[WARNING] Eski yedek silinemedi {path}: {e}")
+
+    # deltas older than the oldest kept snapshot can no longer be replayed
+    oldest_kept = min(ts for ts, path in backups if path in keep)
+    for _, _, path in list_delta_files(backups[0][1].parent):
+        ts = datetime.strptime(path.name[len(DELTA_PREFIX):][:19], TIMESTAMP_FMT)
+        if ts < oldest_kept:
+            try:
+                path.unlink()
+                removed.append(path)
+            except OSError as e:
+                print(f"[WARNING] Eski delta silinemedi {path}: {e}")
+
+    if removed:
+        _forget_in_index(backups[0][1].parent, removed)
+    return removed
+
+
+def run_backup(compression="gzip", progress=None):
+    """Create a verified backup and apply the retention policy. Returns (path, removed)."""
+    path = create_backup(compression=compression, progress=progress)
+    removed = apply_retention(path.parent)
+    return path, removed
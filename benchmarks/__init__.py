@@ -0,0 +1,9 @@
+"""
+Reproducible benchmarks on synthetic school databases.
+
+    python -m benchmarks.generate bench.db --students 2000 --years 3
+    python -m benchmarks.run --students 2000 --repeat 5
+
+Results are written as JSON under benchmarks/results/ so two versions of
+the app can be compared run by run.
+"""
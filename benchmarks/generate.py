@@ -0,0 +1,165 @@
+# benchmarks/generate.py
+"""
+Build a realistic dance_school.db for benchmarking: classes with several
+day/hour sub-classes, students with Turkish names (İ/ı/ş/ğ on purpose, they
+exercise the search normalisation), years of attendance and kasa rows.
+The same seed always produces the same database.
+"""
+import argparse
+import random
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+import database
+
+FIRST_NAMES = [
+    "İsmail", "Işıl", "Şule", "Ağca", "Gülşen", "Çağla", "Ömer", "Ülkü", "Doğan", "Ilgın",
+    "Şeyma", "Ayşegül", "Buğra", "Kıvanç", "Eylül", "Yiğit", "Özge", "İrem", "Nilüfer", "Tuğçe",
+    "Merve", "Hicran", "Kübra", "Efe", "Hakan", "Sıla", "Ebru", "Çiğdem", "Görkem", "Ilkay",
+]
+LAST_NAMES = [
+    "Yılmaz", "Şahin", "Doğru", "Çelik", "Aydın", "Öztürk", "Kılıç", "Arslan", "Güneş", "Işık",
+    "Bıçer", "Poyraz", "Dertsiz", "Ağaoğlu", "Karataş", "Özdemir", "İnce", "Uğurlu", "Erdoğan", "Sağlam",
+]
+CLASS_NAMES = [
+    "Bachata", "Salsa", "Tango", "HipHop", "Zumba", "Oryantal", "Halk Dansları", "Modern Dans",
+    "Bale", "Kizomba", "Vals", "Jazz", "Çocuk Bale", "Pilates", "Swing", "Reggaeton",
+]
+DAYS = ["Pzt", "Salı", "Çarşamba", "Perşembe", "Cuma", "Cmrtsi", "Pazar"]
+HOURS = ["10.00", "12.00", "13.00", "18.00", "19.00", "20.00", "21.00"]
+PAYMENT_TYPES = ["NAKIT", "KART", "EFT"]
+
+DEFAULTS = dict(classes=12, subclasses=3, students=600, years=2, hesap_rows=5000, seed=42)
+
+
+def _phone(rng):
+    digits = "5" + "".join(str(rng.randint(0, 9)) for _ in range(9))
+    return f"{digits[:3]} {digits[3:6]} {digits[6:8]} {digits[8:10]}"
+
+
+def _subclass_slots(rng, subclasses):
+    """Distinct (day, hour) strings; some sub-classes meet twice a week like the real data."""
+    slots = set()
+    while len(slots) < subclasses:
+        if rng.random() < 0.4:
+            d1, d2 = sorted(rng.sample(range(7), 2))
+            h1, h2 = rng.choice(HOURS), rng.choice(HOURS)
+            slots.add((f"{DAYS[d1]},{DAYS[d2]}", f"{h1},{h2}"))
+        else:
+            slots.add((rng.choice(DAYS), rng.choice(HOURS)))
+    return sorted(slots)
+
+
+def generate_db(path, classes=12, subclasses=3, students=600, years=2, hesap_rows=5000,
+                seed=42, today=None):
+    """
+    Create a new database at `path` (overwritten) and return a dict with the row counts.
+    """
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    rng = random.Random(seed)
+    today = today or date.today()
+
+    old_path = database.DB_PATH
+    database.DB_PATH = path
+    try:
+        database.init_db()
+    finally:
+        database.DB_PATH = old_path
+
+    conn = sqlite3.connect(str(path))
+    cur = conn.cursor()
+
+    class_rows = []   # (id, day indexes)
+    for name in CLASS_NAMES[:classes] + [f"Grup {i}" for i in range(max(0, classes - len(CLASS_NAMES)))]:
+        for day, hour in _subclass_slots(rng, subclasses):
+            cur.execute(
+                "INSERT INTO classes (name, day, hour, price, name_key) VALUES (?, ?, ?, ?, ?)",
+                (name, day, hour, float(rng.choice([1500, 2000, 2500])), database.normalize_class_key(name)),
+            )
+            class_id = cur.lastrowid
+            database._sync_class_sessions(cur, class_id, day, hour)
+            class_rows.append((class_id, [DAYS.index(d) for d in day.split(",")]))
+    database._refresh_class_occurrences(cur, today=today)
+
+    start_span = 365 * years
+    attendance = 0
+    people = []
+    for _ in range(students):
+        class_id, class_days = rng.choice(class_rows)
+        if people and rng.random() < 0.1:
+            name, number = rng.choice(people)   # same person enrolled in a second class
+        else:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            if rng.random() < 0.3:
+                name = name.upper()  # real data has many all-caps names (İ/I handling)
+            number = _phone(rng) if rng.random() < 0.9 else ""
+            people.append((name, number))
+        joined = today - timedelta(days=rng.randint(0, start_span))
+        end = today + timedelta(days=rng.randint(-20, 28))
+        cur.execute(
+            "INSERT INTO students (name, number, start_time, end_time, left_classes, info, class_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (name, number, (end - timedelta(days=28)).isoformat(),
+             end.isoformat(), 0, "" if rng.random() < 0.8 else "indirimli", class_id),
+        )
+        student_id = cur.lastrowid
+        # opening credits as the app books them for a new student (one 4 week period)
+        database._post_credit(cur, student_id, "purchase", 4 * len(class_days),
+                              (end - timedelta(days=28)).isoformat(), source="new")
+
+        rows = []
+        d = joined
+        while d <= today:
+            if d.weekday() in class_days and rng.random() < 0.8:
+                rows.append((student_id, d.isoformat()))
+            d += timedelta(days=1)
+        cur.executemany("INSERT INTO attendance (student_id, date) VALUES (?, ?)", rows)
+        attendance += len(rows)
+
+    cur.executemany(
+        "INSERT INTO hesap_records (isim, miktar, odeme_sekli, ders, notlar) VALUES (?, ?, ?, ?, ?)",
+        [(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}".upper(),
+          float(rng.choice([1500, 2000, 2500, 3000])), rng.choice(PAYMENT_TYPES),
+          rng.choice(CLASS_NAMES[:classes]).upper(), "")
+         for _ in range(hesap_rows)],
+    )
+    cur.execute("INSERT OR REPLACE INTO kasa_table (id, eski_kasa) VALUES (1, 0)")
+
+    persons_merged = database._merge_students_into_persons(cur)
+
+    # a freshly backed-up database has an empty change log
+    cur.execute("DELETE FROM change_log")
+    conn.commit()
+    conn.close()
+    return {"classes": len(class_rows), "students": students, "attendance": attendance,
+            "hesap_records": hesap_rows, "persons": students - persons_merged}
+
+
+def add_arguments(parser):
+    parser.add_argument("--classes", type=int, default=DEFAULTS["classes"])
+    parser.add_argument("--subclasses", type=int, default=DEFAULTS["subclasses"])
+    parser.add_argument("--students", type=int, default=DEFAULTS["students"])
+    parser.add_argument("--years", type=int, default=DEFAULTS["years"])
+    parser.add_argument("--hesap-rows", type=int, default=DEFAULTS["hesap_rows"])
+    parser.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+
+
+def size_kwargs(args):
+    return dict(classes=args.classes, subclasses=args.subclasses, students=args.students,
+                years=args.years, hesap_rows=args.hesap_rows, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentetik dans okulu veritabanı üret")
+    parser.add_argument("output")
+    add_arguments(parser)
+    args = parser.parse_args()
+    counts = generate_db(args.output, **size_kwargs(args))
+    print(f"[INFO] {args.output}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
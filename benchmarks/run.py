@@ -0,0 +1,270 @@
+# benchmarks/run.py
+"""
+Timed scenarios on a generated database. Every repeat works on a fresh copy
+of the database so scenarios that write (credit sweep, import) stay comparable.
+Scenarios whose dependencies are missing (PyQt5, pandas/xlsxwriter/openpyxl)
+are recorded as skipped instead of failing the whole run.
+
+    python -m benchmarks.run --students 2000 --repeat 5 --only search
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import database
+from benchmarks.generate import generate_db, add_arguments, size_kwargs
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SEARCH_TERMS = ["şeyma", "ISIK", "ığ", "yilmaz", "532", "Çağla Öz"]
+
+
+class Skip(Exception):
+    pass
+
+
+def _require(*modules):
+    missing = [m for m in modules if importlib.util.find_spec(m) is None]
+    if missing:
+        raise Skip("missing: " + ", ".join(missing))
+
+
+_qt_app = None
+
+def _qt():
+    """One offscreen QApplication for all Qt scenarios."""
+    global _qt_app
+    _require("PyQt5")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    _qt_app = QApplication.instance() or QApplication([])
+    return _qt_app
+
+
+# === scenarios: setup(db_path, work_dir) -> callable timed by the runner ===
+
+def scenario_init_db_fresh(db_path, work_dir):
+    fresh = work_dir / "fresh.db"
+
+    def run():
+        database.DB_PATH = fresh
+        database.init_db()
+    return run
+
+
+def scenario_init_db_current(db_path, work_dir):
+    return database.init_db
+
+
+def scenario_credit_sweep(db_path, work_dir):
+    """Charge the last 30 days of lessons (as after a month without opening the app)."""
+    conn = database.get_connection()
+    database._set_state(conn.cursor(), "credits_swept_until",
+                        (date.today() - timedelta(days=30)).isoformat())
+    conn.commit()
+    conn.close()
+    return database.sweep_credit_consumption
+
+
+def scenario_search(db_path, work_dir):
+    def run():
+        for term in SEARCH_TERMS:
+            database.search_persons(term)
+    return run
+
+
+def _largest_class_id():
+    conn = database.get_connection()
+    row = conn.execute(
+        "SELECT class_id FROM students GROUP BY class_id ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()
+    conn.close()
+    return row[0]
+
+
+def scenario_eskiler_bulk_move(db_path, work_dir):
+    """Multi-select delete of the largest class into ESKİLER, plus its undo (keeps runs repeatable)."""
+    class_id = _largest_class_id()
+    conn = database.get_connection()
+    ids = [r[0] for r in conn.execute("SELECT id FROM students WHERE class_id=?", (class_id,))]
+    conn.close()
+    snapshot = database.get_students_by_ids(ids)
+
+    def run():
+        database.move_students_to_eskiler(ids, class_id)
+        database.restore_students(snapshot)
+    return run
+
+
+def scenario_archive_inactive(db_path, work_dir):
+    """Archive every overdue student (policy window 0 days), then bring them all back."""
+    def run():
+        database.archive_inactive_students(overdue_days=0, eskiler_days=0)
+        conn = database.get_connection()
+        ids = [r[0] for r in conn.execute("SELECT id FROM students_archive")]
+        conn.close()
+        database.unarchive_students(ids)
+    return run
+
+
+def scenario_refresh_student_table(db_path, work_dir):
+    _qt()
+    from PyQt5.QtWidgets import QMainWindow, QTableWidget
+    from student_management import StudentManager
+
+    window = QMainWindow()
+    manager = StudentManager(window)
+    table = QTableWidget()
+    class_id = _largest_class_id()
+
+    def run():
+        manager.refresh_student_table(class_id, table)
+        _qt_app.processEvents()
+    run.keep_alive = (window, manager, table)
+    return run
+
+
+def scenario_export_all_classes(db_path, work_dir):
+    _require("pandas", "xlsxwriter")
+    from excel_export import export_all_classes
+    return lambda: export_all_classes(work_dir)
+
+
+def scenario_export_per_class(db_path, work_dir):
+    _require("pandas", "xlsxwriter")
+    from excel_export import export_per_class
+    return lambda: export_per_class(work_dir)
+
+
+def scenario_excel_import(db_path, work_dir):
+    _require("pandas", "xlsxwriter", "openpyxl")
+    from excel_export import export_per_class
+    from excel_import import list_sheet_names, import_students_from_sheets
+
+    source_dir = work_dir / "source"
+    source_dir.mkdir()
+    source = export_per_class(source_dir)
+    workbook = max(source["files"], key=lambda p: p.stat().st_size)
+    sheets = list_sheet_names(workbook)
+    class_id = _largest_class_id()
+    return lambda: import_students_from_sheets(workbook, sheets, class_id)
+
+
+SCENARIOS = {
+    "init_db_fresh": scenario_init_db_fresh,
+    "init_db_current": scenario_init_db_current,
+    "credit_sweep": scenario_credit_sweep,
+    "search": scenario_search,
+    "eskiler_bulk_move": scenario_eskiler_bulk_move,
+    "archive_inactive": scenario_archive_inactive,
+    "refresh_student_table": scenario_refresh_student_table,
+    "export_all_classes": scenario_export_all_classes,
+    "export_per_class": scenario_export_per_class,
+    "excel_import": scenario_excel_import,
+}
+
+
+def run_scenario(setup, base_db, repeat):
+    timings = []
+    for _ in range(repeat):
+        work_dir = Path(tempfile.mkdtemp(prefix="dance_bench_"))
+        db_path = work_dir / "dance_school.db"
+        shutil.copy(base_db, db_path)
+        database.DB_PATH = db_path
+        try:
+            fn = setup(db_path, work_dir)
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "repeat": repeat,
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_all(sizes, repeat=3, only=None, base_db=None):
+    tmp = Path(tempfile.mkdtemp(prefix="dance_bench_base_"))
+    try:
+        if base_db is None:
+            base_db = tmp / "base.db"
+            counts = generate_db(base_db, **sizes)
+        else:
+            counts = None
+
+        original_path = database.DB_PATH
+        results = {}
+        try:
+            for name, setup in SCENARIOS.items():
+                if only and not any(o in name for o in only):
+                    continue
+                try:
+                    results[name] = run_scenario(setup, base_db, repeat)
+                    print(f"[INFO] {name:<24} median {results[name]['median_ms']:9.1f} ms")
+                except Skip as e:
+                    results[name] = {"skipped": str(e)}
+                    print(f"[INFO] {name:<24} skipped ({e})")
+                except Exception as e:
+                    # one broken scenario must not cost the results of the others
+                    results[name] = {"error": f"{type(e).__name__}: {e}"}
+                    print(f"[WARNING] {name:<24} failed: {type(e).__name__}: {e}")
+        finally:
+            database.DB_PATH = original_path
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "row_counts": counts,
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark senaryolarını çalıştır")
+    add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="sadece adı bu parçaları içeren senaryolar")
+    parser.add_argument("--db", help="üretmek yerine bu veritabanını kullan")
+    parser.add_argument("--output", help="JSON sonuç dosyası (varsayılan: benchmarks/results/)")
+    args = parser.parse_args()
+
+    report = run_all(size_kwargs(args), repeat=args.repeat, only=args.only,
+                     base_db=Path(args.db) if args.db else None)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{report['git'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[INFO] Sonuçlar: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
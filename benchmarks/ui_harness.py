@@ -0,0 +1,235 @@
+# benchmarks/ui_harness.py
+"""
+Headless UI performance harness: runs the real MainWindow on the offscreen
+Qt platform against a generated database and replays a scripted session
+(class tab switches, sub-tab switches, a cell edit, attendance marks,
+global searches, goto_student). For every action it records wall time,
+the number of live widgets and the peak RSS of the process.
+
+    python -m benchmarks.ui_harness --students 2000 --years 3
+    python -m benchmarks.ui_harness --db kopya.db --tabs 5
+
+Modal dialogs (message boxes, the search results popup) are dismissed
+immediately so the script never blocks; their construction is still timed.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication, QDialog, QMessageBox, QTableWidget, QTabWidget
+
+import database
+from benchmarks.generate import generate_db, add_arguments, size_kwargs
+from benchmarks.run import RESULTS_DIR, _git_revision
+
+SEARCH_TERMS = ["şeyma", "IŞIK", "yilmaz", "532"]
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss   # bytes on macOS, KiB on Linux
+
+
+@contextmanager
+def auto_dismiss_dialogs():
+    """Make modal dialogs return at once instead of waiting for a click."""
+    saved = {
+        "exec_": QDialog.exec_,
+        "information": QMessageBox.information,
+        "warning": QMessageBox.warning,
+        "critical": QMessageBox.critical,
+        "question": QMessageBox.question,
+    }
+    QDialog.exec_ = lambda self, *a: QDialog.Rejected
+    QMessageBox.information = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.warning = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.critical = staticmethod(lambda *a, **k: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.Yes)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(QDialog if name == "exec_" else QMessageBox, name, value)
+
+
+class Harness:
+    def __init__(self, app):
+        self.app = app
+        self.window = None
+        self.actions = []
+
+    def measure(self, name, fn, *args):
+        self.app.processEvents()
+        started = time.perf_counter()
+        result = fn(*args)
+        self.app.processEvents()   # include deleteLater() and pending layout work
+        ms = (time.perf_counter() - started) * 1000
+        entry = {
+            "action": name,
+            "ms": round(ms, 2),
+            "widgets": len(self.app.allWidgets()),
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        self.actions.append(entry)
+        print(f"[INFO] {name:<40} {ms:9.1f} ms  widgets={entry['widgets']:<6} rss={entry['peak_rss_kb']}")
+        return result
+
+    # --- helpers to reach the current sub-class table ---
+
+    def _day_hour_tabs(self):
+        class_widget = self.window.class_tabs.currentWidget()
+        if class_widget is None or class_widget.layout() is None:
+            return None
+        for i in range(class_widget.layout().count()):
+            w = class_widget.layout().itemAt(i).widget()
+            if isinstance(w, QTabWidget):
+                return w
+        return None
+
+    def current_table(self):
+        """(class_id, QTableWidget) of the selected sub-class tab, or (None, None)."""
+        tabs = self._day_hour_tabs()
+        if tabs is None or tabs.currentWidget() is None:
+            return None, None
+        data = tabs.tabBar().tabData(tabs.currentIndex())
+        table = tabs.currentWidget().findChild(QTableWidget)
+        if not data or table is None:
+            return None, table
+        class_name = self.window.class_tabs.tabText(self.window.class_tabs.currentIndex())
+        return database.get_class_id(class_name, data[0], data[1]), table
+
+    def _first_student(self, table):
+        for row in range(table.rowCount()):
+            item = table.item(row, 8)
+            if item and item.text().isdigit():
+                return row, int(item.text())
+        return None, None
+
+    # --- the scripted session ---
+
+    def start(self):
+        from ui.main_window import MainWindow
+
+        def build():
+            self.window = MainWindow()
+            self.window.show()
+            database.init_db()
+            database.sweep_credit_consumption()
+            self.window.on_data_ready()
+        self.measure("startup (window + data)", build)
+
+    def switch_class_tabs(self, limit):
+        tabs = self.window.class_tabs
+        for i in range(min(limit, tabs.count())):
+            self.measure(f"class tab -> {tabs.tabText(i)}", tabs.setCurrentIndex, i)
+
+    def switch_sub_tabs(self):
+        sub = self._day_hour_tabs()
+        if sub is None:
+            return
+        for i in range(sub.count()):
+            self.measure(f"sub tab -> {sub.tabText(i)}", sub.setCurrentIndex, i)
+
+    def edit_note(self):
+        sub = self._day_hour_tabs()
+        if sub is not None:
+            sub.setCurrentIndex(0)
+        _, table = self.current_table()
+        if table is None:
+            return
+        row, _ = self._first_student(table)
+        if row is not None:
+            self.measure("edit note cell", lambda: table.item(row, 5).setText("harness notu"))
+
+    def mark_attendance(self, times):
+        for n in range(times):
+            class_id, table = self.current_table()
+            if class_id is None:
+                return
+            _, student_id = self._first_student(table)
+            if student_id is None:
+                return
+            self.measure(f"mark attendance #{n + 1}",
+                         self.window.student_manager.mark_attendance, student_id, class_id, table)
+
+    def searches(self):
+        for term in SEARCH_TERMS:
+            self.window.search_bar.setText(term)
+            self.measure(f"global search '{term}'", self.window.search_globally)
+            rows = database.search_persons(term)
+            if rows:
+                sid, cname, day, hour, _archived = rows[-1][3][-1]
+                self.measure(f"goto_student {sid}", self.window.goto_student, sid, cname, day, hour)
+
+
+def run_session(db_path, tabs=5, attendance=3):
+    app = QApplication.instance() or QApplication(sys.argv)
+    database.DB_PATH = Path(db_path)
+    harness = Harness(app)
+    with auto_dismiss_dialogs():
+        harness.start()
+        harness.switch_class_tabs(tabs)
+        harness.switch_sub_tabs()
+        harness.edit_note()
+        harness.mark_attendance(attendance)
+        harness.searches()
+    harness.window.close()
+    return harness.actions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arayüz performansını ekransız ölç")
+    add_arguments(parser)
+    parser.add_argument("--db", help="üretmek yerine bu veritabanının kopyasını kullan")
+    parser.add_argument("--tabs", type=int, default=5, help="gezilecek sınıf sekmesi sayısı")
+    parser.add_argument("--attendance", type=int, default=3, help="alınacak yoklama sayısı")
+    parser.add_argument("--output", help="JSON sonuç dosyası (varsayılan: benchmarks/results/)")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="dance_ui_"))
+    try:
+        db_path = work_dir / "dance_school.db"
+        if args.db:
+            shutil.copy(args.db, db_path)
+            counts = None
+        else:
+            counts = generate_db(db_path, **size_kwargs(args))
+        actions = run_session(db_path, tabs=args.tabs, attendance=args.attendance)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git": _git_revision(),
+        "qt_platform": os.environ.get("QT_QPA_PLATFORM"),
+        "sizes": None if args.db else size_kwargs(args),
+        "row_counts": counts,
+        "total_ms": round(sum(a["ms"] for a in actions), 2),
+        "actions": actions,
+    }
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"ui_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{report['git'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[INFO] Sonuçlar: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
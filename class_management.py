@@ -11,6 +11,9 @@ from database import (
 )
 from PyQt5.QtWidgets import QHeaderView
 from attendance_calendar import AttendanceCalendar
+from profiling import profiled
+from sql_trace import sql_action
+from command_log import undoable
 from PyQt5.QtWidgets import QAbstractItemView
 import sqlite3
 
@@ -50,6 +53,9 @@ class ClassManager:
         """)
         self.class_tabs.tabBar().setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Fixed)
 
+        # class_id -> student table currently on screen (for undo/redo refreshes)
+        self.student_tables = {}
+
         
 
     def load_classes(self):
@@ -70,6 +76,8 @@ class ClassManager:
     def _fmt_time_for_db(self, qtime: QTime) -> str:
         return qtime.toString("HH.mm")
 
+    @sql_action("ui.add_class_dialog")
+    @undoable("Sınıf ekleme")
     def add_class_dialog(self):
         from PyQt5.QtWidgets import (
             QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QLabel,
@@ -158,6 +166,8 @@ class ClassManager:
 
 
 
+    @profiled("ui.load_class_times")
+    @sql_action("ui.load_class_times")
     def load_class_times(self):
         from PyQt5.QtWidgets import (
             QWidget, QVBoxLayout, QTabWidget, QTableWidget, QPushButton, QHBoxLayout
@@ -199,6 +209,7 @@ class ClassManager:
                     layout.takeAt(i)      # detach from layout
                     w.deleteLater()       # schedule for deletion
 
+        self.student_tables = {}
         if not times:
             return
 
@@ -236,6 +247,7 @@ class ClassManager:
 
             class_id = get_class_id(class_name, day_str, hour_str)
             self.main_window.student_manager.refresh_student_table(class_id, table)
+            self.student_tables[class_id] = table
             sub_layout.addWidget(table)
 
             row = QHBoxLayout()
@@ -271,6 +283,7 @@ class ClassManager:
         # fill table using the same API as a normal subclass
         # (reuse your existing StudentManager method)
         self.main_window.student_manager.refresh_student_table(esk_class_id, esk_table)
+        self.student_tables[esk_class_id] = esk_table
 
         # same bottom buttons as other subclasses
         btn_row = QHBoxLayout()
@@ -474,9 +487,10 @@ class ClassManager:
             from database import update_class_instance
 
             try:
-                updated = update_class_instance(
-                    class_name, combined_day, combined_hour, new_day, new_hour
-                )
+                with sql_action("ui.edit_class_instance"), undoable("Sınıf düzenleme"):
+                    updated = update_class_instance(
+                        class_name, combined_day, combined_hour, new_day, new_hour
+                    )
                 if updated:
                     # Refresh UI as you already do elsewhere
                     self.main_window.class_manager.load_class_times()
@@ -525,6 +539,8 @@ class ClassManager:
 
 
 
+    @sql_action("ui.delete_specific_class_instance")
+    @undoable("Sınıf silme")
     def delete_specific_class_instance(self, name, day, hour):
         reply = QMessageBox.question(
             self.main_window,
@@ -561,9 +577,21 @@ class ClassManager:
 
         self.delete_specific_class_instance(class_name, day, hour)
 
+    def refresh_class_tables(self, class_ids):
+        """Re-read the students of the given classes into their tables, if they are on screen."""
+        for class_id in class_ids:
+            table = self.student_tables.get(class_id)
+            if table is None:
+                continue
+            try:
+                self.main_window.student_manager.refresh_student_table(class_id, table)
+            except RuntimeError:
+                # the tab was rebuilt meanwhile and Qt already deleted the widget
+                self.student_tables.pop(class_id, None)
+
     def refresh_left_courses(self):
-        from database import update_left_classes_for_all_students
-        update_left_classes_for_all_students()
+        from database import sweep_credit_consumption
+        sweep_credit_consumption()
         self.load_class_times()
 
     
\ No newline at end of file
@@ -0,0 +1,186 @@
+# cli.py
+"""
+Headless entry point for the nightly jobs; imports neither Qt nor Tk.
+
+    python -m cli export-all [--dir KLASÖR] [--force]
+    python -m cli export-per-class [--dir KLASÖR]
+    python -m cli backup [--incremental] [--compression gzip|zstd]
+    python -m cli recompute [--no-archive]
+    python -m cli remind [--days N] [--transport fake] [--no-send]
+    python -m cli branches [--days N]
+
+--branch NAME runs a command against another branch from branches.json
+(without changing the GUI's active branch), --db PATH against any file; a
+file that is not a branch reports "branch": null and keeps its backups and
+exports in <name>_dosyalar next to it, away from the branches' retention.
+
+Every command brings the schema up to date first, prints exactly one JSON
+summary line on stdout (the usual [INFO] lines go to stderr) and exits with
+one of the EXIT_* codes below, e.g. from cron:
+
+    30 22 * * *  cd /path/to/app && python -m cli export-all >> cli.log
+
+It is safe to run while the GUI is open: the DB is in WAL mode with a busy
+timeout (database.get_connection / init_db) and each job holds an app_state
+lease, so two overlapping runs of the same job do not both do the work.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+import traceback
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import database
+from database import init_db, acquire_job_lock, release_job_lock
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2      # argparse
+EXIT_PARTIAL = 3    # finished, but some items failed (e.g. undelivered reminders)
+EXIT_RUNNING = 4    # the same job is still running elsewhere
+EXIT_BUSY = 75      # EX_TEMPFAIL: database stayed locked, retry later
+
+
+def cmd_export_all(args):
+    """The nightly export; skipped if it already ran today (cron or the GUI's 22:30 timer) unless --force."""
+    from database import job_done_today, mark_job_done
+    from excel_export import export_all_classes
+    if not args.force and job_done_today("export-all"):
+        return {"skipped": "bugün zaten alındı"}, EXIT_OK
+    if args.dir:
+        args.dir.mkdir(parents=True, exist_ok=True)
+    result = export_all_classes(args.dir)
+    mark_job_done("export-all")
+    return result, EXIT_OK
+
+
+def cmd_export_per_class(args):
+    from excel_export import export_per_class
+    if args.dir:
+        args.dir.mkdir(parents=True, exist_ok=True)
+    return export_per_class(args.dir), EXIT_OK
+
+
+def cmd_backup(args):
+    from backup import run_backup, run_incremental_backup
+    if args.incremental:
+        kind, path = run_incremental_backup(compression=args.compression)
+        return {"kind": kind, "file": path}, EXIT_OK
+    path, removed = run_backup(compression=args.compression)
+    return {"kind": "full", "file": path, "removed": len(removed)}, EXIT_OK
+
+
+def cmd_recompute(args):
+    """What the GUI does at startup: archive policy, then the lesson credit sweep."""
+    from database import archive_inactive_students, sweep_credit_consumption
+    archived = 0 if args.no_archive else archive_inactive_students()
+    consumed = sweep_credit_consumption()
+    return {"archived": archived, "consumed": consumed}, EXIT_OK
+
+
+def cmd_remind(args):
+    from send_whatsapp import enqueue_payment_reminders
+    queued, duplicates, no_number = enqueue_payment_reminders(args.days)
+    summary = {"queued": queued, "already_queued": duplicates, "no_number": no_number}
+    if args.no_send:
+        return summary, EXIT_OK
+
+    from outbox import OutboxDispatcher
+    from whatsapp_sender import get_transport
+    sent = OutboxDispatcher(get_transport(args.transport)).run(limit=args.limit)
+    summary.update(sent)
+    return summary, EXIT_PARTIAL if sent["failed"] else EXIT_OK
+
+
+def cmd_branches(args):
+    """Cross-branch figures from one query over the ATTACHed branch databases."""
+    from database import get_branch_overview
+    keys = ("branch", "students", "persons", "due", "attendance_today")
+    return {"days": args.days,
+            "branches": [dict(zip(keys, row)) for row in get_branch_overview(args.days)]}, EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Dans okulu zamanlanmış işler")
+    parser.add_argument("--branch", help="branches.json'daki bu şubenin veritabanını kullan")
+    parser.add_argument("--db", type=Path, help="dance_school.db yerine bu veritabanını kullan")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, handler, text in (("export-all", cmd_export_all, "tüm sınıflar tek Excel dosyasına"),
+                                ("export-per-class", cmd_export_per_class, "her sınıf ayrı Excel dosyasına")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--dir", type=Path, help="hedef klasör (varsayılan: <masaüstü>/111/Dersler)")
+        p.set_defaults(handler=handler)
+        if name == "export-all":
+            p.add_argument("--force", action="store_true", help="bugün zaten alındıysa da yeniden al")
+
+    p = sub.add_parser("backup", help="doğrulanmış, sıkıştırılmış yedek")
+    p.add_argument("--incremental", action="store_true",
+                   help="günde bir tam yedek, arada sadece değişiklik (delta) dosyaları")
+    p.add_argument("--compression", choices=("gzip", "zstd"), default="gzip")
+    p.set_defaults(handler=cmd_backup)
+
+    p = sub.add_parser("recompute", help="arşiv politikası + kalan ders (kredi) güncellemesi")
+    p.add_argument("--no-archive", action="store_true", help="pasif öğrencileri arşive taşıma")
+    p.set_defaults(handler=cmd_recompute)
+
+    p = sub.add_parser("remind", help="ödeme hatırlatmalarını kuyruğa ekle ve gönder")
+    p.add_argument("--days", type=int, default=0,
+                   help="bugünden itibaren kaç gün içinde ödemesi gelenler (varsayılan: sadece bugün)")
+    p.add_argument("--transport", help="pywhatkit | fake (varsayılan: $WHATSAPP_TRANSPORT)")
+    p.add_argument("--limit", type=int, help="bu çalıştırmada en fazla kaç mesaj gönderilsin")
+    p.add_argument("--no-send", action="store_true", help="sadece kuyruğa ekle, gönderme")
+    p.set_defaults(handler=cmd_remind)
+
+    p = sub.add_parser("branches", help="tüm şubelerin özeti (öğrenci, kişi, ödemesi gelen, bugünkü yoklama)")
+    p.add_argument("--days", type=int, default=3, help="kaç gün içinde ödemesi gelenler sayılsın")
+    p.set_defaults(handler=cmd_branches)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.branch:
+        if args.branch not in database.get_branch_names():
+            parser.error(f"bilinmeyen şube: {args.branch} ({', '.join(database.get_branch_names())})")
+        with redirect_stdout(sys.stderr):
+            database.set_active_branch(args.branch, persist=False)
+    if args.db:
+        database.use_database_file(args.db)
+
+    started = time.perf_counter()
+    result = {"command": args.command, "branch": database.get_active_branch(), "db": str(database.get_db_path())}
+    with redirect_stdout(sys.stderr):   # keep stdout for the JSON line
+        try:
+            init_db()
+            if not acquire_job_lock(args.command):
+                code = EXIT_RUNNING
+                result["error"] = "bu iş zaten çalışıyor"
+            else:
+                try:
+                    summary, code = args.handler(args)
+                    result.update(summary)
+                finally:
+                    release_job_lock(args.command)
+        except sqlite3.OperationalError as e:
+            busy = "locked" in str(e).lower() or "busy" in str(e).lower()
+            code = EXIT_BUSY if busy else EXIT_ERROR
+            result["error"] = str(e)
+            traceback.print_exc()
+        except Exception as e:
+            code = EXIT_ERROR
+            result["error"] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+
+    result["exit_code"] = code
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(result, ensure_ascii=False, default=str))
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
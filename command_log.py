@@ -0,0 +1,314 @@
+# command_log.py
+"""
+Persisted undo/redo for user actions.
+
+A UI action runs inside `with undoable("Öğrenci düzenleme"):` (or carries it
+as a decorator). Its row changes are already recorded by the change_log
+triggers (database._ensure_change_log); connections opened by that thread
+while the action is open also copy them into command_pending under the
+action's id (database._capture_undo_rows). When the outermost block ends,
+those rows, and only those, are folded into one net change per row and
+stored in command_changes:
+
+    'I' -> the new row, 'D' -> the old row, 'U' -> only the changed columns
+
+undo() / redo() replay those diffs against the DB in one transaction and
+report which views need a refresh. A command is only replayed while its
+rows still look the way it left them; otherwise it is dropped as stale.
+students.left_classes is the credit balance and is also moved by the
+startup sweep, so it is replayed as a delta instead of a value.
+
+The log is compacted after every command: at most MAX_COMMANDS commands and
+MAX_CHANGES stored row diffs are kept (the newest command always survives).
+"""
+import json
+import threading
+import uuid
+from contextlib import ContextDecorator
+
+import database
+from database import get_connection, _refresh_class_occurrences
+
+MAX_COMMANDS = 200
+MAX_CHANGES = 20000
+COALESCE_SECONDS = 60
+DELTA_COLUMNS = {("students", "left_classes")}
+CLASS_TABLES = {"classes", "class_sessions", "class_order", "closures"}
+HESAP_TABLES = {"hesap_records", "kasa_table"}
+
+_local = threading.local()
+listeners = []   # called without arguments after a command is recorded, undone or redone
+
+
+def _notify():
+    for callback in listeners:
+        callback()
+
+
+class StaleCommand(Exception):
+    """The rows were changed after the command; it was removed from the log."""
+
+
+class undoable(ContextDecorator):
+    """
+    Record the DB changes of the enclosed action as one undoable command.
+    Nested blocks belong to the outermost one. coalesce=True folds repeated
+    actions with the same label (typing into the Hesap table) into the
+    previous command if that one is younger than COALESCE_SECONDS.
+    """
+
+    def __init__(self, label, coalesce=False):
+        self.label = label
+        self.coalesce = coalesce
+
+    def __enter__(self):
+        depth = getattr(_local, "depth", 0)
+        if depth == 0:
+            database._undo_context.action = uuid.uuid4().hex
+        _local.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.depth -= 1
+        if _local.depth == 0:
+            action = database._undo_context.action
+            database._undo_context.action = None
+            # a failed action may still have written rows; keep them undoable
+            if record(self.label, action, coalesce=self.coalesce) is not None:
+                _notify()
+        return False
+
+
+def _fold(changes):
+    """
+    [(tbl, op, row_id, old, new), ...] in execution order -> one net change
+    per row, in first-touch order. old/new may be full rows or partial dicts.
+    """
+    net = {}
+    for tbl, op, row_id, old, new in changes:
+        if op == "U" and old is None:
+            op = "I"   # the UPDATE moved the rowid: the new rowid is an insert
+        key = (tbl, row_id)
+        prev = net.get(key)
+        if prev is None:
+            net[key] = [op, old, new]
+            continue
+        p_op, p_old, p_new = prev
+        if p_op == "I":
+            net[key] = None if op == "D" else ["I", None, {**p_new, **new}]
+        elif p_op == "U":
+            if op == "D":
+                net[key] = ["D", {**old, **p_old}, None]
+            else:
+                net[key] = ["U", {**(old or {}), **p_old}, {**p_new, **new}]
+        elif op != "D":   # deleted, then put back
+            net[key] = ["U", p_old, new]
+
+    folded = []
+    for (tbl, row_id), change in net.items():
+        if change is None:
+            continue
+        op, old, new = change
+        if op == "U":
+            cols = [c for c in new if c in old and old[c] != new[c]]
+            if not cols:
+                continue
+            old, new = {c: old[c] for c in cols}, {c: new[c] for c in cols}
+        folded.append((tbl, op, row_id, old, new))
+    return folded
+
+
+def record(label, action, coalesce=False):
+    """Store the command_pending rows of `action` as command `label`. Returns its id (None if nothing changed)."""
+    conn = get_connection()
+    cur = conn.cursor()
+    raw = cur.execute("""
+        SELECT tbl, op, row_id, old_json, row_json FROM command_pending
+        WHERE action = ? ORDER BY seq
+    """, (action,)).fetchall()
+    # also drop what a crashed session left behind
+    cur.execute("""
+        DELETE FROM command_pending
+        WHERE action = ? OR created_at < datetime('now', 'localtime', '-1 day')
+    """, (action,))
+    if not raw:
+        conn.commit()
+        conn.close()
+        return None
+    changes = [(tbl, op, row_id, json.loads(old) if old else None, json.loads(new) if new else None)
+               for tbl, op, row_id, old, new in raw]
+
+    # a new action makes the undone commands unreachable
+    cur.execute("DELETE FROM command_changes WHERE command_id IN (SELECT id FROM command_log WHERE undone=1)")
+    cur.execute("DELETE FROM command_log WHERE undone=1")
+
+    command_id = None
+    if coalesce:
+        last = cur.execute("""
+            SELECT id FROM command_log
+            WHERE id = (SELECT MAX(id) FROM command_log) AND label = ?
+              AND (julianday('now', 'localtime') - julianday(created_at)) * 86400 < ?
+        """, (label, COALESCE_SECONDS)).fetchone()
+        if last:
+            command_id = last[0]
+            changes = _load_changes(cur, command_id) + changes
+            cur.execute("DELETE FROM command_changes WHERE command_id=?", (command_id,))
+            cur.execute("UPDATE command_log SET created_at=datetime('now', 'localtime') WHERE id=?",
+                        (command_id,))
+
+    folded = _fold(changes)
+    if command_id is None and folded:
+        cur.execute("INSERT INTO command_log (label) VALUES (?)", (label,))
+        command_id = cur.lastrowid
+    elif command_id is not None and not folded:
+        cur.execute("DELETE FROM command_log WHERE id=?", (command_id,))
+        command_id = None
+    if command_id is not None:
+        cur.executemany("""
+            INSERT INTO command_changes (command_id, pos, tbl, op, row_id, old_json, new_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(command_id, pos, tbl, op, row_id,
+               json.dumps(old, ensure_ascii=False) if old is not None else None,
+               json.dumps(new, ensure_ascii=False) if new is not None else None)
+              for pos, (tbl, op, row_id, old, new) in enumerate(folded)])
+    _compact(cur)
+    conn.commit()
+    conn.close()
+    return command_id
+
+
+def _load_changes(cur, command_id):
+    rows = cur.execute("""
+        SELECT tbl, op, row_id, old_json, new_json FROM command_changes
+        WHERE command_id=? ORDER BY pos
+    """, (command_id,)).fetchall()
+    return [(tbl, op, row_id, json.loads(old) if old else None, json.loads(new) if new else None)
+            for tbl, op, row_id, old, new in rows]
+
+
+def _compact(cur):
+    cur.execute("""
+        DELETE FROM command_log
+        WHERE id NOT IN (SELECT id FROM command_log ORDER BY id DESC LIMIT ?)
+    """, (MAX_COMMANDS,))
+    cur.execute("""
+        DELETE FROM command_log WHERE id IN (
+            SELECT command_id FROM (
+                SELECT command_id, SUM(COUNT(*)) OVER (ORDER BY command_id DESC) AS running
+                FROM command_changes GROUP BY command_id
+            )
+            WHERE running > ? AND command_id < (SELECT MAX(id) FROM command_log)
+        )
+    """, (MAX_CHANGES,))
+    cur.execute("DELETE FROM command_changes WHERE command_id NOT IN (SELECT id FROM command_log)")
+
+
+def state():
+    """(label of the next undo or None, label of the next redo or None) for the buttons."""
+    conn = get_connection()
+    cur = conn.cursor()
+    undo_row = cur.execute("SELECT label FROM command_log WHERE undone=0 ORDER BY id DESC LIMIT 1").fetchone()
+    redo_row = cur.execute("SELECT label FROM command_log WHERE undone=1 ORDER BY id LIMIT 1").fetchone()
+    conn.close()
+    return (undo_row[0] if undo_row else None), (redo_row[0] if redo_row else None)
+
+
+def undo():
+    """Revert the newest command. Returns (label, affected) or None if there is nothing to undo."""
+    return _replay(redo=False)
+
+
+def redo():
+    """Re-apply the most recently undone command. Returns (label, affected) or None."""
+    return _replay(redo=True)
+
+
+def _current(cur, tbl, row_id):
+    c = cur.execute(f'SELECT * FROM "{tbl}" WHERE rowid=?', (row_id,))
+    row = c.fetchone()
+    return None if row is None else dict(zip([d[0] for d in c.description], row))
+
+
+def _apply(cur, tbl, row_id, op, before, after):
+    """Move one row from `before` to `after`; StaleCommand if it is not in `before` any more."""
+    current = _current(cur, tbl, row_id)
+    if op == "I":
+        if current is not None:
+            raise StaleCommand(tbl)
+        cols = list(after) if "id" in after else ["rowid", *after]
+        values = [after.get(c, row_id) for c in cols]
+        cur.execute(f'INSERT INTO "{tbl}" ({", ".join(cols)}) VALUES ({", ".join("?" for _ in cols)})', values)
+        return current
+    if current is None or any(current.get(c) != v for c, v in before.items() if (tbl, c) not in DELTA_COLUMNS):
+        raise StaleCommand(tbl)
+    if op == "D":
+        cur.execute(f'DELETE FROM "{tbl}" WHERE rowid=?', (row_id,))
+        return current
+    values = {}
+    for c, v in after.items():
+        if (tbl, c) in DELTA_COLUMNS and None not in (current.get(c), v, before.get(c)):
+            v = current[c] + v - before[c]
+        values[c] = v
+    cur.execute(f'UPDATE "{tbl}" SET {", ".join(f"{c}=?" for c in values)} WHERE rowid=?',
+                (*values.values(), row_id))
+    return current
+
+
+def _replay(redo):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    if redo:
+        row = cur.execute("SELECT id, label FROM command_log WHERE undone=1 ORDER BY id LIMIT 1").fetchone()
+    else:
+        row = cur.execute("SELECT id, label FROM command_log WHERE undone=0 ORDER BY id DESC LIMIT 1").fetchone()
+    if row is None:
+        conn.rollback()
+        conn.close()
+        return None
+    command_id, label = row
+    changes = _load_changes(cur, command_id)
+    if not redo:
+        inverse = {"I": "D", "D": "I", "U": "U"}
+        changes = [(tbl, inverse[op], row_id, new, old) for tbl, op, row_id, old, new in reversed(changes)]
+
+    affected = {"class_ids": set(), "classes": False, "hesap": False}
+    student_ids = set()
+    try:
+        for tbl, op, row_id, before, after in changes:
+            current = _apply(cur, tbl, row_id, op, before, after)
+            if tbl in CLASS_TABLES:
+                affected["classes"] = True
+            elif tbl in HESAP_TABLES:
+                affected["hesap"] = True
+            elif tbl == "students":
+                student_ids.add(row_id)
+                for image in (current, before, after):
+                    if image and image.get("class_id") is not None:
+                        affected["class_ids"].add(image["class_id"])
+            else:
+                for image in (current, before, after):
+                    if image and image.get("student_id") is not None:
+                        student_ids.add(image["student_id"])
+    except StaleCommand:
+        conn.rollback()
+        cur.execute("DELETE FROM command_changes WHERE command_id=?", (command_id,))
+        cur.execute("DELETE FROM command_log WHERE id=?", (command_id,))
+        conn.commit()
+        conn.close()
+        print(f"[WARNING] '{label}' geri alınamadı/yinelenemedi: kayıtlar sonradan değişmiş, komut silindi")
+        _notify()
+        raise StaleCommand(label)
+
+    if affected["classes"]:
+        _refresh_class_occurrences(cur)
+    if student_ids:
+        qmarks = ",".join("?" for _ in student_ids)
+        affected["class_ids"].update(r[0] for r in cur.execute(
+            f"SELECT DISTINCT class_id FROM students WHERE id IN ({qmarks})", list(student_ids)))
+    cur.execute("UPDATE command_log SET undone=? WHERE id=?", (1 if not redo else 0, command_id))
+    conn.commit()
+    conn.close()
+    print(f"[INFO] {'Yinelendi' if redo else 'Geri alındı'}: {label}")
+    _notify()
+    return label, affected
@@ -1,8 +1,51 @@
+import json
 import sqlite3
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 import os
+import re
 import unicodedata, difflib
+from typing import NamedTuple, Optional
+import sql_trace
+import lesson_calendar
+
+
+# === Row records ===
+# NamedTuples are slotted and still index like the old plain tuples, so
+# student[4] keeps working while callers move over to student.end_time.
+
+class Student(NamedTuple):
+    id: int
+    name: str
+    number: Optional[str]
+    start_time: Optional[str]   # YYYY-MM-DD
+    end_time: Optional[str]     # YYYY-MM-DD (ÖDEME TARİHİ)
+    left_classes: Optional[int]
+    info: Optional[str]
+    class_id: Optional[int]
+    person_id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 row_factory for queries selecting STUDENT_COLUMNS."""
+        return cls._make(row)
+
+
+class ClassInstance(NamedTuple):
+    id: int
+    name: str
+    day: str
+    hour: str
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """sqlite3 row_factory for queries selecting CLASS_COLUMNS."""
+        return cls._make(row)
+
+
+STUDENT_COLUMNS = "id, name, number, start_time, end_time, left_classes, info, class_id, person_id"
+CLASS_COLUMNS = "id, name, day, hour"
 
 
 
@@ -70,7 +113,7 @@ def _norm_tr(s: str) -> str:
 _DAY_ALIAS = {
     "pzt": 0, "pazartesi": 0, "pztesi": 0, "pzt.": 0,
     "salı": 1, "sali": 1,
-    "çarşamba": 2, "carsamba": 2, "çarsamba": 2,
+    "çarşamba": 2, "carsamba": 2, "çarsamba": 2, "crs": 2,
     "perşembe": 3, "persembe": 3, "perş": 3,
     "cuma": 4,
     "cmrtsi": 5, "cumartesi": 5, "cmt": 5, "cts": 5,
@@ -81,6 +124,65 @@ def _day_token_to_index(token: str):
     return _DAY_ALIAS.get(_norm_tr(token))
 
 
+# === Class sessions (one row per weekday/time of a class instance) ===
+# classes.day / classes.hour keep the comma-joined strings the UI shows
+# ("Pazartesi,Çarşamba" / "19.00,20.00"); class_sessions and the cached
+# classes.weekday_mask are derived from them on every write, so readers
+# never have to parse the strings again.
+
+def _parse_minute_of_day(token):
+    """'19.00' / '19:00' / '9' -> minutes after midnight, None if not a time."""
+    m = re.fullmatch(r"\s*(\d{1,2})(?:[.:](\d{2}))?\s*", str(token or ""))
+    if not m:
+        return None
+    h, mi = int(m.group(1)), int(m.group(2) or 0)
+    if h > 23 or mi > 59:
+        return None
+    return h * 60 + mi
+
+
+def parse_class_sessions(day, hour):
+    """
+    ('Salı,Pazar', '19.00,13.00') -> [(1, 1140), (6, 780)].
+    Days are paired with hours by position (a single hour applies to all days);
+    unknown day tokens such as 'ESKİLER' are dropped.
+    """
+    days = [d.strip() for d in str(day or "").split(",") if d.strip()]
+    hours = [h.strip() for h in str(hour or "").split(",") if h.strip()]
+    sessions = []
+    for i, token in enumerate(days):
+        weekday = _day_token_to_index(token)
+        if weekday is None:
+            continue
+        h = hours[i] if i < len(hours) else (hours[-1] if hours else None)
+        sessions.append((weekday, _parse_minute_of_day(h)))
+    return sessions
+
+
+def weekday_mask(weekdays):
+    """Bit n set for weekday n (0 = Monday)."""
+    mask = 0
+    for wd in weekdays:
+        mask |= 1 << wd
+    return mask
+
+
+def mask_to_weekdays(mask):
+    return [wd for wd in range(7) if (mask or 0) & (1 << wd)]
+
+
+def _sync_class_sessions(cur, class_id, day, hour):
+    """Rebuild class_sessions and weekday_mask of one class from its day/hour strings."""
+    sessions = parse_class_sessions(day, hour)
+    cur.execute("DELETE FROM class_sessions WHERE class_id=?", (class_id,))
+    cur.executemany(
+        "INSERT OR IGNORE INTO class_sessions (class_id, weekday, minute_of_day) VALUES (?, ?, ?)",
+        [(class_id, wd, minute) for wd, minute in sessions],
+    )
+    cur.execute("UPDATE classes SET weekday_mask=? WHERE id=?",
+                (weekday_mask(wd for wd, _ in sessions), class_id))
+
+
 def save_class_tab_order(order_keys):
     conn = get_connection()
     cur = conn.cursor()
@@ -138,20 +240,137 @@ def get_storage_root() -> Path:
     return root
 
 
-DB_PATH = Path(__file__).resolve().with_name("dance_school.db")
+# === Branches (one database per studio) ===
+
+BRANCHES_FILE = Path(__file__).resolve().with_name("branches.json")
+DEFAULT_BRANCH = "Merkez"
+MAX_ATTACHED_BRANCHES = 9   # SQLite allows 10 ATTACHed databases by default
+
+
+def load_branches():
+    """
+    Read branches.json next to this file:
+        {"active": "Merkez", "branches": {"Merkez": "dance_school.db", "Kadıköy": "kadikoy.db"}}
+    Relative paths are resolved against the app folder. Returns ({name: Path}, active name);
+    without the file there is a single DEFAULT_BRANCH on dance_school.db.
+    """
+    app_dir = BRANCHES_FILE.parent
+    single = {DEFAULT_BRANCH: app_dir / "dance_school.db"}
+    try:
+        with open(BRANCHES_FILE, encoding="utf-8") as fh:
+            config = json.load(fh)
+        branches = {str(name): (app_dir / path).resolve() for name, path in config["branches"].items()}
+    except FileNotFoundError:
+        return single, DEFAULT_BRANCH
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"[WARNING] {BRANCHES_FILE.name} okunamadı, tek şube kullanılıyor: {e}")
+        return single, DEFAULT_BRANCH
+    if not branches:
+        return single, DEFAULT_BRANCH
+    active = config.get("active")
+    return branches, (active if active in branches else next(iter(branches)))
+
+
+BRANCHES, ACTIVE_BRANCH = load_branches()
+DB_PATH = BRANCHES[ACTIVE_BRANCH]
+
+
+def get_active_branch():
+    return ACTIVE_BRANCH
+
+
+def get_branch_names():
+    return list(BRANCHES)
+
+
+def set_active_branch(name, persist=True):
+    """Point every following get_connection() at another branch; persist=True remembers it in branches.json."""
+    global ACTIVE_BRANCH, DB_PATH
+    if name not in BRANCHES:
+        raise ValueError(f"unknown branch: {name}")
+    ACTIVE_BRANCH, DB_PATH = name, BRANCHES[name]
+    if persist and BRANCHES_FILE.exists():
+        with open(BRANCHES_FILE, encoding="utf-8") as fh:
+            config = json.load(fh)
+        config["active"] = name
+        tmp_path = BRANCHES_FILE.with_name(f".{BRANCHES_FILE.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(config, fh, ensure_ascii=False, indent=2)
+        tmp_path.replace(BRANCHES_FILE)
+    print(f"[INFO] Aktif şube: {name} ({DB_PATH})")
+
+
+def use_database_file(path):
+    """
+    Point get_connection() at any database file (cli --db). Unless it is one
+    of the branches, there is no active branch and its exports/backups go
+    next to the file (see get_branch_storage_root).
+    """
+    global ACTIVE_BRANCH, DB_PATH
+    DB_PATH = Path(path).resolve()
+    ACTIVE_BRANCH = next((name for name, p in BRANCHES.items() if p == DB_PATH), None)
+
+
+def get_branch_storage_root() -> Path:
+    """
+    Exports and backups of the active branch: the storage root itself for the
+    first (original) branch, <root>/<branch> for the others so their backup
+    retention never touches each other's files. A database file outside
+    branches.json uses <file name>_dosyalar next to it.
+    """
+    if ACTIVE_BRANCH is None:
+        path = DB_PATH.with_name(f"{DB_PATH.stem}_dosyalar")
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+    root = get_storage_root()
+    if ACTIVE_BRANCH == next(iter(BRANCHES)):
+        return root
+    path = root / re.sub(r"[^\w\-]+", "_", ACTIVE_BRANCH)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# how long a connection waits for another writer (GUI, cron job) before "database is locked"
+BUSY_TIMEOUT_SECONDS = 15
 
 
 def get_db_path() -> Path:
     return DB_PATH
 
 
+# command_log.undoable sets .action while a user action is open on this thread
+_undo_context = threading.local()
+
+
 def get_connection():
-    return sqlite3.connect(str(DB_PATH))
+    # URI mode so callers can ATTACH other files with "?mode=ro"
+    if sql_trace.enabled():
+        conn = sql_trace.connect(DB_PATH.as_uri(), uri=True, timeout=BUSY_TIMEOUT_SECONDS)
+    else:
+        conn = sqlite3.connect(DB_PATH.as_uri(), uri=True, timeout=BUSY_TIMEOUT_SECONDS)
+    action = getattr(_undo_context, "action", None)
+    if action:
+        _capture_undo_rows(conn, action)
+    return conn
 
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
 
+def _capture_undo_rows(conn, action):
+    """
+    Copy the change_log rows written through this connection into
+    command_pending under `action`. A TEMP trigger only exists on this
+    connection, so writes of other threads/processes (startup sweep, cron,
+    backup worker) never end up in the user's undo command.
+    """
+    conn.execute(f"""
+        CREATE TEMP TRIGGER IF NOT EXISTS capture_undo_rows AFTER INSERT ON main.change_log
+        BEGIN
+            INSERT INTO command_pending (action, seq, tbl, op, row_id, old_json, row_json)
+            VALUES ('{action}', NEW.seq, NEW.tbl, NEW.op, NEW.row_id, NEW.old_json, NEW.row_json);
+        END
+    """)
+
+def _migrate_base_schema(cursor):
+    """v1: original tables, classes.name_key backfill + de-duplication."""
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS classes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -163,10 +382,9 @@ def init_db():
     ''')
 
     # === Migration: add name_key and unique index for de-duplication ===
-    try:
+    cols = [row[1] for row in cursor.execute("PRAGMA table_info(classes)").fetchall()]
+    if "name_key" not in cols:
         cursor.execute("ALTER TABLE classes ADD COLUMN name_key TEXT")
-    except Exception:
-        pass  # column might already exist
 
     # backfill name_key for all rows
     cursor.execute("SELECT id, name FROM classes WHERE name_key IS NULL OR name_key=''")
@@ -181,7 +399,6 @@ def init_db():
         )
     """)
 
-
     # unique index on name_key + day + hour (so same class group can have multiple day/hour)
     cursor.execute("""
         CREATE UNIQUE INDEX IF NOT EXISTS idx_classes_namekey_day_hour
@@ -229,7 +446,421 @@ def init_db():
             eski_kasa REAL
         )
     ''')
-    
+    _ensure_order_table(cursor)
+
+
+def _migrate_end_time_index(cursor):
+    """v2: index for the due-date queries."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_end_time ON students(end_time)")
+
+
+def _migrate_change_log(cursor):
+    """v3: change_log + triggers for incremental backups."""
+    _ensure_change_log(cursor)
+
+
+def _migrate_outbox(cursor):
+    """v4: persistent WhatsApp outbox."""
+    _ensure_outbox(cursor)
+
+
+def _migrate_class_sessions(cursor):
+    """v5: class_sessions + classes.weekday_mask, filled once from the day/hour strings."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS class_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            class_id INTEGER NOT NULL REFERENCES classes(id),
+            weekday INTEGER NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+            minute_of_day INTEGER,
+            UNIQUE (class_id, weekday, minute_of_day)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_class_sessions_weekday ON class_sessions(weekday)")
+    cols = {r[1] for r in cursor.execute("PRAGMA table_info(classes)").fetchall()}
+    if "weekday_mask" not in cols:
+        cursor.execute("ALTER TABLE classes ADD COLUMN weekday_mask INTEGER NOT NULL DEFAULT 0")
+    for class_id, day, hour in cursor.execute("SELECT id, day, hour FROM classes").fetchall():
+        _sync_class_sessions(cursor, class_id, day, hour)
+    # recreate the triggers so they log the new column and table
+    _ensure_change_log(cursor)
+
+
+def _migrate_closures(cursor):
+    """v6: studio closures / public holidays (no lessons on these dates)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS closures (
+            date TEXT PRIMARY KEY,   -- 'YYYY-MM-DD'
+            reason TEXT
+        )
+    """)
+    _ensure_change_log(cursor)
+
+
+def _migrate_class_occurrences(cursor):
+    """v7: materialized class_occurrences calendar + indexes for the 'Bugün' join."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS class_occurrences (
+            date TEXT NOT NULL,        -- 'YYYY-MM-DD'
+            class_id INTEGER NOT NULL REFERENCES classes(id),
+            minute_of_day INTEGER,     -- earliest session of the class on that date
+            PRIMARY KEY (date, class_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_class_id ON students(class_id)")
+    _refresh_class_occurrences(cursor)
+
+
+def _migrate_credit_ledger(cursor):
+    """
+    v8: credit_ledger; students.left_classes becomes its materialized balance.
+    The last date-derived value is booked as an 'opening' adjust event and
+    lessons up to today count as swept.
+    """
+    _ensure_credit_ledger(cursor)
+    today = datetime.today().date()
+    _recompute_left_classes_from_dates(cursor, today)
+    cursor.execute("""
+        INSERT INTO credit_ledger (student_id, kind, amount, date, source)
+        SELECT id, 'adjust', left_classes, ?, 'opening'
+        FROM students
+        WHERE IFNULL(left_classes, 0) != 0
+          AND id NOT IN (SELECT student_id FROM credit_ledger)
+    """, (today.isoformat(),))
+    cursor.execute("UPDATE students SET left_classes = 0 WHERE left_classes IS NULL")
+    _set_state(cursor, "credits_swept_until", today.isoformat())
+    _ensure_change_log(cursor)
+
+
+def _migrate_persons(cursor):
+    """
+    v9: persons + students.person_id. A students row stays the enrollment
+    (class, dates, credits); the enrollments view names it that way.
+    Existing duplicates are merged by _merge_students_into_persons.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS persons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            number TEXT,
+            phone_key TEXT NOT NULL DEFAULT '',   -- utils.phone_key(number)
+            name_key TEXT NOT NULL DEFAULT '',    -- utils.tr_norm(name)
+            created_at TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_persons_phone_key ON persons(phone_key)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_persons_name_key ON persons(name_key)")
+    cols = {r[1] for r in cursor.execute("PRAGMA table_info(students)").fetchall()}
+    if "person_id" not in cols:
+        cursor.execute("ALTER TABLE students ADD COLUMN person_id INTEGER REFERENCES persons(id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_person_id ON students(person_id)")
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS enrollments AS
+        SELECT id AS enrollment_id, person_id, class_id, start_time, end_time, left_classes, info
+        FROM students
+    """)
+    merged = _merge_students_into_persons(cursor)
+    print(f"[INFO] persons: {merged} öğrenci kaydı birleştirildi")
+    _ensure_change_log(cursor)
+
+
+def _migrate_archive(cursor):
+    """
+    v10: cold storage for long-inactive students. Rows keep their ids; the
+    archived students row also remembers its class name/day/hour in case the
+    class is deleted later.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS students_archive (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            number TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            left_classes INTEGER,
+            info TEXT,
+            class_id INTEGER,
+            person_id INTEGER,
+            class_name TEXT,
+            class_day TEXT,
+            class_hour TEXT,
+            archive_reason TEXT,   -- 'overdue' | 'eskiler'
+            archived_at TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_archive_person ON students_archive(person_id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_archive (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER,
+            date TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_archive_student ON attendance_archive(student_id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS credit_ledger_archive (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            source TEXT,
+            note TEXT,
+            created_at TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_credit_ledger_archive_student ON credit_ledger_archive(student_id)")
+    _ensure_change_log(cursor)
+
+
+def _migrate_command_log(cursor):
+    """
+    v11: persisted undo/redo (see command_log.py). One command_log row per
+    user action, its compacted row diffs in command_changes; change_log
+    triggers now also keep the old row image.
+    """
+    _ensure_change_log(cursor)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS command_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            label TEXT NOT NULL,
+            undone INTEGER NOT NULL DEFAULT 0,   -- 1 = on the redo side
+            created_at TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS command_changes (
+            command_id INTEGER NOT NULL REFERENCES command_log(id) ON DELETE CASCADE,
+            pos INTEGER NOT NULL,
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL,          -- 'I', 'U' or 'D' as in change_log
+            row_id INTEGER NOT NULL,
+            old_json TEXT,             -- 'U': changed columns only; 'D': full row
+            new_json TEXT,             -- 'U': changed columns only; 'I': full row
+            PRIMARY KEY (command_id, pos)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migrate_archive_discount(cursor):
+    """v12: students_archive keeps discount_info, so unarchiving restores the discount."""
+    cols = {r[1] for r in cursor.execute("PRAGMA table_info(students_archive)").fetchall()}
+    if "discount_info" not in cols:
+        cursor.execute("ALTER TABLE students_archive ADD COLUMN discount_info TEXT")
+    _ensure_change_log(cursor)
+
+
+def _migrate_command_pending(cursor):
+    """
+    v13: change_log rows of the open user action, tagged by the connections
+    that wrote them (see _capture_undo_rows); command_log.record() folds and
+    removes them, purge_change_log() never touches them.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS command_pending (
+            action TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            old_json TEXT,
+            row_json TEXT,
+            created_at TEXT DEFAULT (datetime('now', 'localtime')),
+            PRIMARY KEY (action, seq)
+        ) WITHOUT ROWID
+    """)
+
+
+# Ordered schema migrations; PRAGMA user_version holds how many have been applied.
+# Append new steps at the end, never reorder. Each step must be safe on a DB
+# that already has the change (old DBs start at version 0 with most of it in place).
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_end_time_index,
+    _migrate_change_log,
+    _migrate_outbox,
+    _migrate_class_sessions,
+    _migrate_closures,
+    _migrate_class_occurrences,
+    _migrate_credit_ledger,
+    _migrate_persons,
+    _migrate_archive,
+    _migrate_command_log,
+    _migrate_archive_discount,
+    _migrate_command_pending,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db():
+    conn = get_connection()
+    try:
+        # WAL (stored in the file): readers and one writer no longer block each
+        # other, so `python -m cli` jobs can run while the GUI is open
+        conn.execute("PRAGMA journal_mode=WAL")
+        version = get_schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            # schema is current; only keep change_log bounded
+            if trim_change_log(conn.cursor()):
+                conn.commit()
+            return
+
+        cursor = conn.cursor()
+        for number, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+            started = datetime.now()
+            migrate(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+            ms = (datetime.now() - started).total_seconds() * 1000
+            print(f"[INFO] Schema migration {number}/{SCHEMA_VERSION} applied in {ms:.0f} ms")
+    finally:
+        conn.close()
+
+
+# === Change log (incremental backups) ===
+
+# Tables whose row changes are recorded by triggers into change_log.
+CHANGE_LOGGED_TABLES = (
+    "classes", "students", "attendance", "hesap_records", "kasa_table", "class_order",
+    "class_sessions", "closures", "credit_ledger", "persons",
+    "students_archive", "attendance_archive", "credit_ledger_archive",
+)
+
+
+def _ensure_change_log(cur):
+    """
+    Create change_log + backup_state and (re)install the AFTER INSERT/UPDATE/DELETE
+    triggers that copy every changed row of CHANGE_LOGGED_TABLES into change_log.
+    old_json holds the row before the change; command_log.py builds undo diffs from it.
+    Triggers are rebuilt from PRAGMA table_info, so call this again after adding columns.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            op TEXT NOT NULL,              -- 'I', 'U' or 'D'
+            row_id INTEGER NOT NULL,       -- rowid of the changed row
+            row_json TEXT,                 -- full row after the change (NULL for 'D')
+            changed_at TEXT DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')),
+            old_json TEXT                  -- full row before the change (NULL for 'I')
+        )
+    """)
+    if "old_json" not in {r[1] for r in cur.execute("PRAGMA table_info(change_log)").fetchall()}:
+        cur.execute("ALTER TABLE change_log ADD COLUMN old_json TEXT")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS backup_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+    for table in CHANGE_LOGGED_TABLES:
+        cols = [row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+        if not cols:
+            continue
+        new_json = "json_object(" + ", ".join(f"'{c}', NEW.\"{c}\"" for c in cols) + ")"
+        old_json = "json_object(" + ", ".join(f"'{c}', OLD.\"{c}\"" for c in cols) + ")"
+
+        for op in ("insert", "update", "delete"):
+            cur.execute(f"DROP TRIGGER IF EXISTS trg_changelog_{table}_{op}")
+
+        cur.execute(f"""
+            CREATE TRIGGER trg_changelog_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO change_log (tbl, op, row_id, row_json)
+                VALUES ('{table}', 'I', NEW.rowid, {new_json});
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER trg_changelog_{table}_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT INTO change_log (tbl, op, row_id, row_json, old_json)
+                SELECT '{table}', 'D', OLD.rowid, NULL, {old_json} WHERE OLD.rowid <> NEW.rowid;
+                INSERT INTO change_log (tbl, op, row_id, row_json, old_json)
+                VALUES ('{table}', 'U', NEW.rowid, {new_json},
+                        CASE WHEN OLD.rowid = NEW.rowid THEN {old_json} END);
+            END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER trg_changelog_{table}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO change_log (tbl, op, row_id, row_json, old_json)
+                VALUES ('{table}', 'D', OLD.rowid, NULL, {old_json});
+            END
+        """)
+
+
+def get_backup_state(key, default=None):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM backup_state WHERE key=?", (key,))
+    row = cur.fetchone()
+    conn.close()
+    return row[0] if row else default
+
+
+def set_backup_state(key, value):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO backup_state (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value
+    """, (key, str(value)))
+    conn.commit()
+    conn.close()
+
+
+def get_change_log_since(seq):
+    """Return [(seq, tbl, op, row_id, row_json, changed_at), ...] with seq > given seq."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT seq, tbl, op, row_id, row_json, changed_at
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq
+    """, (seq,))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+# change_log keeps a full JSON image of every write. Backups purge what they
+# have saved (backup.create_backup); without them init_db() keeps only the
+# newest CHANGE_LOG_MAX_ROWS rows, so the table cannot grow without limit.
+CHANGE_LOG_MAX_ROWS = 50000
+
+
+def trim_change_log(cur, max_rows=CHANGE_LOG_MAX_ROWS):
+    """
+    Drop all but the newest max_rows change_log rows (caller commits). If rows
+    no delta file holds yet are dropped, backup_state change_log_trimmed_seq
+    makes the next incremental backup a full snapshot. Returns the dropped count.
+    """
+    cutoff = cur.execute("SELECT IFNULL(MAX(seq), 0) FROM change_log").fetchone()[0] - max_rows
+    if cutoff <= 0:
+        return 0
+    cur.execute("DELETE FROM change_log WHERE seq <= ?", (cutoff,))
+    dropped = cur.rowcount
+    exported = cur.execute("SELECT value FROM backup_state WHERE key='last_delta_seq'").fetchone()
+    if dropped and cutoff > int(exported[0] if exported else 0):
+        cur.execute("""
+            INSERT INTO backup_state (key, value) VALUES ('change_log_trimmed_seq', ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        """, (str(cutoff),))
+        print(f"[INFO] change_log: {dropped} eski kayıt silindi (yedeklenmemişti, sonraki yedek tam alınacak)")
+    return dropped
+
+
+def purge_change_log(up_to_seq):
+    """Drop change_log entries that are already covered by a delta file and a full snapshot."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM change_log WHERE seq <= ?", (up_to_seq,))
     conn.commit()
     conn.close()
 
@@ -272,34 +903,102 @@ def get_class_group_key_by_id(class_id):
         return None, None
     return row[0], row[1]
 
-def ensure_eskiler_class(class_name):
-    """
-    Ensure there is a classes-row for this group named 'ESKİLER' (day=hour='ESKİLER').
-    Return its class_id.
-    """
+def _ensure_eskiler_class(cur, class_name):
     canon = resolve_canonical_class_name(class_name)
     name_key = normalize_class_key(canon)
-
-    conn = get_connection()
-    cur = conn.cursor()
     cur.execute("""
         SELECT id FROM classes
         WHERE name_key=? AND day='ESKİLER' AND hour='ESKİLER'
     """, (name_key,))
     row = cur.fetchone()
     if row:
-        conn.close()
         return row[0]
-
     cur.execute("""
         INSERT INTO classes (name, day, hour, price, name_key)
         VALUES (?, 'ESKİLER', 'ESKİLER', NULL, ?)
     """, (canon, name_key))
-    esk_id = cur.lastrowid
+    return cur.lastrowid
+
+def ensure_eskiler_class(class_name):
+    """
+    Ensure there is a classes-row for this group named 'ESKİLER' (day=hour='ESKİLER').
+    Return its class_id.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    esk_id = _ensure_eskiler_class(cur, class_name)
     conn.commit()
     conn.close()
     return esk_id
 
+# Outcomes of move_students_to_eskiler, per student id
+ESKILER_MOVED = "moved"              # class_id now points at ESKİLER
+ESKILER_DUPLICATE = "duplicate"      # person already in ESKİLER -> active row deleted
+ESKILER_NOT_FOUND = "not_found"      # no such student in the given class
+
+def move_students_to_eskiler(student_ids, class_id):
+    """
+    Archive a batch of students of class_id into the group's ESKİLER class in
+    one transaction: one duplicate query (by person) against ESKİLER, one
+    UPDATE for the movers, one DELETE for the ones already archived.
+    Returns {student_id: ESKILER_MOVED | ESKILER_DUPLICATE | ESKILER_NOT_FOUND}.
+    """
+    ids = list(dict.fromkeys(int(sid) for sid in student_ids))
+    if not ids:
+        return {}
+    qmarks = ",".join("?" for _ in ids)
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT name FROM classes WHERE id=?", (class_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise ValueError(f"Sınıf bulunamadı: {class_id}")
+        esk_class_id = _ensure_eskiler_class(cur, row[0])
+
+        cur.execute(f"SELECT id, person_id FROM students WHERE class_id=? AND id IN ({qmarks})",
+                    (class_id, *ids))
+        found = dict(cur.fetchall())
+        cur.execute(f"""
+            SELECT DISTINCT person_id FROM students
+            WHERE class_id=? AND person_id IN (
+                SELECT person_id FROM students WHERE id IN ({qmarks})
+            )
+        """, (esk_class_id, *ids))
+        archived = {r[0] for r in cur.fetchall()}
+
+        outcome, moved, duplicates = {}, [], []
+        for sid in ids:
+            if sid not in found:
+                outcome[sid] = ESKILER_NOT_FOUND
+                continue
+            person_id = found[sid]
+            if person_id is not None and person_id in archived:
+                outcome[sid] = ESKILER_DUPLICATE
+                duplicates.append(sid)
+            else:
+                outcome[sid] = ESKILER_MOVED
+                moved.append(sid)
+                if person_id is not None:
+                    archived.add(person_id)   # a second row of the same person in this batch
+        if moved:
+            cur.execute(f"UPDATE students SET class_id=? WHERE id IN ({','.join('?' for _ in moved)})",
+                        (esk_class_id, *moved))
+        if duplicates:
+            cur.execute(f"DELETE FROM students WHERE id IN ({','.join('?' for _ in duplicates)})", duplicates)
+            cur.execute(f"DELETE FROM credit_ledger WHERE student_id IN ({','.join('?' for _ in duplicates)})",
+                        duplicates)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"[INFO] ESKİLER: {len(moved)} taşındı, {len(duplicates)} zaten vardı "
+          f"(sınıf {class_id} -> {esk_class_id})")
+    return outcome
+
 def student_exists_in_class_by_name_or_number(target_class_id, name, number):
     """
     Return True if a student with same (normalized) name OR phone (spaces ignored)
@@ -353,6 +1052,9 @@ def add_class(name, day, hour, price):
         "INSERT INTO classes (name, day, hour, price, name_key) VALUES (?, ?, ?, ?, ?)",
         (canon, day, hour, price, name_key)
     )
+    class_id = cursor.lastrowid
+    _sync_class_sessions(cursor, class_id, day, hour)
+    _refresh_class_occurrences(cursor, class_id=class_id)
     conn.commit()
     conn.close()
 
@@ -372,6 +1074,11 @@ def delete_class_instance(name, day, hour):
     key = normalize_class_key(canon)
     conn = get_connection()
     cur = conn.cursor()
+    for table in ("class_sessions", "class_occurrences"):
+        cur.execute(f"""
+            DELETE FROM {table} WHERE class_id IN
+                (SELECT id FROM classes WHERE name_key=? AND day=? AND hour=?)
+        """, (key, day, hour))
     cur.execute("DELETE FROM classes WHERE name_key=? AND day=? AND hour=?", (key, day, hour))
     conn.commit()
     conn.close()
@@ -391,16 +1098,35 @@ def get_class_id(name, day, hour):
     return row[0] if row else None
 
 def get_students_by_class_id(class_id):
+    """[Student, ...] of one class instance."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, name, number, start_time, end_time, left_classes, info FROM students WHERE class_id=?",
-        (class_id,)
-    )
+    cursor.row_factory = Student.from_row
+    cursor.execute(f"SELECT {STUDENT_COLUMNS} FROM students WHERE class_id=?", (class_id,))
     results = cursor.fetchall()
     conn.close()
     return results
 
+def get_student_by_id(student_id):
+    """Single Student or None."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = Student.from_row
+    cursor.execute(f"SELECT {STUDENT_COLUMNS} FROM students WHERE id=?", (student_id,))
+    student = cursor.fetchone()
+    conn.close()
+    return student
+
+def get_class_instance_by_id(class_id):
+    """Single ClassInstance or None."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = ClassInstance.from_row
+    cursor.execute(f"SELECT {CLASS_COLUMNS} FROM classes WHERE id=?", (class_id,))
+    instance = cursor.fetchone()
+    conn.close()
+    return instance
+
 def add_student_to_class(class_id, name, number, start_date, note, left_classes):
     conn = get_connection()
     cursor = conn.cursor()
@@ -413,10 +1139,14 @@ def add_student_to_class(class_id, name, number, start_date, note, left_classes)
     cursor.execute(
         '''
         INSERT INTO students (class_id, name, number, start_time, end_time, left_classes, info)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, 0, ?)
         ''',
-        (class_id, name, number, start_date, end_time, left_classes, note)
+        (class_id, name, number, start_date, end_time, note)
     )
+    student_id = cursor.lastrowid
+    _post_credit(cursor, student_id, "purchase", left_classes, start_date, source="new")
+    _charge_swept_occurrences(cursor, student_id)
+    _link_person(cursor, student_id, name, number)
     conn.commit()
     conn.close()
 
@@ -425,6 +1155,7 @@ def delete_student(student_id):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM students WHERE id=?", (student_id,))
+    cursor.execute("DELETE FROM credit_ledger WHERE student_id=?", (student_id,))
     conn.commit()
     conn.close()
 
@@ -437,12 +1168,15 @@ def update_student_info(student_id, name, number, start_time, note):
 
     conn = get_connection()
     cursor = conn.cursor()
+    old_start = cursor.execute("SELECT start_time FROM students WHERE id=?", (student_id,)).fetchone()
     cursor.execute(
         '''UPDATE students
            SET name=?, number=?, start_time=?, info=?
            WHERE id=?''',
         (name, number, start_dt.strftime("%Y-%m-%d"), note, student_id)
     )
+    _charge_swept_occurrences(cursor, student_id, old_start[0] if old_start else None)
+    _relink_person(cursor, student_id, name, number)
     conn.commit()
     conn.close()
     print(f"[DEBUG] Updated student (id={student_id}): name={name}, number={number}, start_date={start_dt}, note={note}. End date NOT touched.")
@@ -479,110 +1213,670 @@ def update_class_instance(class_name, old_day, old_hour, new_day, new_hour):
             raise ValueError("duplicate_class_time")
 
         cur.execute("""
-            UPDATE classes
-            SET day=?, hour=?
+            SELECT id FROM classes
             WHERE name_key=? AND day=? AND hour=?
-        """, (new_day, new_hour, name_key, old_day, old_hour))
+        """, (name_key, old_day, old_hour))
+        row = cur.fetchone()
+        if not row:
+            return 0
+
+        cur.execute("UPDATE classes SET day=?, hour=? WHERE id=?", (new_day, new_hour, row[0]))
+        _sync_class_sessions(cur, row[0], new_day, new_hour)
+        _refresh_class_occurrences(cur, class_id=row[0])
         conn.commit()
-        return cur.rowcount
+        return 1
     finally:
         conn.close()
 
 
-def update_left_classes_for_all_students():
-    today = datetime.today().date()
-
-    conn = get_connection()
-    cursor = conn.cursor()
-
+def _recompute_left_classes_from_dates(cursor, today):
+    """
+    The pre-ledger rule (lessons left until end_time, negative after it),
+    one numpy pass per distinct weekday mask. Only used for the opening balance.
+    """
     cursor.execute('''
-        SELECT students.id, students.start_time, students.end_time, students.left_classes, classes.day
+        SELECT students.id, students.start_time, students.end_time, classes.weekday_mask
         FROM students
         JOIN classes ON students.class_id = classes.id
     ''')
-    rows = cursor.fetchall()
-
-    for student_id, start_time_str, end_time_str, left_classes, class_days in rows:
-        if not start_time_str.strip() or not end_time_str.strip():
-            continue
-
-        try:
-            start_date = datetime.strptime(start_time_str, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_time_str, "%Y-%m-%d").date()
-        except Exception as e:
-            print("[DEBUG] Date parse error:", e)
-            continue
-
-        class_days_list = [d.strip() for d in (class_days or "").split(",") if d.strip()]
-        class_day_indexes = []
-        for d in class_days_list:
-            idx = _day_token_to_index(d)
-            if idx is not None:
-                class_day_indexes.append(idx)
-
-
-        # Count total classes from start date up to (but not including) end date
-        total_classes = 0
-        current_date = start_date
-        while current_date < end_date:
-            if current_date.weekday() in class_day_indexes:
-                total_classes += 1
-            current_date += timedelta(days=1)
-
-        # Count classes that have passed up to TODAY, not including end_date
-        classes_passed = 0
-        current_date = start_date
-        while current_date <= today and current_date < end_date:
-            if current_date.weekday() in class_day_indexes:
-                classes_passed += 1
-            current_date += timedelta(days=1)
-
-        new_left_classes = max(total_classes - classes_passed, 0)
-
-        # If today is after end_date, subtract for every class day that passed after end_date
-        if today > end_date:
-            after_end_date = end_date + timedelta(days=1)
-            while after_end_date <= today:
-                if after_end_date.weekday() in class_day_indexes:
-                    new_left_classes -= 1
-                after_end_date += timedelta(days=1)
-            # Left classes can be negative
-            # no clamping to zero here
-            # because you said "should be negative when today is after end"
-            # so skip: new_left_classes = max(new_left_classes, 0)
-
-        # Debug info
-        """print(f"[DEBUG] Student {student_id} -> Start: {start_date}, End: {end_date}, "
-              f"ClassDays: {class_days_list}, Total: {total_classes}, "
-              f"Passed: {classes_passed}, Left: {new_left_classes}")"""
-
-        cursor.execute(
-            "UPDATE students SET left_classes=? WHERE id=?",
-            (new_left_classes, student_id)
-        )
+    by_mask = {}
+    for student_id, start_time_str, end_time_str, class_mask in cursor.fetchall():
+        by_mask.setdefault(class_mask or 0, []).append((student_id, start_time_str, end_time_str))
+
+    holidays = [r[0] for r in cursor.execute("SELECT date FROM closures").fetchall()]
+    updates = []
+    for class_mask, rows in by_mask.items():
+        ids, starts, ends = zip(*rows)
+        lefts = lesson_calendar.left_classes(starts, ends, mask_to_weekdays(class_mask), today, holidays)
+        updates.extend((left, sid, left) for sid, left in zip(ids, lefts) if left is not None)
+    cursor.executemany("UPDATE students SET left_classes=? WHERE id=? AND left_classes IS NOT ?", updates)
 
+def extend_student_courses_in_db(student_id, additional_courses, new_end_date):
+    """Book `additional_courses` bought lessons and move the end date, in one transaction."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE students SET end_time=? WHERE id=?", (new_end_date, student_id))
+    if cursor.rowcount:
+        _post_credit(cursor, student_id, "purchase", additional_courses, source="extend")
     conn.commit()
     conn.close()
 
-def extend_student_courses_in_db(student_id, additional_courses, new_end_date):
+def get_class_weekdays(class_id):
+    """Weekday indexes (0 = Monday) of a class, from the cached weekday_mask."""
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT weekday_mask FROM classes WHERE id=?", (class_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return mask_to_weekdays(row[0]) if row else []
 
-    # Fetch current left_classes and current end_time (if needed)
-    cursor.execute("SELECT left_classes FROM students WHERE id=?", (student_id,))
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
-        return
 
-    current_left_classes = result[0]
-    new_left_classes = current_left_classes + additional_courses
+def get_class_sessions(class_id):
+    """[(weekday, minute_of_day), ...] of a class, ordered by weekday and time."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT weekday, minute_of_day FROM class_sessions
+        WHERE class_id=? ORDER BY weekday, minute_of_day
+    """, (class_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
 
-    # Save the updated left_classes and new end_date
-    cursor.execute(
-        "UPDATE students SET left_classes=?, end_time=? WHERE id=?",
-        (new_left_classes, new_end_date, student_id)
-    )
+# === Class occurrences (materialized lesson calendar) ===
+
+# How many days ahead of today class_occurrences is generated.
+OCCURRENCE_WINDOW_DAYS = 35
+
+
+def _refresh_class_occurrences(cur, class_id=None, today=None, days=OCCURRENCE_WINDOW_DAYS):
+    """
+    Regenerate class_occurrences from today to today+days from class_sessions,
+    skipping closures. Past dates are kept as history. class_id limits the
+    refresh to one class (after its schedule changed).
+    """
+    start = (today or datetime.today().date()).isoformat()
+    cur.execute("""
+        DELETE FROM class_occurrences
+        WHERE date >= ? AND (? IS NULL OR class_id = ?)
+    """, (start, class_id, class_id))
+    cur.execute("""
+        WITH RECURSIVE days(d) AS (
+            SELECT date(?)
+            UNION ALL
+            SELECT date(d, '+1 day') FROM days WHERE d < date(?, ?)
+        )
+        INSERT OR REPLACE INTO class_occurrences (date, class_id, minute_of_day)
+        SELECT days.d, s.class_id, MIN(s.minute_of_day)
+        FROM days
+        JOIN class_sessions s
+          ON s.weekday = (CAST(strftime('%w', days.d) AS INTEGER) + 6) % 7   -- 0 = Monday
+        WHERE days.d NOT IN (SELECT date FROM closures)
+          AND (? IS NULL OR s.class_id = ?)
+        GROUP BY days.d, s.class_id
+    """, (start, start, f"+{days - 1} days", class_id, class_id))
+
+
+def get_today_overview(date_str=None):
+    """
+    Lessons on date_str (default today) with their students and whether
+    attendance is already marked, in one indexed query:
+    [(class_id, class_name, day, hour, minute_of_day,
+      student_id, student_name, number, left_classes, end_time, present), ...]
+    Classes without students appear once with student_id None.
+    """
+    date_str = date_str or datetime.today().strftime("%Y-%m-%d")
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT o.class_id, c.name, c.day, c.hour, o.minute_of_day,
+               s.id, s.name, s.number, s.left_classes, s.end_time,
+               EXISTS (SELECT 1 FROM attendance a
+                       WHERE a.student_id = s.id AND a.date = o.date) AS present
+        FROM class_occurrences o
+        JOIN classes c ON c.id = o.class_id
+        LEFT JOIN students s ON s.class_id = o.class_id
+        WHERE o.date = ?
+        ORDER BY o.minute_of_day, c.name, o.class_id, s.name COLLATE NOCASE
+    """, (date_str,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+# === Persons (one row per human; a students row is one enrollment) ===
+
+# Same phone and at least this similar a name -> same person
+# (siblings sharing a parent's phone usually score well below it).
+PERSON_NAME_SIMILARITY = 0.85
+
+
+def _same_person(phone_a, name_a, phone_b, name_b):
+    """Keys from utils.phone_key / utils.tr_norm. Same name only counts when one side has no phone."""
+    if phone_a and phone_a == phone_b:
+        return name_a == name_b or \
+            difflib.SequenceMatcher(None, name_a, name_b).ratio() >= PERSON_NAME_SIMILARITY
+    return bool(name_a) and name_a == name_b and not (phone_a and phone_b)
+
+
+def _create_person(cur, name, number):
+    from utils import tr_norm, phone_key
+    cur.execute("INSERT INTO persons (name, number, phone_key, name_key) VALUES (?, ?, ?, ?)",
+                (name, number or "", phone_key(number), tr_norm(name)))
+    return cur.lastrowid
+
+
+def _merge_students_into_persons(cur):
+    """
+    Give every student without person_id a person, merging the rows of the
+    same human. Blocking: rows are bucketed by phone key and by name key and
+    only rows sharing a bucket are compared, never all pairs.
+    Returns how many rows were folded into another row's person.
+    """
+    from utils import tr_norm, phone_key
+    rows = cur.execute("SELECT id, name, number FROM students WHERE person_id IS NULL ORDER BY id").fetchall()
+    keys = {sid: (phone_key(number), tr_norm(name)) for sid, name, number in rows}
+    parent = {sid: sid for sid in keys}
+    cluster_phone = {sid: pk for sid, (pk, _nk) in keys.items()}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    blocks = {}
+    for sid, (pk, nk) in keys.items():
+        if pk:
+            blocks.setdefault(("phone", pk), []).append(sid)
+        if nk:
+            blocks.setdefault(("name", nk), []).append(sid)
+    for members in blocks.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                ra, rb = find(a), find(b)
+                if ra == rb or not _same_person(*keys[a], *keys[b]):
+                    continue
+                # a phone-less row must not chain two different phones into one person
+                if cluster_phone[ra] and cluster_phone[rb] and cluster_phone[ra] != cluster_phone[rb]:
+                    continue
+                parent[rb] = ra
+                cluster_phone[ra] = cluster_phone[ra] or cluster_phone[rb]
+
+    clusters = {}
+    for sid in keys:
+        clusters.setdefault(find(sid), []).append(sid)
+    by_id = {sid: (name, number) for sid, name, number in rows}
+    for members in clusters.values():
+        members.sort(reverse=True)   # newest row first: its spelling wins
+        number = next((by_id[s][1] for s in members if by_id[s][1]), "")
+        person_id = _create_person(cur, by_id[members[0]][0], number)
+        cur.executemany("UPDATE students SET person_id=? WHERE id=?", [(person_id, s) for s in members])
+    return len(rows) - len(clusters)
+
+
+def _link_person(cur, student_id, name, number):
+    """Attach one students row to a matching person (by the indexed keys) or a new one."""
+    from utils import tr_norm, phone_key
+    pk, nk = phone_key(number), tr_norm(name)
+    candidates = cur.execute("""
+        SELECT id, phone_key, name_key FROM persons
+        WHERE (phone_key = ? AND phone_key != '') OR name_key = ?
+        ORDER BY id
+    """, (pk, nk)).fetchall()
+    for person_id, p_pk, p_nk in candidates:
+        if _same_person(pk, nk, p_pk, p_nk):
+            if pk and not p_pk:
+                cur.execute("UPDATE persons SET number=?, phone_key=? WHERE id=?", (number, pk, person_id))
+            break
+    else:
+        person_id = _create_person(cur, name, number)
+    cur.execute("UPDATE students SET person_id=? WHERE id=?", (person_id, student_id))
+    return person_id
+
+
+def _relink_person(cur, student_id, name, number):
+    """After a name/number edit: re-match the row, drop its old person if nothing else uses it."""
+    from utils import tr_norm, phone_key
+    row = cur.execute("""
+        SELECT s.person_id, p.phone_key, p.name_key
+        FROM students s LEFT JOIN persons p ON p.id = s.person_id WHERE s.id=?
+    """, (student_id,)).fetchone()
+    old_person = row[0] if row else None
+    if old_person is not None and _same_person(phone_key(number), tr_norm(name), row[1], row[2]):
+        if phone_key(number) and not row[1]:
+            cur.execute("UPDATE persons SET number=?, phone_key=? WHERE id=?", (number, phone_key(number), old_person))
+        return old_person
+    cur.execute("UPDATE students SET person_id=NULL WHERE id=?", (student_id,))
+    if old_person is not None and not cur.execute("""
+            SELECT 1 FROM students WHERE person_id=?
+            UNION ALL SELECT 1 FROM students_archive WHERE person_id=? LIMIT 1
+            """, (old_person, old_person)).fetchone():
+        cur.execute("DELETE FROM persons WHERE id=?", (old_person,))
+    return _link_person(cur, student_id, name, number)
+
+
+def _link_unlinked_students(cur):
+    for student_id, name, number in cur.execute(
+            "SELECT id, name, number FROM students WHERE person_id IS NULL").fetchall():
+        _link_person(cur, student_id, name, number)
+
+
+def get_enrollments_of_person(person_id):
+    """[(student_id, class_name, day, hour), ...] of one person."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT e.enrollment_id, c.name, c.day, c.hour
+        FROM enrollments e JOIN classes c ON c.id = e.class_id
+        WHERE e.person_id=? ORDER BY c.name, e.enrollment_id
+    """, (person_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def person_enrolled_in_class(person_id, class_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM students WHERE person_id=? AND class_id=? LIMIT 1", (person_id, class_id))
+    found = cursor.fetchone() is not None
+    conn.close()
+    return found
+
+
+# === Lesson credits (event ledger) ===
+# students.left_classes is the materialized balance of credit_ledger: every
+# event is written together with its balance change in one transaction, so
+# showing Kalan Ders is a plain column read.
+#   purchase  +n  lessons bought (new student, extend, import)
+#   consume   -1  a lesson taken: attendance or a swept class occurrence,
+#                 at most one per student and date
+#   adjust    ±n  manual correction ('edit'), opening balance ('opening')
+
+CREDIT_KINDS = ("purchase", "consume", "adjust")
+
+
+def _ensure_credit_ledger(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS credit_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL REFERENCES students(id),
+            kind TEXT NOT NULL,
+            amount INTEGER NOT NULL,   -- signed change of the balance
+            date TEXT NOT NULL,        -- 'YYYY-MM-DD' (lesson date for consume)
+            source TEXT,               -- attendance | occurrence | extend | new | import | edit | opening ...
+            note TEXT,
+            created_at TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_credit_ledger_student ON credit_ledger(student_id, date)")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_credit_ledger_consume_once
+        ON credit_ledger(student_id, date) WHERE kind = 'consume'
+    """)
+    cur.execute("CREATE TABLE IF NOT EXISTS app_state (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def _get_state(cur, key, default=None):
+    row = cur.execute("SELECT value FROM app_state WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_state(cur, key, value):
+    cur.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)", (key, value))
+
+
+JOB_LOCK_TTL_MINUTES = 120   # a lock older than this belongs to a crashed run
+
+
+def acquire_job_lock(name, ttl_minutes=JOB_LOCK_TTL_MINUTES):
+    """
+    Take the app_state lease 'job:<name>' for a scheduled job (cli.py).
+    Returns False while another run of the same job holds a fresh one.
+    """
+    now = datetime.now()
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    held_since = _get_state(cur, f"job:{name}")
+    if held_since and held_since > (now - timedelta(minutes=ttl_minutes)).strftime("%Y-%m-%d %H:%M:%S"):
+        conn.rollback()
+        conn.close()
+        return False
+    _set_state(cur, f"job:{name}", now.strftime("%Y-%m-%d %H:%M:%S"))
+    conn.commit()
+    conn.close()
+    return True
+
+
+def release_job_lock(name):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM app_state WHERE key=?", (f"job:{name}",))
+    conn.commit()
+    conn.close()
+
+
+def mark_job_done(name):
+    conn = get_connection()
+    cur = conn.cursor()
+    _set_state(cur, f"job_done:{name}", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    conn.commit()
+    conn.close()
+
+
+def job_done_today(name, today=None):
+    """True if mark_job_done(name) ran today (GUI timer or cron), so a nightly job is not repeated."""
+    today = (today or datetime.today().date()).isoformat()
+    conn = get_connection()
+    cur = conn.cursor()
+    last = _get_state(cur, f"job_done:{name}") or ""
+    conn.close()
+    return last.startswith(today)
+
+
+def _post_credit(cur, student_id, kind, amount, date_str=None, source=None, note=None):
+    """
+    Append one ledger event and move the balance with it (caller commits).
+    Returns False when the day was already consumed.
+    """
+    if kind not in CREDIT_KINDS:
+        raise ValueError(f"unknown credit kind: {kind}")
+    date_str = date_str or datetime.today().strftime("%Y-%m-%d")
+    verb = "INSERT OR IGNORE" if kind == "consume" else "INSERT"
+    cur.execute(f"""
+        {verb} INTO credit_ledger (student_id, kind, amount, date, source, note)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (student_id, kind, amount, date_str, source, note))
+    if cur.rowcount != 1:
+        return False
+    cur.execute("UPDATE students SET left_classes = IFNULL(left_classes, 0) + ? WHERE id=?",
+                (amount, student_id))
+    return True
+
+
+def _adjust_credits_to(cur, student_id, new_balance, source="edit"):
+    row = cur.execute("SELECT IFNULL(left_classes, 0) FROM students WHERE id=?", (student_id,)).fetchone()
+    if row and int(new_balance) != row[0]:
+        _post_credit(cur, student_id, "adjust", int(new_balance) - row[0], source=source)
+
+
+def _refund_attendance_credit(cur, student_id, date_str):
+    """
+    Undo the credit an attendance consumed, unless that date was a scheduled
+    lesson of the student's class (those are charged with or without attendance).
+    """
+    row = cur.execute("""
+        SELECT l.id, l.amount FROM credit_ledger l
+        JOIN students s ON s.id = l.student_id
+        WHERE l.student_id=? AND l.date=? AND l.kind='consume' AND l.source='attendance'
+          AND NOT EXISTS (SELECT 1 FROM class_occurrences o
+                          WHERE o.class_id = s.class_id AND o.date = l.date)
+    """, (student_id, date_str)).fetchone()
+    if row:
+        cur.execute("DELETE FROM credit_ledger WHERE id=?", (row[0],))
+        cur.execute("UPDATE students SET left_classes = left_classes - ? WHERE id=?", (row[1], student_id))
+
+
+def _charge_swept_occurrences(cur, student_id, old_start=None):
+    """
+    The sweep only charges occurrences after its watermark. When a student
+    is added with, or edited to, a start_time before it, charge the already
+    swept occurrences from start_time on (up to old_start, if given); when
+    start_time moves later, give back the occurrence charges before it.
+    Returns the balance change (caller commits).
+    """
+    swept_until = _get_state(cur, "credits_swept_until")
+    start = cur.execute("SELECT IFNULL(start_time, '') FROM students WHERE id=?", (student_id,)).fetchone()
+    if not swept_until or start is None:
+        return 0
+    start = start[0]
+    if old_start and start > old_start:
+        cur.execute("""
+            DELETE FROM credit_ledger
+            WHERE student_id=? AND kind='consume' AND source='occurrence' AND date >= ? AND date < ?
+        """, (student_id, old_start, start))
+        delta = cur.rowcount
+    else:
+        cur.execute("""
+            INSERT OR IGNORE INTO credit_ledger (student_id, kind, amount, date, source)
+            SELECT s.id, 'consume', -1, o.date, 'occurrence'
+            FROM students s
+            JOIN class_occurrences o ON o.class_id = s.class_id
+            WHERE s.id = ? AND o.date >= ? AND o.date <= ? AND (? IS NULL OR o.date < ?)
+        """, (student_id, start, swept_until, old_start or None, old_start or None))
+        delta = -cur.rowcount
+    if delta:
+        cur.execute("UPDATE students SET left_classes = IFNULL(left_classes, 0) + ? WHERE id=?",
+                    (delta, student_id))
+    return delta
+
+
+def sweep_credit_consumption(today=None):
+    """
+    Consume one credit per scheduled class occurrence between the last sweep
+    (watermark in app_state) and today, inclusive, for every student of the
+    class who had started by then. Days already consumed by attendance are
+    not charged twice. Also rolls the class_occurrences window forward.
+    Returns the number of consumed credits.
+    """
+    today = today or datetime.today().date()
+    conn = get_connection()
+    cur = conn.cursor()
+    # read the watermark under the write lock: a concurrent sweep (GUI start + cron) must not charge twice
+    cur.execute("BEGIN IMMEDIATE")
+    swept_until = _get_state(cur, "credits_swept_until")
+    first = (datetime.strptime(swept_until, "%Y-%m-%d").date() + timedelta(days=1)
+             if swept_until else today)
+    if first > today:
+        conn.rollback()
+        conn.close()
+        return 0
+
+    # occurrences of days the app was not opened may be missing -> regenerate from `first`
+    _refresh_class_occurrences(cur, today=first, days=(today - first).days + OCCURRENCE_WINDOW_DAYS)
+    last_id = cur.execute("SELECT IFNULL(MAX(id), 0) FROM credit_ledger").fetchone()[0]
+    cur.execute("""
+        INSERT OR IGNORE INTO credit_ledger (student_id, kind, amount, date, source)
+        SELECT s.id, 'consume', -1, o.date, 'occurrence'
+        FROM class_occurrences o
+        JOIN students s ON s.class_id = o.class_id
+        WHERE o.date BETWEEN ? AND ? AND o.date >= IFNULL(s.start_time, '')
+    """, (first.isoformat(), today.isoformat()))
+    consumed = cur.rowcount
+    cur.execute("""
+        UPDATE students
+        SET left_classes = IFNULL(left_classes, 0) +
+            (SELECT SUM(amount) FROM credit_ledger l WHERE l.student_id = students.id AND l.id > ?)
+        WHERE id IN (SELECT student_id FROM credit_ledger WHERE id > ?)
+    """, (last_id, last_id))
+    _set_state(cur, "credits_swept_until", today.isoformat())
+    conn.commit()
+    conn.close()
+    if consumed:
+        print(f"[INFO] {consumed} ders kredisi düşüldü ({first} - {today})")
+    return consumed
+
+
+def get_credit_history(student_id):
+    """[(date, kind, amount, source, note), ...] of one student, oldest first."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT date, kind, amount, source, note FROM credit_ledger
+        WHERE student_id=? ORDER BY date, id
+    """, (student_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+# === Archive (cold storage for long-inactive students) ===
+
+# Policy: an active-class student whose payment date is this many days past
+# (and who has not attended since) goes to the archive; an ESKİLER row after
+# ESKILER_ARCHIVE_DAYS of no payment/attendance.
+ARCHIVE_OVERDUE_DAYS = 365
+ESKILER_ARCHIVE_DAYS = 180
+# DANCE_AUTO_ARCHIVE=0 stops the GUI from applying the policy at startup;
+# `python -m cli recompute` still does unless given --no-archive
+AUTO_ARCHIVE_ENV = "DANCE_AUTO_ARCHIVE"
+
+
+def auto_archive_enabled():
+    return os.environ.get(AUTO_ARCHIVE_ENV, "1") not in ("", "0")
+
+_ARCHIVE_STUDENT_COLUMNS = ("id, name, number, start_time, end_time, left_classes, info, discount_info, "
+                            "class_id, person_id")
+_LEDGER_COLUMNS = "id, student_id, kind, amount, date, source, note, created_at"
+
+
+def _move_rows(cur, src, dst, columns, key, ids_table):
+    cur.execute(f"INSERT OR REPLACE INTO {dst} ({columns}) SELECT {columns} FROM {src} "
+                f"WHERE {key} IN (SELECT id FROM {ids_table})")
+    cur.execute(f"DELETE FROM {src} WHERE {key} IN (SELECT id FROM {ids_table})")
+
+
+def archive_inactive_students(today=None, overdue_days=ARCHIVE_OVERDUE_DAYS, eskiler_days=ESKILER_ARCHIVE_DAYS):
+    """
+    Move students matching the archive policy, with their attendance and
+    credit events, into the *_archive tables in one transaction. The hot
+    tables (rosters, search, credit sweep) then no longer contain them.
+    Returns how many students were archived.
+    """
+    today = today or datetime.today().date()
+    overdue_cutoff = (today - timedelta(days=overdue_days)).isoformat()
+    eskiler_cutoff = (today - timedelta(days=eskiler_days)).isoformat()
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("DROP TABLE IF EXISTS temp._archive_ids")
+        cur.execute("""
+            CREATE TEMP TABLE _archive_ids AS
+            SELECT s.id AS id, CASE WHEN c.day='ESKİLER' THEN 'eskiler' ELSE 'overdue' END AS reason
+            FROM students s JOIN classes c ON c.id = s.class_id
+            WHERE CASE WHEN c.day='ESKİLER'
+                       THEN IFNULL(s.end_time, '') < :eskiler
+                       ELSE s.end_time != '' AND s.end_time < :overdue END
+              AND NOT EXISTS (
+                  SELECT 1 FROM attendance a
+                  WHERE a.student_id = s.id
+                    AND a.date >= CASE WHEN c.day='ESKİLER' THEN :eskiler ELSE :overdue END
+              )
+        """, {"eskiler": eskiler_cutoff, "overdue": overdue_cutoff})
+        count = cur.execute("SELECT COUNT(*) FROM _archive_ids").fetchone()[0]
+        if count:
+            cur.execute(f"""
+                INSERT OR REPLACE INTO students_archive
+                ({_ARCHIVE_STUDENT_COLUMNS}, class_name, class_day, class_hour, archive_reason)
+                SELECT {", ".join("s." + c for c in _ARCHIVE_STUDENT_COLUMNS.split(", "))},
+                       c.name, c.day, c.hour, t.reason
+                FROM _archive_ids t
+                JOIN students s ON s.id = t.id
+                LEFT JOIN classes c ON c.id = s.class_id
+            """)
+            _move_rows(cur, "attendance", "attendance_archive", "id, student_id, date", "student_id", "_archive_ids")
+            _move_rows(cur, "credit_ledger", "credit_ledger_archive", _LEDGER_COLUMNS, "student_id", "_archive_ids")
+            cur.execute("DELETE FROM students WHERE id IN (SELECT id FROM _archive_ids)")
+        cur.execute("DROP TABLE _archive_ids")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if count:
+        print(f"[INFO] {count} pasif öğrenci arşive taşındı")
+    return count
+
+
+def unarchive_students(student_ids):
+    """
+    Bring archived students back (same ids, with attendance and credit events)
+    into their old class, or the group's ESKİLER if that class is gone.
+    Returns {student_id: class_id}.
+    """
+    ids = [int(sid) for sid in student_ids]
+    if not ids:
+        return {}
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("DROP TABLE IF EXISTS temp._unarchive_ids")
+        cur.execute("CREATE TEMP TABLE _unarchive_ids (id INTEGER PRIMARY KEY)")
+        cur.executemany("INSERT OR IGNORE INTO _unarchive_ids (id) VALUES (?)", [(sid,) for sid in ids])
+        placed = {}
+        for sid, class_id, class_name in cur.execute("""
+            SELECT a.id, c.id, a.class_name FROM students_archive a
+            LEFT JOIN classes c ON c.id = a.class_id
+            WHERE a.id IN (SELECT id FROM _unarchive_ids)
+        """).fetchall():
+            placed[sid] = class_id if class_id is not None else _ensure_eskiler_class(cur, class_name or "")
+        cur.executemany("UPDATE students_archive SET class_id=? WHERE id=?",
+                        [(class_id, sid) for sid, class_id in placed.items()])
+        _move_rows(cur, "students_archive", "students", _ARCHIVE_STUDENT_COLUMNS, "id", "_unarchive_ids")
+        _move_rows(cur, "attendance_archive", "attendance", "id, student_id, date", "student_id", "_unarchive_ids")
+        _move_rows(cur, "credit_ledger_archive", "credit_ledger", _LEDGER_COLUMNS, "student_id", "_unarchive_ids")
+        cur.execute("DROP TABLE _unarchive_ids")
+        # the person may have been dropped meanwhile (see _relink_person)
+        cur.execute("""
+            UPDATE students SET person_id=NULL
+            WHERE person_id IS NOT NULL AND person_id NOT IN (SELECT id FROM persons)
+        """)
+        _link_unlinked_students(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"[INFO] {len(placed)} öğrenci arşivden geri alındı")
+    return placed
+
+
+# === Closures (holidays) ===
+
+def get_closures(start=None, end=None):
+    """[(date, reason), ...] ordered by date, optionally limited to start..end (inclusive)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT date, reason FROM closures
+        WHERE date >= IFNULL(?, date) AND date <= IFNULL(?, date)
+        ORDER BY date
+    """, (start, end))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def get_closure_dates():
+    """Closure dates as 'YYYY-MM-DD' strings, the holiday list for lesson_calendar."""
+    return [d for d, _ in get_closures()]
+
+
+def add_closure(date_str, reason=""):
+    conn = get_connection()
+    cursor = conn.cursor()
+    # upsert, not REPLACE: REPLACE deletes without firing the change_log delete trigger
+    cursor.execute("""
+        INSERT INTO closures (date, reason) VALUES (?, ?)
+        ON CONFLICT(date) DO UPDATE SET reason=excluded.reason
+    """, (date_str, reason))
+    cursor.execute("DELETE FROM class_occurrences WHERE date=?", (date_str,))
+    conn.commit()
+    conn.close()
+
+
+def delete_closure(date_str):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM closures WHERE date=?", (date_str,))
+    _refresh_class_occurrences(cursor)
     conn.commit()
     conn.close()
 
@@ -598,30 +1892,39 @@ def get_days_of_class(class_id):
     return ""
 
 def update_student_info_full(student_id, name, number, start_time, end_time, left_classes, note):
+    """
+    Save an edited table row. left_classes=None keeps the balance; a number
+    is booked as an 'adjust' event for the difference.
+    """
     conn = get_connection()
     cursor = conn.cursor()
 
-    # Load current end_time from DB
-    cursor.execute("SELECT end_time FROM students WHERE id=?", (student_id,))
-    current_end_time = cursor.fetchone()[0]
+    # Load current start/end_time from DB
+    cursor.execute("SELECT start_time, end_time FROM students WHERE id=?", (student_id,))
+    current_start_time, current_end_time = cursor.fetchone()
 
     # Only update end_time if it's different from what’s in DB
     if end_time != current_end_time:
         #print(f"[DEBUG] update_student_info_full: Changing end_time from {current_end_time} to {end_time}")
         cursor.execute(
             '''UPDATE students
-               SET name=?, number=?, start_time=?, end_time=?, left_classes=?, info=?
+               SET name=?, number=?, start_time=?, end_time=?, info=?
                WHERE id=?''',
-            (name, number, start_time, end_time, left_classes, note, student_id)
+            (name, number, start_time, end_time, note, student_id)
         )
     else:
         #print(f"[DEBUG] update_student_info_full: end_time unchanged ({current_end_time})")
         cursor.execute(
             '''UPDATE students
-               SET name=?, number=?, start_time=?, left_classes=?, info=?
+               SET name=?, number=?, start_time=?, info=?
                WHERE id=?''',
-            (name, number, start_time, left_classes, note, student_id)
+            (name, number, start_time, note, student_id)
         )
+    # before the adjust, so an explicitly typed balance still wins
+    _charge_swept_occurrences(cursor, student_id, current_start_time)
+    if left_classes is not None:
+        _adjust_credits_to(cursor, student_id, left_classes, source="edit")
+    _relink_person(cursor, student_id, name, number)
 
     conn.commit()
     conn.close()
@@ -641,12 +1944,14 @@ def update_student_end_date(student_id, new_end_date):
 
 
 def add_attendance(student_id, date_str):
+    """Record attendance and consume that day's credit (once per day, see credit_ledger)."""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
         "INSERT INTO attendance (student_id, date) VALUES (?, ?)",
         (student_id, date_str)
     )
+    _post_credit(cursor, student_id, "consume", -1, date_str, source="attendance")
     conn.commit()
     conn.close()
 
@@ -661,15 +1966,28 @@ def get_attendance_for_student(student_id):
     conn.close()
     return [row[0] for row in rows]
 
-def update_student_left_classes(student_id, new_left_classes):
+def update_student_left_classes(student_id, new_left_classes, source="edit"):
+    """Set Kalan Ders by booking the difference as an 'adjust' event."""
     conn = get_connection()
     cursor = conn.cursor()
+    _adjust_credits_to(cursor, student_id, new_left_classes, source)
+    conn.commit()
+    conn.close()
+
+def get_last_attendance_dates(student_ids):
+    """{student_id: 'YYYY-MM-DD'} of the latest attendance per student (one query)."""
+    if not student_ids:
+        return {}
+    conn = get_connection()
+    cursor = conn.cursor()
+    qmarks = ",".join("?" for _ in student_ids)
     cursor.execute(
-        "UPDATE students SET left_classes=? WHERE id=?",
-        (new_left_classes, student_id)
+        f"SELECT student_id, MAX(date) FROM attendance WHERE student_id IN ({qmarks}) GROUP BY student_id",
+        list(student_ids)
     )
-    conn.commit()
+    result = dict(cursor.fetchall())
     conn.close()
+    return result
 
 def remove_attendance_for_student(student_id, date_str):
     conn = get_connection()
@@ -678,6 +1996,7 @@ def remove_attendance_for_student(student_id, date_str):
         "DELETE FROM attendance WHERE student_id=? AND date=?",
         (student_id, date_str)
     )
+    _refund_attendance_credit(cursor, student_id, date_str)
     conn.commit()
     conn.close()
 
@@ -688,6 +2007,7 @@ def delete_attendance(student_id, date_str):
         "DELETE FROM attendance WHERE student_id = ? AND date = ?",
         (student_id, date_str)
     )
+    _refund_attendance_credit(cursor, student_id, date_str)
     conn.commit()
     conn.close()
 
@@ -696,32 +2016,47 @@ def delete_attendance(student_id, date_str):
 def get_all_hesap_records():
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT isim, miktar, odeme_sekli, ders, notlar FROM hesap_records")
+    cursor.execute("SELECT isim, miktar, odeme_sekli, ders, notlar FROM hesap_records ORDER BY id")
     rows = cursor.fetchall()
     conn.close()
     return rows
 
 def save_all_hesap_records(rows_data):
+    """
+    Store the Hesap table (rows in display order). Compared position by
+    position with what is stored, so one edited cell is one UPDATE instead
+    of rewriting the whole table.
+    """
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM hesap_records")  # Clear existing
-    for row in rows_data:
-        cursor.execute("""
-            INSERT INTO hesap_records (isim, miktar, odeme_sekli, ders, notlar)
-            VALUES (?, ?, ?, ?, ?)
-        """, row)
+    stored = cursor.execute(
+        "SELECT id, isim, miktar, odeme_sekli, ders, notlar FROM hesap_records ORDER BY id"
+    ).fetchall()
+    for (rid, *old), new in zip(stored, rows_data):
+        if tuple(str(v) if v is not None else "" for v in old) != tuple(str(v) for v in new):
+            cursor.execute("""
+                UPDATE hesap_records SET isim=?, miktar=?, odeme_sekli=?, ders=?, notlar=?
+                WHERE id=?
+            """, (*new, rid))
+    cursor.executemany("""
+        INSERT INTO hesap_records (isim, miktar, odeme_sekli, ders, notlar)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows_data[len(stored):])
+    cursor.executemany("DELETE FROM hesap_records WHERE id=?", [(r[0],) for r in stored[len(rows_data):]])
     conn.commit()
     conn.close()
 
 def update_student_start_time_only(student_id, new_start_time):
     conn = get_connection()
     cursor = conn.cursor()
+    old_start = cursor.execute("SELECT start_time FROM students WHERE id=?", (student_id,)).fetchone()
     cursor.execute(
         '''UPDATE students
            SET start_time=?
            WHERE id=?''',
         (new_start_time, student_id)
     )
+    _charge_swept_occurrences(cursor, student_id, old_start[0] if old_start else None)
     conn.commit()
     conn.close()
     print(f"[DEBUG] update_student_start_time_only: Updated start_time for student {student_id} to {new_start_time}")
@@ -741,39 +2076,159 @@ def add_student_back(student, class_id):
     conn.commit()
     conn.close()
 
-# database.py
-def get_students_with_zero_kalan_gun():
+# === WhatsApp outbox ===
+
+def _ensure_outbox(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS whatsapp_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedupe_key TEXT NOT NULL UNIQUE,   -- e.g. 'odeme:p<person_id>:<due date>'
+            student_id INTEGER,
+            phone TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',   -- pending | sent | failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TEXT DEFAULT (datetime('now', 'localtime')),
+            sent_at TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON whatsapp_outbox(status, id)")
+
+
+def enqueue_outbox_message(dedupe_key, student_id, phone, message):
+    """Queue a message once per dedupe_key. Returns False if it was already queued/sent."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT OR IGNORE INTO whatsapp_outbox (dedupe_key, student_id, phone, message)
+        VALUES (?, ?, ?, ?)
+    """, (dedupe_key, student_id, phone, message))
+    queued = cur.rowcount == 1
+    conn.commit()
+    conn.close()
+    return queued
+
+
+def get_pending_outbox(max_attempts, limit=None):
+    """[(id, phone, message, attempts), ...] still waiting to be sent, oldest first."""
+    conn = get_connection()
+    cur = conn.cursor()
+    sql = """
+        SELECT id, phone, message, attempts
+        FROM whatsapp_outbox
+        WHERE status='pending' AND attempts < ?
+        ORDER BY id
+    """
+    params = [max_attempts]
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def mark_outbox_sent(outbox_id):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE whatsapp_outbox
+        SET status='sent', attempts=attempts+1, last_error=NULL,
+            sent_at=datetime('now', 'localtime')
+        WHERE id=?
+    """, (outbox_id,))
+    conn.commit()
+    conn.close()
+
+
+def mark_outbox_failed(outbox_id, error, give_up):
+    """Count a failed attempt; give_up=True parks the message as 'failed'."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE whatsapp_outbox
+        SET attempts=attempts+1, last_error=?, status=?
+        WHERE id=?
+    """, (str(error), "failed" if give_up else "pending", outbox_id))
+    conn.commit()
+    conn.close()
+
+
+def get_students_due_within(days=0, today=None):
+    """
+    Students whose payment date (end_time) is between today and today+days,
+    soonest first: [(id, name, number, class_name, end_time), ...].
+    end_time is stored as YYYY-MM-DD, so the range check runs on idx_students_end_time.
+    """
+    today = today or datetime.today().date()
+    last_day = today + timedelta(days=days)
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT s.id, s.name, s.number, s.start_time, s.end_time, c.name
+        SELECT s.id, s.name, s.number, c.name, s.end_time
         FROM students s
         JOIN classes c ON s.class_id = c.id
-    ''')
-    students = cursor.fetchall()
+        WHERE s.end_time BETWEEN ? AND ?
+        ORDER BY s.end_time, s.name COLLATE NOCASE
+    ''', (today.isoformat(), last_day.isoformat()))
+    rows = cursor.fetchall()
     conn.close()
+    return rows
 
-    zero_kalan_students = []
-    today = datetime.today().date()
-
-    for student_id, name, number, start_str, end_str, class_name in students:
-        try:
-            start_date = datetime.strptime(start_str, "%Y-%m-%d").date()
-            end_date = datetime.strptime(end_str, "%Y-%m-%d").date()
-            kalan_gun = (end_date - today).days
-            if kalan_gun == 0:
-                zero_kalan_students.append((student_id, name, number, class_name))
-        except Exception as e:
-            print(f"[DEBUG] Error parsing dates for student {student_id}: {e}")
-            continue
-
-    return zero_kalan_students
+def get_persons_overview():
+    """
+    One row per person with enrollments:
+    [(person_id, name, number, "Class A, Class B", total left_classes, first end_time), ...]
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT p.id, p.name, COALESCE(NULLIF(p.number, ''), MAX(s.number)),
+               GROUP_CONCAT(DISTINCT c.name), SUM(s.left_classes), MIN(NULLIF(s.end_time, ''))
+        FROM persons p
+        JOIN students s ON s.person_id = p.id
+        JOIN classes c ON c.id = s.class_id
+        GROUP BY p.id
+        ORDER BY p.name COLLATE NOCASE
+    ''')
+    rows = [(pid, name, number, (classes or "").replace(",", ", "), left or 0, end_time)
+            for pid, name, number, classes, left, end_time in cursor.fetchall()]
+    conn.close()
+    return rows
 
-def search_students_by_name_or_number(search_text):
-    from utils import tr_norm
+def get_persons_due_within(days=0, today=None):
+    """
+    get_students_due_within per person: someone in three classes due this week
+    is one row. [(person_id, name, number, "Class A, Class B", first_end_time), ...]
+    """
+    today = today or datetime.today().date()
+    last_day = today + timedelta(days=days)
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.execute('''
+        SELECT p.id, p.name, COALESCE(NULLIF(p.number, ''), MAX(s.number)),
+               GROUP_CONCAT(DISTINCT c.name), MIN(s.end_time)
+        FROM students s
+        JOIN classes c ON s.class_id = c.id
+        JOIN persons p ON p.id = s.person_id
+        WHERE s.end_time BETWEEN ? AND ?
+        GROUP BY p.id
+        ORDER BY MIN(s.end_time), p.name COLLATE NOCASE
+    ''', (today.isoformat(), last_day.isoformat()))
+    rows = [(pid, name, number, (classes or "").replace(",", ", "), end_time)
+            for pid, name, number, classes, end_time in cursor.fetchall()]
+    conn.close()
+    return rows
 
+def get_students_with_zero_kalan_gun():
+    return [(sid, name, number, class_name)
+            for sid, name, number, class_name, _ in get_students_due_within(0)]
+
+def _student_search_where(search_text):
+    """WHERE clause (on alias s) + params matching a name or phone fragment."""
+    from utils import tr_norm
     norm = tr_norm(search_text)
     digits = "".join(ch for ch in str(search_text) if ch.isdigit())
 
@@ -785,6 +2240,7 @@ def search_students_by_name_or_number(search_text):
           REPLACE(
           REPLACE(
           REPLACE(
+          REPLACE(
           REPLACE(LOWER(s.name),
               '̇',''),   -- U+0307 combining dot above
               'ı','i'),
@@ -804,7 +2260,13 @@ def search_students_by_name_or_number(search_text):
         # also remove spaces from number before LIKE to be forgiving
         where += " OR REPLACE(s.number,' ','') LIKE ?"
         params.append(f"%{digits}%")
+    return where, params
+
 
+def search_students_by_name_or_number(search_text):
+    conn = get_connection()
+    cursor = conn.cursor()
+    where, params = _student_search_where(search_text)
     sql = f"""
         SELECT s.id, s.name, s.number, c.name, c.day, c.hour
         FROM students s
@@ -819,16 +2281,139 @@ def search_students_by_name_or_number(search_text):
 
 
 
+def _search_persons_sql(schemas, search_text, include_archive):
+    """
+    One query over the given schemas (main, ATTACHed branches): per schema a
+    CTE of its enrollments and a SELECT of the matching persons, joined with
+    UNION ALL. Rows: (schema index, person_id, name, number, student_id,
+    class_name, day, hour, archived).
+    """
+    where, params = _student_search_where(search_text)
+    ctes, selects, all_params = [], [], []
+    for i, schema in enumerate(schemas):
+        enrollments = f"""
+            SELECT s.id, s.name, s.number, s.person_id, c.name AS cname, c.day, c.hour, 0 AS archived
+            FROM {schema}.students s JOIN {schema}.classes c ON c.id = s.class_id
+        """
+        if include_archive:
+            enrollments += f"""
+            UNION ALL
+            SELECT id, name, number, person_id, class_name, class_day, class_hour, 1
+            FROM {schema}.students_archive
+            """
+        ctes.append(f"e{i} AS ({enrollments})")
+        selects.append(f"""
+            SELECT {i} AS b, p.id AS pid, p.name AS pname, p.number, e.id AS sid,
+                   e.cname, e.day, e.hour, e.archived
+            FROM {schema}.persons p
+            JOIN e{i} AS e ON e.person_id = p.id
+            WHERE p.id IN (SELECT s.person_id FROM e{i} AS s WHERE {where})
+        """)
+        all_params += params
+    sql = (f"WITH {', '.join(ctes)} {' UNION ALL '.join(selects)} "
+           "ORDER BY pname COLLATE NOCASE, b, pid, archived, cname, sid")
+    return sql, all_params
+
+
+def _group_persons(rows):
+    persons = {}
+    for b, person_id, name, number, sid, cname, day, hour, archived in rows:
+        persons.setdefault((b, person_id), (b, person_id, name, number, []))[4].append(
+            (sid, cname, day, hour, bool(archived)))
+    return list(persons.values())
+
+
+def search_persons(search_text, include_archive=False):
+    """
+    Search result grouped per person: a match on any of a person's enrollments
+    lists all of them. Archived enrollments only take part with include_archive.
+    Returns [(person_id, name, number, [(student_id, class_name, day, hour, archived), ...]), ...].
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(*_search_persons_sql(["main"], search_text, include_archive))
+    persons = [p[1:] for p in _group_persons(cursor.fetchall())]
+    conn.close()
+    return persons
+
+
+def _attach_branches(conn):
+    """
+    ATTACH every other branch read-only (b1, b2, ...) to a connection on the
+    active one. Returns [(schema, branch name), ...], ("main", active) first.
+    Missing files and branches not yet migrated to SCHEMA_VERSION are skipped.
+    """
+    schemas = [("main", ACTIVE_BRANCH)]
+    for name, path in BRANCHES.items():
+        if name == ACTIVE_BRANCH or path == DB_PATH:
+            continue
+        if len(schemas) > MAX_ATTACHED_BRANCHES:
+            print(f"[WARNING] En fazla {MAX_ATTACHED_BRANCHES} şube birlikte aranabilir, {name} atlandı")
+            continue
+        if not path.exists():
+            print(f"[WARNING] Şube veritabanı bulunamadı: {name} ({path})")
+            continue
+        alias = f"b{len(schemas)}"
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"{path.as_uri()}?mode=ro",))
+        if conn.execute(f"PRAGMA {alias}.user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.execute(f"DETACH DATABASE {alias}")
+            print(f"[WARNING] {name} şubesinin şeması eski; bir kez aktif şube olarak açılmalı")
+            continue
+        schemas.append((alias, name))
+    return schemas
+
 
-def save_eski_kasa(eski_kasa_value):
+def search_persons_all_branches(search_text, include_archive=False):
+    """
+    search_persons over every branch in a single UNION ALL query on the
+    ATTACHed branch databases. person_id is only unique within a branch.
+    Returns [(branch, person_id, name, number, [(student_id, class_name, day, hour, archived), ...]), ...].
+    """
     conn = get_connection()
+    schemas = _attach_branches(conn)
     cursor = conn.cursor()
+    cursor.execute(*_search_persons_sql([s for s, _ in schemas], search_text, include_archive))
+    persons = [(schemas[b][1], *rest) for b, *rest in _group_persons(cursor.fetchall())]
+    conn.close()
+    return persons
+
 
-    # Clear previous entries (to keep it as a single value)
-    cursor.execute("DELETE FROM kasa_table")
+def get_branch_overview(days=3, today=None):
+    """
+    Per-branch figures in one UNION ALL query over the ATTACHed branches:
+    [(branch, active students, persons, persons due within `days`, attendance today), ...].
+    """
+    today = today or datetime.today().date()
+    conn = get_connection()
+    schemas = _attach_branches(conn)
+    selects, params = [], []
+    for i, (schema, _name) in enumerate(schemas):
+        selects.append(f"""
+            SELECT {i},
+                   (SELECT COUNT(*) FROM {schema}.students s JOIN {schema}.classes c ON c.id = s.class_id
+                    WHERE c.day != 'ESKİLER'),
+                   (SELECT COUNT(*) FROM {schema}.persons),
+                   (SELECT COUNT(DISTINCT person_id) FROM {schema}.students
+                    WHERE end_time BETWEEN ? AND ?),
+                   (SELECT COUNT(*) FROM {schema}.attendance WHERE date = ?)
+        """)
+        params += [today.isoformat(), (today + timedelta(days=days)).isoformat(), today.isoformat()]
+    rows = conn.execute(" UNION ALL ".join(selects), params).fetchall()
+    conn.close()
+    return [(schemas[i][1], *counts) for i, *counts in rows]
 
-    # Insert the new value
-    cursor.execute("INSERT INTO kasa_table (eski_kasa) VALUES (?)", (eski_kasa_value,))
+
+def save_eski_kasa(eski_kasa_value):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Keep it as a single row and update it in place, so an unchanged value
+    # writes nothing to the command log and undo can find the row again
+    cursor.execute("DELETE FROM kasa_table WHERE id < (SELECT MAX(id) FROM kasa_table)")
+    cursor.execute("UPDATE kasa_table SET eski_kasa=? WHERE eski_kasa IS NOT ?",
+                   (eski_kasa_value, eski_kasa_value))
+    if cursor.execute("SELECT 1 FROM kasa_table").fetchone() is None:
+        cursor.execute("INSERT INTO kasa_table (eski_kasa) VALUES (?)", (eski_kasa_value,))
 
     conn.commit()
     conn.close()
@@ -842,14 +2427,9 @@ def get_eski_kasa():
     return row[0] if row else 0
 
 def update_student_left_classes_based_on_single_day(student_id, single_day):
-    idx = _day_token_to_index(single_day)
-    if idx is None:
-        print("[DEBUG] Selected day not recognized:", single_day)
-        return
-    target_day_idx = idx
-
+    target_day_idx = _day_token_to_index(single_day)
     if target_day_idx is None:
-        print("[DEBUG] Selected day not recognized.")
+        print("[DEBUG] Selected day not recognized:", single_day)
         return
 
     conn = get_connection()
@@ -861,42 +2441,18 @@ def update_student_left_classes_based_on_single_day(student_id, single_day):
         conn.close()
         return
 
-    start_date = datetime.strptime(row[0], "%Y-%m-%d").date()
-    end_date = datetime.strptime(row[1], "%Y-%m-%d").date()
-    today = datetime.today().date()
-
-    # Count total classes for this day
-    total_classes = 0
-    current_date = start_date
-    while current_date < end_date:
-        if current_date.weekday() == target_day_idx:
-            total_classes += 1
-        current_date += timedelta(days=1)
-
-    # Count passed classes up to today
-    classes_passed = 0
-    current_date = start_date
-    while current_date <= today and current_date < end_date:
-        if current_date.weekday() == target_day_idx:
-            classes_passed += 1
-        current_date += timedelta(days=1)
-
-    left_classes = total_classes - classes_passed
-
-    # Allow negative values if today is past end_date
-    if today > end_date:
-        after_end_date = end_date + timedelta(days=1)
-        while after_end_date <= today:
-            if after_end_date.weekday() == target_day_idx:
-                left_classes -= 1
-            after_end_date += timedelta(days=1)
+    # Same rule as the roster recompute, but with only the selected weekday;
+    # allowed to go negative when today is past end_date
+    left_classes = lesson_calendar.left_classes(
+        [row[0]], [row[1]], [target_day_idx], datetime.today().date(), get_closure_dates()
+    )[0]
+    if left_classes is None:
+        conn.close()
+        return
 
     print(f"[DEBUG] Updated single-day left_classes for student {student_id}: {left_classes}")
 
-    cursor.execute(
-        "UPDATE students SET left_classes=? WHERE id=?",
-        (left_classes, student_id)
-    )
+    _adjust_credits_to(cursor, student_id, left_classes, source="single_day")
     conn.commit()
     conn.close()
 
@@ -906,24 +2462,28 @@ def add_student_to_class_with_dates(class_id, name, number, start_date, end_date
     cursor.execute(
         '''
         INSERT INTO students (class_id, name, number, start_time, end_time, left_classes, info)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, 0, ?)
         ''',
-        (class_id, name, number, start_date, end_date, left_classes, note)
+        (class_id, name, number, start_date, end_date, note)
     )
     new_id = cursor.lastrowid
+    _post_credit(cursor, new_id, "purchase", left_classes, start_date, source="import")
+    _charge_swept_occurrences(cursor, new_id)
+    _link_person(cursor, new_id, name, number)
     conn.commit()
     conn.close()
     return new_id
 
 def get_students_by_ids(ids):
-    """Return full student rows for the given id list."""
+    """Return [Student, ...] for the given id list."""
     if not ids:
         return []
     conn = get_connection()
     cursor = conn.cursor()
+    cursor.row_factory = Student.from_row
     qmarks = ",".join("?" for _ in ids)
     cursor.execute(f"""
-        SELECT id, class_id, name, number, start_time, end_time, left_classes, info
+        SELECT {STUDENT_COLUMNS}
         FROM students
         WHERE id IN ({qmarks})
         ORDER BY id
@@ -936,28 +2496,40 @@ def get_students_by_ids(ids):
 def restore_students(rows):
     """
     Reinsert students as they were (keeps original IDs).
-    Each row must be: (id, class_id, name, number, start_time, end_time, left_classes, info)
+    rows are Student records, e.g. from get_students_by_ids().
     """
     if not rows:
         return
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.executemany("""
+    cursor.executemany(f"""
         INSERT OR REPLACE INTO students
-        (id, class_id, name, number, start_time, end_time, left_classes, info)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, rows)
+        ({STUDENT_COLUMNS})
+        VALUES ({", ".join("?" for _ in Student._fields)})
+    """, [tuple(Student._make(r)) for r in rows])
+    # a person dropped meanwhile (renamed sibling row) is re-matched
+    cursor.execute("""
+        UPDATE students SET person_id=NULL
+        WHERE person_id IS NOT NULL AND person_id NOT IN (SELECT id FROM persons)
+    """)
+    _link_unlinked_students(cursor)
     conn.commit()
     conn.close()
 
 def get_all_class_instances():
     """
-    Returns [(id, name, day, hour), ...] for every class row.
+    Returns [ClassInstance(id, name, day, hour), ...] for every class row.
     """
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT id, name, day, hour FROM classes ORDER BY name, day, hour")
+    cur.row_factory = ClassInstance.from_row
+    cur.execute(f"SELECT {CLASS_COLUMNS} FROM classes ORDER BY name, day, hour")
     rows = cur.fetchall()
     conn.close()
     return rows
 
+
+
+# Time every function above (see profiling.py); keep this at the end of the module.
+from profiling import instrument_module
+instrument_module(globals(), "db")
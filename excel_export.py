@@ -0,0 +1,259 @@
+# excel_export.py
+"""
+Excel exports of the class lists, without any Qt code so they can be run
+from the UI, the benchmarks or the command line.
+
+Both exports write one sheet per sub-class with the same layout:
+A NUMARA, B ADI SOYADI, C TELEFON, D BAŞLANGIÇ, E ÖDEME, F KALAN GÜN, G <TODAY>
+export_all_classes adds a KİŞİLER sheet with one row per person across classes.
+"""
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from database import (
+    get_unique_class_names, get_class_times_by_name, get_class_id, get_students_by_class_id,
+    get_branch_storage_root, get_persons_overview,
+)
+from utils import lazy_import
+
+pd = lazy_import("pandas")
+
+COLUMNS = ["NUMARA", "ADI SOYADI", "TELEFON", "BAŞLANGIÇ TARİHİ", "ÖDEME TARİHİ", "KALAN GÜN", ""]
+COL_WIDTHS = [9, 30, 20, 18, 18, 12, 16]  # a bit wider for phone/dates
+PERIOD_DAYS = 28
+PERSON_COLUMNS = ["ADI SOYADI", "TELEFON", "DERSLER", "KALAN DERS", "İLK ÖDEME TARİHİ"]
+PERSON_COL_WIDTHS = [30, 20, 40, 12, 18]
+PERSONS_SHEET = "KİŞİLER"
+
+
+def default_export_dir() -> Path:
+    path = get_branch_storage_root() / "Dersler"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def parse_end_date(s):
+    if not s:
+        return None
+    txt = str(s).strip()
+    try:
+        # 1) ISO: 2025-10-01 or 2025/10/01 or 2025.10.01  -> year-first
+        if re.fullmatch(r"\d{4}[-/.]\d{2}[-/.]\d{2}", txt):
+            t = txt.replace("/", "-").replace(".", "-")
+            return datetime.strptime(t, "%Y-%m-%d")
+
+        # 2) Day-first: 01-10-2025, 01/10/2025, 01.10.2025  -> Turkish style
+        if re.fullmatch(r"\d{2}[-/.]\d{2}[-/.]\d{4}", txt):
+            t = txt.replace("/", "-").replace(".", "-")
+            return datetime.strptime(t, "%d-%m-%Y")
+
+        # 3) Fallback: let pandas try day-first (no warning because ISO already handled)
+        dt = pd.to_datetime(txt, errors="coerce", dayfirst=True)
+        if pd.isna(dt):
+            return None
+        return dt.to_pydatetime()
+    except Exception:
+        return None
+
+
+def _unique_path(base_path, stem):
+    file_path = base_path / f"{stem}.xlsx"
+    n = 1
+    while file_path.exists():
+        file_path = base_path / f"{stem} ({n}).xlsx"
+        n += 1
+    return file_path
+
+
+SHEET_NAME_MAX = 31   # Excel's limit; xlsxwriter raises InvalidWorksheetName beyond it
+
+
+def _sheet_name(name, used):
+    """
+    Excel-safe, unique sheet name: forbidden characters become '-', long
+    names are cut to SHEET_NAME_MAX and clashes get a ' (2)', ' (3)' ... suffix.
+    `used` is the set of lower-cased names already in the workbook.
+    """
+    base = re.sub(r"[\[\]:*?/\\]", "-", name).strip("'") or "Sayfa"
+    candidate = base[:SHEET_NAME_MAX]
+    n = 2
+    while candidate.lower() in used:
+        suffix = f" ({n})"
+        candidate = base[:SHEET_NAME_MAX - len(suffix)] + suffix
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def _open_writer(file_path):
+    writer = pd.ExcelWriter(str(file_path), engine="xlsxwriter")
+    wb = writer.book
+    # Force Excel to recalc formulas on open (supports old & new XlsxWriter)
+    if hasattr(wb, "set_calc_on_load"):
+        wb.set_calc_on_load()   # newer XlsxWriter
+    else:
+        wb.calc_on_load = True  # older XlsxWriter: it's a boolean attribute
+
+    fmts = {
+        "header": wb.add_format({
+            "bold": True, "font_color": "white", "align": "center",
+            "valign": "vcenter", "bg_color": "#1f4e79", "border": 1
+        }),
+        "center": wb.add_format({"align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"}),
+        "phone": wb.add_format({"align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"}),
+        # Use Turkish-looking format with dashes
+        "date": wb.add_format({"num_format": "dd-mm-yyyy", "align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"}),
+        "date_mdy": wb.add_format({"num_format": "mm/dd/yyyy", "align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"}),
+        # conditional colors for KALAN GÜN (F)
+        "kalan_green": {"type": "cell", "criteria": ">=", "value": 0, "format": wb.add_format({"bg_color": "#c6efce", "border": 1})},
+        "kalan_pink": {"type": "cell", "criteria": "<", "value": 0, "format": wb.add_format({"bg_color": "#f8cbad", "border": 1})},
+    }
+    return writer, fmts
+
+
+def _write_class_sheet(writer, fmts, sheet, students, end_formula):
+    """One sub-class sheet; end_formula is the ÖDEME TARİHİ formula with {row} for the row number."""
+    rows = [{
+        "NUMARA": i,
+        "ADI SOYADI": s.name or "",
+        "TELEFON": s.number or "",
+        "BAŞLANGIÇ TARİHİ": "",   # computed from end date (28 days before)
+        "ÖDEME TARİHİ": "",        # formula (D + 28)
+        "KALAN GÜN": "",
+        "": ""
+    } for i, s in enumerate(students, start=1)]
+    df = pd.DataFrame(rows, columns=COLUMNS)
+
+    df.to_excel(writer, sheet_name=sheet, index=False)
+    ws = writer.sheets[sheet]
+
+    for col, width in enumerate(COL_WIDTHS):
+        ws.set_column(col, col, width)
+    ws.set_row(0, 20)  # no global style
+
+    # re-write A1..F1 in blue, G1 stays normal (yellow date cell)
+    for c in range(6):
+        ws.write(0, c, COLUMNS[c], fmts["header"])
+    ws.write(0, 6, "BUGÜN", fmts["center"])                 # G1 title (not blue)
+    ws.write_formula(1, 6, "=TODAY()", fmts["date"])        # G2 holds TODAY(); all rows point to $G$2
+
+    for r in range(len(df)):
+        excel_row = r + 1
+        rownum = excel_row + 1
+
+        ws.write(excel_row, 0, df.iloc[r, 0], fmts["center"])  # NUMARA
+        ws.write(excel_row, 1, df.iloc[r, 1], fmts["center"])  # ADI SOYADI
+        ws.write(excel_row, 2, df.iloc[r, 2], fmts["phone"])   # TELEFON
+
+        # D = start = (end_from_db - 28) as REAL date (if end present)
+        end_dt = parse_end_date(students[r].end_time)
+        if end_dt is not None:
+            ws.write_datetime(excel_row, 3, end_dt - timedelta(days=PERIOD_DAYS), fmts["date_mdy"])
+        else:
+            ws.write_blank(excel_row, 3, None, fmts["date_mdy"])  # blank cell, not a text ""
+
+        ws.write_formula(excel_row, 4, end_formula.format(row=rownum), fmts["date_mdy"])
+        # F (KALAN GÜN) = E{row} - $G$2  (remaining days)
+        ws.write_formula(excel_row, 5, f'=IF(E{rownum}="","",E{rownum}-$G$2)', fmts["center"])
+
+    last_row = len(df) + 1
+    ws.conditional_format(f"F2:F{last_row}", fmts["kalan_green"])
+    ws.conditional_format(f"F2:F{last_row}", fmts["kalan_pink"])
+    ws.freeze_panes(1, 0)
+
+
+def _write_persons_sheet(writer, fmts, persons):
+    """Per-person summary: all classes of a person, summed Kalan Ders, earliest payment date."""
+    df = pd.DataFrame([(name or "", number or "", classes, left, "")
+                       for _pid, name, number, classes, left, _end in persons], columns=PERSON_COLUMNS)
+    df.to_excel(writer, sheet_name=PERSONS_SHEET, index=False)
+    ws = writer.sheets[PERSONS_SHEET]
+    for col, width in enumerate(PERSON_COL_WIDTHS):
+        ws.set_column(col, col, width)
+    for c, title in enumerate(PERSON_COLUMNS):
+        ws.write(0, c, title, fmts["header"])
+    for r, (_pid, name, number, classes, left, end_time) in enumerate(persons, start=1):
+        ws.write(r, 0, name or "", fmts["center"])
+        ws.write(r, 1, number or "", fmts["phone"])
+        ws.write(r, 2, classes, fmts["center"])
+        ws.write(r, 3, left, fmts["center"])
+        end_dt = parse_end_date(end_time)
+        if end_dt is not None:
+            ws.write_datetime(r, 4, end_dt, fmts["date"])
+        else:
+            ws.write_blank(r, 4, None, fmts["date"])
+    ws.freeze_panes(1, 0)
+
+
+def export_all_classes(base_path=None):
+    """
+    All sub-classes into one workbook (<DATE>.xlsx), plus the KİŞİLER summary.
+    Returns {"file": path, "sheets": int, "rows": int}; sheets == 0 means no data.
+    """
+    base_path = Path(base_path) if base_path else default_export_dir()
+    file_path = _unique_path(base_path, datetime.today().strftime("%d-%m-%Y"))
+    writer, fmts = _open_writer(file_path)
+
+    sheets = rows = 0
+    used_names = {PERSONS_SHEET.lower()}
+    for class_name in get_unique_class_names():
+        for day, hour in get_class_times_by_name(class_name):
+            students = get_students_by_class_id(get_class_id(class_name, day, hour))
+            if not students:
+                continue
+            sheet = _sheet_name(f"{class_name}_{day}_{hour}", used_names)
+            # E (ÖDEME TARİHİ) = SUM(D{row}+28) — no IF guard, use real date format
+            _write_class_sheet(writer, fmts, sheet, students, "=SUM(D{row}+28)")
+            sheets += 1
+            rows += len(students)
+
+    if sheets:
+        _write_persons_sheet(writer, fmts, get_persons_overview())
+    writer.close()
+    return {"file": file_path, "sheets": sheets, "rows": rows}
+
+
+def export_per_class(base_path=None):
+    """
+    One workbook per CLASS (<DATE> - HipHop.xlsx, ...), one sheet per sub-class.
+    Files without any students are removed again.
+    Returns {"files": [paths], "sheets": int, "rows": int}.
+    """
+    base_path = Path(base_path) if base_path else default_export_dir()
+    today_str = datetime.today().strftime("%d-%m-%Y")
+    files, sheets, rows = [], 0, 0
+
+    for class_name in get_unique_class_names():
+        times = get_class_times_by_name(class_name)
+        if not times:
+            continue
+
+        safe_name = re.sub(r'[^\w\s\-\u00C0-\u024F]', "_", class_name).strip()
+        file_path = _unique_path(base_path, f"{today_str} - {safe_name}")
+        writer, fmts = _open_writer(file_path)
+
+        class_has_data = False
+        used_names = set()
+        for day, hour in times:
+            students = get_students_by_class_id(get_class_id(class_name, day, hour))
+            if not students:
+                continue
+            class_has_data = True
+            sheet = _sheet_name(f"{day} {hour}", used_names)
+            _write_class_sheet(writer, fmts, sheet, students, '=IF(D{row}="", "", D{row}+28)')
+            sheets += 1
+            rows += len(students)
+
+        writer.close()
+        if class_has_data:
+            files.append(file_path)
+        else:
+            # remove empty file (no students in any sub-class)
+            try:
+                os.remove(str(file_path))
+            except Exception:
+                pass
+
+    return {"files": files, "sheets": sheets, "rows": rows}
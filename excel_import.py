@@ -0,0 +1,176 @@
+# excel_import.py
+"""
+Core of the "Excel'den içe aktar" feature without any Qt code:
+header matching (TR/diacritics/whitespace tolerant), robust date parsing
+and the inserts. StudentManager.import_students_from_excel_for_class wraps
+it with the file/sheet pickers; benchmarks call it directly.
+"""
+import math
+import re
+from datetime import datetime, timedelta
+
+from database import (
+    add_student_to_class_with_dates, get_class_weekdays, get_closure_dates,
+)
+from utils import lazy_import, format_phone_number
+import lesson_calendar
+
+pd = lazy_import("pandas")
+
+PERIOD = timedelta(days=28)
+
+NAME_HEADERS = ("ad soyad", "adi soyadi", "adı soyadı", "isim", "name", "ad")
+PHONE_HEADERS = ("telefon", "telefon no", "gsm", "numara", "phone")
+START_HEADERS = ("başlangıç tarihi", "baslangic tarihi", "başlangıç", "baslangic", "start", "start date", "start_time")
+END_HEADERS = ("ödeme tarihi", "odeme tarihi", "bitiş tarihi", "bitis tarihi", "bitiş", "bitis", "end", "end date", "end_time")
+
+
+def _is_blank(x):
+    if x is None:
+        return True
+    try:
+        if (isinstance(x, float) and math.isnan(x)) or pd.isna(x):
+            return True
+    except Exception:
+        pass
+    s = str(x).strip()
+    return s == "" or s.lower() in ("nan", "nat")
+
+
+def _norm(s: str) -> str:
+    # lowercase, strip, remove diacritics and non-alphanumerics
+    if not isinstance(s, str):
+        s = "" if s is None else str(s)
+    s = s.strip().lower()
+    tr = {
+        "ı":"i","ğ":"g","ş":"s","ç":"c","ö":"o","ü":"u",
+        "â":"a","î":"i","û":"u",
+        "İ":"i","Ğ":"g","Ş":"s","Ç":"c","Ö":"o","Ü":"u"
+    }
+    for k,v in tr.items(): s = s.replace(k,v)
+    s = re.sub(r"\s+", " ", s)        # collapse spaces
+    s = re.sub(r"[\u00a0]", " ", s)  # NBSP -> space
+    s = re.sub(r"[^a-z0-9 ]", "", s)
+    return s
+
+
+def _find_col(df_cols, *cands):
+    # build normalized map once
+    nmap = {_norm(c): c for c in df_cols}
+    wants = [_norm(c) for c in cands]
+    # exact
+    for w in wants:
+        if w in nmap: return nmap[w]
+    # substring fallback
+    for w in wants:
+        for key, orig in nmap.items():
+            if w and w in key:
+                return orig
+    return None
+
+
+def parse_date(val):
+    """Return a datetime (not date) or None. Tries day-first and month-first and Excel serials."""
+    if _is_blank(val):
+        return None
+    # already a timestamp?
+    try:
+        if hasattr(val, "to_pydatetime"):
+            return val.to_pydatetime()
+    except Exception:
+        pass
+    # Excel serial number?
+    try:
+        if isinstance(val, (int, float)) and not math.isnan(val):
+            # pandas handles excel serials if we pass origin='1899-12-30'
+            ts = pd.to_datetime(val, unit="D", origin="1899-12-30", errors="coerce")
+            if not pd.isna(ts):
+                return ts.to_pydatetime()
+    except Exception:
+        pass
+    # string parse
+    s = str(val).strip()
+    for dayfirst in (True, False):
+        ts = pd.to_datetime(s, errors="coerce", dayfirst=dayfirst)
+        if not pd.isna(ts):
+            return ts.to_pydatetime()
+    return None
+
+
+def list_sheet_names(path):
+    return pd.ExcelFile(path).sheet_names
+
+
+def _opening_credits(start_dt, end_dt, class_days, today, holidays, default):
+    """Date-derived Kalan Ders for an imported row, booked as its purchase event."""
+    left = lesson_calendar.left_classes([start_dt.date()], [end_dt.date()], class_days, today, holidays)[0]
+    return default if left is None else left
+
+
+def import_students_from_sheets(path, sheet_names, class_id):
+    """
+    Import the rows of the given sheets into class_id.
+    Returns (imported_count, errors) where errors is a list of readable messages.
+    """
+    # opening credits: lessons left until the sheet's end date; 4 weeks when unknown
+    try:
+        class_days = get_class_weekdays(class_id)
+    except Exception:
+        class_days = []
+    default_left = 4 * (len(class_days) or 1)
+    holidays = get_closure_dates()
+    today = datetime.today().date()
+
+    total = 0
+    errors = []
+
+    for sname in sheet_names:
+        try:
+            df = pd.read_excel(path, sheet_name=sname)
+        except Exception as e:
+            errors.append(f"[{sname}] okunamadı: {e}")
+            continue
+        if df.empty:
+            continue
+
+        name_col  = _find_col(df.columns, *NAME_HEADERS)
+        phone_col = _find_col(df.columns, *PHONE_HEADERS)
+        start_col = _find_col(df.columns, *START_HEADERS)
+        end_col   = _find_col(df.columns, *END_HEADERS)
+
+        if not name_col:
+            errors.append(f"[{sname}] 'Ad/İsim' kolonu bulunamadı.")
+            continue
+
+        for _, row in df.iterrows():
+            raw_name = row.get(name_col, "")
+            if _is_blank(raw_name):
+                continue
+            name  = str(raw_name).strip()
+            raw_phone = row.get(phone_col, "") if phone_col else ""
+            phone = format_phone_number("" if _is_blank(raw_phone) else str(raw_phone))
+
+            sdt = parse_date(row.get(start_col)) if start_col else None
+            edt = parse_date(row.get(end_col))   if end_col   else None
+
+            if not sdt and edt: sdt = edt - PERIOD
+            if not edt and sdt: edt = sdt + PERIOD
+            if not sdt and not edt:
+                sdt = datetime.today()
+                edt = sdt + PERIOD
+
+            try:
+                add_student_to_class_with_dates(
+                    class_id=class_id,
+                    name=name,
+                    number=phone,
+                    start_date=sdt.strftime("%Y-%m-%d"),
+                    end_date=edt.strftime("%Y-%m-%d"),
+                    note="",
+                    left_classes=_opening_credits(sdt, edt, class_days, today, holidays, default_left)
+                )
+                total += 1
+            except Exception as e:
+                errors.append(f"[{sname}] '{name}' eklenemedi: {e}")
+
+    return total, errors
@@ -7,9 +7,13 @@ from database import get_all_hesap_records, save_all_hesap_records, save_eski_ka
 from PyQt5.QtGui import QPixmap, QPainter, QFont
 from datetime import datetime
 import os
-import pandas as pd
 from pathlib import Path
-from database import get_storage_root
+from database import get_branch_storage_root
+from sql_trace import sql_action
+from command_log import undoable
+from utils import lazy_import
+
+pd = lazy_import("pandas")  # only needed by save_to_excel
 
 
 PROJECT_ROOT = Path(__file__).resolve().parent
@@ -105,7 +109,8 @@ class HesapDialog(QDialog):
         try:
             txt = self.eski_kasa_input.text().replace(",", ".").strip()
             value = float(txt) if txt else 0.0
-            save_eski_kasa(value)
+            with sql_action("ui.save_eski_kasa"), undoable("Eski kasa", coalesce=True):
+                save_eski_kasa(value)
             # optional: print/log
             # print(f"[INFO] Eski Kasa saved: {value}")
         except Exception as e:
@@ -114,6 +119,8 @@ class HesapDialog(QDialog):
             pass
 
 
+    @sql_action("ui.save_hesap")
+    @undoable("Hesap düzenleme", coalesce=True)
     def save_data_to_db(self):
         rows_data = []
         for row in range(self.table.rowCount()):
@@ -176,7 +183,7 @@ class HesapDialog(QDialog):
         from PyQt5.QtWidgets import QMessageBox
         date_str = datetime.today().strftime("%d-%m-%Y")
 
-        dir_path = get_storage_root() / "hesap" / "exceller"
+        dir_path = get_branch_storage_root() / "hesap" / "exceller"
         dir_path.mkdir(parents=True, exist_ok=True)
 
         path = dir_path / f"{date_str}.xlsx"
@@ -206,7 +213,7 @@ class HesapDialog(QDialog):
         from PyQt5.QtWidgets import QMessageBox
         date_str = datetime.today().strftime("%d-%m-%Y")
 
-        dir_path = get_storage_root() / "hesap" / "photo"
+        dir_path = get_branch_storage_root() / "hesap" / "photo"
         dir_path.mkdir(parents=True, exist_ok=True)
 
         path = dir_path / f"{date_str}.png"
@@ -265,6 +272,20 @@ class HesapDialog(QDialog):
         self.table.insertRow(row_count)
         self.add_new_row_button()  # Move "+" button to new bottom
 
+    def reload(self):
+        """Re-read the table and Eski Kasa from the DB (after an undo/redo)."""
+        self.table.blockSignals(True)
+        self.eski_kasa_input.blockSignals(True)
+        try:
+            self.table.setRowCount(0)
+            self.load_data_from_db()
+            self.add_new_row_button()
+            self.load_eski_kasa()
+        finally:
+            self.table.blockSignals(False)
+            self.eski_kasa_input.blockSignals(False)
+        self.update_kasa()
+
     def load_eski_kasa(self):
         from database import get_eski_kasa  # You need to define this in database.py
         eski_kasa = get_eski_kasa()
@@ -0,0 +1,102 @@
+# lesson_calendar.py
+"""
+Lesson counting on top of numpy's business-day functions.
+
+A class's lesson days are its weekday mask (classes.weekday_mask) and the
+studio closures (closures table) are the holidays, so
+numpy.busday_count / busday_offset count and step over real lessons for a
+whole array of students in one call instead of walking day by day.
+
+Dates go in as ISO strings or datetime.date. Lesson counts come back as
+plain int lists, end dates as a numpy datetime64[D] array.
+"""
+from datetime import date
+
+from utils import lazy_import
+
+np = lazy_import("numpy")
+
+
+def weekmask(class_days):
+    """[0, 2] (Mon, Wed) -> [1, 0, 1, 0, 0, 0, 0] as numpy expects it."""
+    days = set(class_days)
+    return [1 if wd in days else 0 for wd in range(7)]
+
+
+def holiday_array(holidays):
+    return np.array(sorted(set(holidays or ())), dtype="datetime64[D]")
+
+
+def lesson_calendar(class_days, holidays=()):
+    """numpy.busdaycalendar for a class, or None when it has no lesson day (e.g. ESKİLER)."""
+    mask = weekmask(class_days)
+    if not any(mask):
+        return None   # numpy refuses an all-zero weekmask
+    return np.busdaycalendar(weekmask=mask, holidays=holiday_array(holidays))
+
+
+def to_days(values):
+    """
+    Convert ISO strings / dates to a datetime64[D] array.
+    Empty or unparseable values become NaT instead of raising.
+    """
+    values = [v.strftime("%Y-%m-%d") if isinstance(v, date) else (str(v).strip() if v else "") for v in values]
+    try:
+        return np.array(values, dtype="datetime64[D]")
+    except ValueError:
+        out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[D]")
+        for i, v in enumerate(values):
+            try:
+                out[i] = np.datetime64(v, "D")
+            except ValueError:
+                pass
+        return out
+
+
+def _day(value):
+    return np.datetime64(value.strftime("%Y-%m-%d") if isinstance(value, date) else value, "D")
+
+
+def left_classes(start_dates, end_dates, class_days, today, holidays=()):
+    """
+    Date-derived Kalan Ders: lessons after today and before the end date,
+    minus the lessons already held after an end date that has passed. Used
+    for opening balances and the single-day recompute. Rows with an unparseable start or
+    end date come back as None (left unchanged by the caller).
+    """
+    start, end = to_days(start_dates), to_days(end_dates)
+    valid = ~(np.isnat(start) | np.isnat(end))
+    result = np.zeros(len(end), dtype=np.int64)
+    cal = lesson_calendar(class_days, holidays)
+    if cal is not None and valid.any():
+        s, e = start[valid], end[valid]
+        tomorrow = _day(today) + 1
+        ahead = np.busday_count(np.maximum(s, tomorrow), e, busdaycal=cal)
+        overdue = np.busday_count(e + 1, tomorrow, busdaycal=cal)
+        result[valid] = np.maximum(ahead, 0) - np.where(e < tomorrow - 1, overdue, 0)
+    return [int(v) if ok else None for v, ok in zip(result.tolist(), valid.tolist())]
+
+
+def extend_end_dates(end_dates, additional, class_days, holidays=()):
+    """
+    New end dates after adding `additional` lessons (scalar or per row).
+    An end date that is not a lesson day moves to the 2nd lesson after it,
+    like the old extend_end_date. Without lesson days the dates stay as they are.
+    """
+    end = to_days(end_dates)
+    cal = lesson_calendar(class_days, holidays)
+    if cal is None:
+        return end
+    valid = ~np.isnat(end)
+    out = end.copy()
+    e = end[valid]
+    steps = np.broadcast_to(np.asarray(additional), end.shape)[valid]
+    steps = np.where(np.is_busday(e, busdaycal=cal), steps, 2)
+    # roll back to the previous lesson, then step forward: lands on the n-th lesson after e
+    out[valid] = np.busday_offset(e, steps, roll="backward", busdaycal=cal)
+    return out
+
+
+def extend_end_date(end_date, additional, class_days, holidays=()):
+    """Single-student convenience wrapper around extend_end_dates; returns a date."""
+    return extend_end_dates([end_date], additional, class_days, holidays)[0].astype(object)
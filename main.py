@@ -1,18 +1,54 @@
 import sys
+import time
 from PyQt5.QtWidgets import QApplication
-from database import init_db, update_left_classes_for_all_students
+from database import init_db, sweep_credit_consumption, archive_inactive_students, auto_archive_enabled
 from ui.main_window import MainWindow  # Adjust the import path!
+from ui.workers import FunctionWorker
+from sql_trace import sql_action
 
-def main():
-    # Initialize DB
+_T0 = time.perf_counter()
+
+def log_phase(name, started):
+    now = time.perf_counter()
+    print(f"[STARTUP] {name}: {(now - started) * 1000:.0f} ms (t+{(now - _T0) * 1000:.0f} ms)")
+    return now
+
+@sql_action("startup.prepare_database")
+def prepare_database():
+    """Migrations + archive policy + lesson credit sweep; runs on a worker thread. Returns the archived count."""
+    t = time.perf_counter()
     init_db()
-    update_left_classes_for_all_students()  # Update left classes on startup
-    
+    t = log_phase("init_db", t)
+    # long-inactive students leave the hot tables (off with DANCE_AUTO_ARCHIVE=0)
+    archived = archive_inactive_students() if auto_archive_enabled() else 0
+    t = log_phase("archive", t)
+    sweep_credit_consumption()  # charge lessons held since the last start, roll the calendar
+    log_phase("credit sweep", t)
+    return archived
 
-    # Create app and show main window
+def main():
+    t = time.perf_counter()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    t = log_phase("window shell", t)
+    heavy = [m for m in ("pandas", "xlsxwriter", "pywhatkit") if m in sys.modules]
+    if heavy:
+        print(f"[WARNING] Loaded before first paint: {', '.join(heavy)}")
+
+    # Initialize DB off the UI thread, then let the window fill its tabs
+    def on_ready(archived):
+        started = time.perf_counter()
+        window.on_data_ready(archived)
+        log_phase("load classes", started)
+        log_phase("startup total", _T0)
+
+    worker = FunctionWorker(prepare_database, parent=window)
+    worker.succeeded.connect(on_ready)
+    worker.failed.connect(window.on_data_failed)
+    window._startup_worker = worker
+    worker.start()
+
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+# outbox.py
+"""
+Dispatcher for the persistent whatsapp_outbox table.
+
+Messages are queued once per dedupe key (see database.enqueue_outbox_message)
+and sent here with a minimum gap between sends. Each run tries a message
+once; a failure stays pending in the table for the next run, until
+max_attempts failed runs park it as 'failed'. One unreachable number
+therefore never holds up a cron `remind` run.
+"""
+import time
+
+from database import get_pending_outbox, mark_outbox_sent, mark_outbox_failed
+
+
+class OutboxDispatcher:
+    def __init__(self, transport, min_interval=20.0, max_attempts=3,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.transport = transport
+        self.min_interval = min_interval    # seconds between two sends
+        self.max_attempts = max_attempts    # per message, one attempt per run
+        self._sleep = sleep
+        self._clock = clock
+        self._last_send = None
+
+    def _wait_for_slot(self):
+        if self._last_send is None:
+            return
+        remaining = self.min_interval - (self._clock() - self._last_send)
+        if remaining > 0:
+            self._sleep(remaining)
+
+    def _send_once(self, outbox_id, phone, message, attempts):
+        """Returns (sent, gave_up, error)."""
+        self._wait_for_slot()
+        try:
+            self._last_send = self._clock()
+            self.transport.send(phone, message)
+        except Exception as e:
+            give_up = attempts + 1 >= self.max_attempts
+            mark_outbox_failed(outbox_id, e, give_up)
+            return False, give_up, str(e)
+        mark_outbox_sent(outbox_id)
+        return True, False, None
+
+    def run(self, limit=None):
+        """
+        Try every pending message once. Returns a summary dict:
+        {"sent": int, "failed": int, "gave_up": int, "retried": int, "errors": [(phone, error), ...]}
+        "retried" counts messages that had failed in an earlier run, "gave_up"
+        the failures of this run that used up max_attempts.
+        """
+        summary = {"sent": 0, "failed": 0, "gave_up": 0, "retried": 0, "errors": []}
+        for outbox_id, phone, message, attempts in get_pending_outbox(self.max_attempts, limit):
+            if attempts:
+                summary["retried"] += 1
+            sent, gave_up, error = self._send_once(outbox_id, phone, message, attempts)
+            if sent:
+                summary["sent"] += 1
+            else:
+                summary["failed"] += 1
+                summary["gave_up"] += gave_up
+                summary["errors"].append((phone, error))
+        return summary
+
+
+def format_summary(summary, queued=0, skipped=()):
+    """One human readable report instead of a popup per message."""
+    lines = [f"Gönderilen mesaj: {summary['sent']}"]
+    if queued:
+        lines.insert(0, f"Kuyruğa eklenen: {queued}")
+    if summary["retried"]:
+        lines.append(f"Tekrar denenen: {summary['retried']}")
+    if summary["failed"]:
+        later = summary["failed"] - summary.get("gave_up", 0)
+        lines.append(f"Gönderilemeyen: {summary['failed']}"
+                     + (f" ({later} tanesi bir sonraki gönderimde tekrar denenecek)" if later else ""))
+        lines.extend(f"  - {phone}: {err}" for phone, err in summary["errors"])
+    if skipped:
+        lines.append("Numarası olmayan: " + ", ".join(skipped))
+    return "\n".join(lines)
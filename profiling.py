@@ -0,0 +1,130 @@
+# profiling.py
+"""
+Lightweight timing spans for the hot paths (database.py calls, table
+refreshes, Excel exports).
+
+    with span("ui.refresh_student_table"):
+        ...
+
+    @profiled("export.all_classes")
+    def save_all_classes_to_excel(...): ...
+
+Each name keeps a call count, total time and the last RING_SIZE durations
+(for p95). Set DANCE_PROFILE=/path/to/profile.json to dump the numbers on
+exit; inside the app Ctrl+Shift+P opens the developer panel.
+"""
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RING_SIZE = 512          # durations kept per span name
+PROFILE_ENV = "DANCE_PROFILE"
+
+_lock = threading.Lock()
+_counts = {}
+_totals = {}
+_samples = {}
+
+
+def record(name, seconds):
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + 1
+        _totals[name] = _totals.get(name, 0.0) + seconds
+        ring = _samples.get(name)
+        if ring is None:
+            ring = _samples[name] = deque(maxlen=RING_SIZE)
+        ring.append(seconds)
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def profiled(name=None):
+    """Decorator form of span(); the name defaults to module.function."""
+    def decorate(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - started)
+
+        wrapper.__profiled__ = True
+        return wrapper
+    return decorate
+
+
+def instrument_module(namespace, prefix):
+    """
+    Wrap every plain function defined in a module namespace (pass globals()).
+    Call it at the very end of the module so `from module import fn` picks up
+    the wrapped versions.
+    """
+    module_name = namespace.get("__name__")
+    for attr, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module_name
+                and not getattr(value, "__profiled__", False)
+                and not inspect.isgeneratorfunction(value)):
+            namespace[attr] = profiled(f"{prefix}.{attr}")(value)
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def get_stats():
+    """List of per-span dicts, slowest total first. Times are in milliseconds."""
+    with _lock:
+        rows = []
+        for name, count in _counts.items():
+            ring = list(_samples[name])
+            rows.append({
+                "name": name,
+                "count": count,
+                "total_ms": _totals[name] * 1000,
+                "avg_ms": _totals[name] * 1000 / count,
+                "p95_ms": _p95(ring) * 1000,
+                "max_ms": max(ring) * 1000,
+            })
+    rows.sort(key=lambda r: r["total_ms"], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _counts.clear()
+        _totals.clear()
+        _samples.clear()
+
+
+def dump_json(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "spans": get_stats()},
+                  f, ensure_ascii=False, indent=2)
+    return path
+
+
+def _dump_on_exit():
+    path = os.environ.get(PROFILE_ENV)
+    if path and _counts:
+        dump_json(path)
+        print(f"[INFO] Profil kaydedildi: {path}")
+
+
+atexit.register(_dump_on_exit)
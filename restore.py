@@ -0,0 +1,248 @@
+# restore.py
+"""
+Browse and restore yedek_database backups without swapping files by hand.
+
+    python restore.py list
+    python restore.py diff <yedek>
+    python restore.py restore-tables <yedek> students attendance
+    python restore.py restore-students <yedek> 12 57
+
+<yedek> is a file name from `list` (or a full path). The backup is attached
+read-only next to the live DB; restores run in a single transaction and a
+fresh safety backup of the live DB is taken first.
+"""
+import argparse
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from backup import get_backup_dir, list_backups, decompress_backup, run_backup
+from database import get_connection, _link_unlinked_students
+
+DIFF_TABLES = ("students", "attendance", "hesap_records")
+RESTORABLE_TABLES = ("classes", "students", "attendance", "hesap_records", "kasa_table", "class_order",
+                     "class_sessions", "closures", "credit_ledger", "persons",
+                     "students_archive", "attendance_archive", "credit_ledger_archive")
+
+
+def _resolve_backup_path(name_or_path) -> Path:
+    p = Path(name_or_path)
+    if p.is_file():
+        return p
+    p = get_backup_dir() / str(name_or_path)
+    if not p.is_file():
+        raise FileNotFoundError(f"Yedek bulunamadı: {name_or_path}")
+    return p
+
+
+@contextmanager
+def attached_backup(name_or_path):
+    """
+    Yield a connection to the live DB with the backup ATTACHed read-only as `bk`.
+    Compressed backups are inflated into a temporary file for the duration.
+    """
+    src = _resolve_backup_path(name_or_path)
+    tmp_dir = None
+    if src.name.endswith((".gz", ".zst")):
+        tmp_dir = Path(tempfile.mkdtemp(prefix="dance_restore_"))
+        db_file = decompress_backup(src, tmp_dir / "backup.db")
+    else:
+        db_file = src
+
+    conn = get_connection()
+    try:
+        conn.execute("ATTACH DATABASE ? AS bk", (f"{db_file.resolve().as_uri()}?mode=ro",))
+        yield conn
+    finally:
+        conn.close()
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def _common_columns(conn, table):
+    live = _columns(conn, "main", table)
+    old = set(_columns(conn, "bk", table))
+    return [c for c in live if c in old]
+
+
+def _repair_person_links(conn, cur):
+    """Restored students may point at persons the live DB no longer has (or at none)."""
+    pcols = ", ".join(f'"{c}"' for c in _common_columns(conn, "persons"))
+    if pcols:
+        cur.execute(f"""
+            INSERT OR IGNORE INTO main.persons ({pcols})
+            SELECT {pcols} FROM bk.persons WHERE id IN (SELECT person_id FROM main.students)
+        """)
+    cur.execute("""
+        UPDATE main.students SET person_id=NULL
+        WHERE person_id IS NOT NULL AND person_id NOT IN (SELECT id FROM main.persons)
+    """)
+    _link_unlinked_students(cur)
+
+
+def diff_backup(name_or_path, tables=DIFF_TABLES):
+    """
+    Compare backup and live DB row by row (by id).
+    Returns {table: {"added": [ids only in live], "removed": [ids only in backup],
+                     "changed": [ids whose columns differ]}}.
+    """
+    result = {}
+    with attached_backup(name_or_path) as conn:
+        for table in tables:
+            cols = _common_columns(conn, table)
+            if "id" not in cols:
+                continue
+            cur = conn.cursor()
+            cur.execute(f"SELECT id FROM main.{table} EXCEPT SELECT id FROM bk.{table} ORDER BY id")
+            added = [r[0] for r in cur.fetchall()]
+            cur.execute(f"SELECT id FROM bk.{table} EXCEPT SELECT id FROM main.{table} ORDER BY id")
+            removed = [r[0] for r in cur.fetchall()]
+            differs = " OR ".join(f'm."{c}" IS NOT b."{c}"' for c in cols if c != "id") or "0"
+            cur.execute(f"""
+                SELECT m.id FROM main.{table} m
+                JOIN bk.{table} b ON b.id = m.id
+                WHERE {differs}
+                ORDER BY m.id
+            """)
+            changed = [r[0] for r in cur.fetchall()]
+            result[table] = {"added": added, "removed": removed, "changed": changed}
+    return result
+
+
+def restore_tables(name_or_path, tables):
+    """Replace whole tables of the live DB with their contents in the backup (one transaction)."""
+    unknown = [t for t in tables if t not in RESTORABLE_TABLES]
+    if unknown:
+        raise ValueError(f"Geri yüklenemeyen tablo: {', '.join(unknown)}")
+
+    safety_path, _ = run_backup()
+    with attached_backup(name_or_path) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            counts = {}
+            for table in tables:
+                cols = ", ".join(f'"{c}"' for c in _common_columns(conn, table))
+                cur.execute(f"DELETE FROM main.{table}")
+                cur.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM bk.{table}")
+                counts[table] = cur.rowcount
+            if {"students", "persons"} & set(tables):
+                _repair_person_links(conn, cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    print(f"[INFO] Geri yükleme öncesi güvenlik yedeği: {safety_path}")
+    return counts
+
+
+def restore_students_from_backup(name_or_path, student_ids, with_attendance=True):
+    """
+    Put the given students back exactly as they were in the backup (same ids),
+    optionally together with their attendance rows. One transaction.
+    Returns the ids that were found in the backup.
+    """
+    ids = [int(i) for i in student_ids]
+    if not ids:
+        return []
+    qmarks = ",".join("?" for _ in ids)
+
+    safety_path, _ = run_backup()
+    with attached_backup(name_or_path) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(f"SELECT id FROM bk.students WHERE id IN ({qmarks})", ids)
+            found = [r[0] for r in cur.fetchall()]
+            if found:
+                fq = ",".join("?" for _ in found)
+                cols = ", ".join(f'"{c}"' for c in _common_columns(conn, "students"))
+                cur.execute(f"""
+                    INSERT OR REPLACE INTO main.students ({cols})
+                    SELECT {cols} FROM bk.students WHERE id IN ({fq})
+                """, found)
+                if with_attendance:
+                    acols = ", ".join(f'"{c}"' for c in _common_columns(conn, "attendance"))
+                    cur.execute(f"DELETE FROM main.attendance WHERE student_id IN ({fq})", found)
+                    cur.execute(f"""
+                        INSERT OR REPLACE INTO main.attendance ({acols})
+                        SELECT {acols} FROM bk.attendance WHERE student_id IN ({fq})
+                    """, found)
+                    # the credit events belong to the restored left_classes balance
+                    lcols = ", ".join(f'"{c}"' for c in _common_columns(conn, "credit_ledger"))
+                    if lcols:
+                        cur.execute(f"DELETE FROM main.credit_ledger WHERE student_id IN ({fq})", found)
+                        cur.execute(f"""
+                            INSERT OR REPLACE INTO main.credit_ledger ({lcols})
+                            SELECT {lcols} FROM bk.credit_ledger WHERE student_id IN ({fq})
+                        """, found)
+                _repair_person_links(conn, cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    print(f"[INFO] Geri yükleme öncesi güvenlik yedeği: {safety_path}")
+    return found
+
+
+def _print_list():
+    for meta in list_backups():
+        counts = meta.get("row_counts") or {}
+        counts_txt = ", ".join(f"{k}={v}" for k, v in counts.items()) or "-"
+        print(f"{meta['created']}  {meta['kind']:<5}  {meta['size'] / 1024:>8.1f} KB  "
+              f"{meta['file']}  [{counts_txt}]")
+
+
+def _print_diff(diff):
+    for table, parts in diff.items():
+        print(f"== {table}")
+        for label, key in (("Yedekten sonra eklenen", "added"),
+                           ("Yedekten sonra silinen", "removed"),
+                           ("Değişen", "changed")):
+            ids = parts[key]
+            preview = ", ".join(str(i) for i in ids[:20]) + (" ..." if len(ids) > 20 else "")
+            print(f"  {label}: {len(ids)}  {preview}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yedekleri listele, karşılaştır ve geri yükle")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="yedekleri listele")
+    p = sub.add_parser("diff", help="yedeği canlı veritabanı ile karşılaştır")
+    p.add_argument("backup")
+    p = sub.add_parser("restore-tables", help="tabloları yedekten geri yükle")
+    p.add_argument("backup")
+    p.add_argument("tables", nargs="+", choices=RESTORABLE_TABLES)
+    p = sub.add_parser("restore-students", help="öğrencileri (ve yoklamalarını) geri yükle")
+    p.add_argument("backup")
+    p.add_argument("ids", nargs="+", type=int)
+    p.add_argument("--no-attendance", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        if args.cmd == "list":
+            _print_list()
+        elif args.cmd == "diff":
+            _print_diff(diff_backup(args.backup))
+        elif args.cmd == "restore-tables":
+            counts = restore_tables(args.backup, args.tables)
+            print("✅ " + ", ".join(f"{t}: {n} satır" for t, n in counts.items()))
+        elif args.cmd == "restore-students":
+            found = restore_students_from_backup(args.backup, args.ids, not args.no_attendance)
+            missing = sorted(set(args.ids) - set(found))
+            print(f"✅ Geri yüklenen öğrenci: {len(found)}")
+            if missing:
+                print(f"[WARNING] Yedekte bulunamadı: {missing}")
+    except (FileNotFoundError, ValueError, sqlite3.Error) as e:
+        print(f"[ERROR] {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
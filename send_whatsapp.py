@@ -1,48 +1,66 @@
-from database import get_students_with_zero_kalan_gun
-from whatsapp_sender import send_whatsapp_message
+import argparse
+from database import get_persons_due_within, enqueue_outbox_message
+from whatsapp_sender import clean_number_for_whatsapp, get_transport
+from outbox import OutboxDispatcher, format_summary
 from datetime import datetime
-import tkinter as tk
-from tkinter import messagebox
-
-def clean_number_for_whatsapp(number):
-    digits = ''.join(filter(str.isdigit, number))
-    if digits.startswith('0'):
-        digits = digits[1:]
-    return f"+90{digits}"
 
 def show_popup_message(message):
+    import tkinter as tk
+    from tkinter import messagebox
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     messagebox.showinfo("Notification", message)
     root.destroy()
 
-def main():
-    today_str = datetime.today().strftime("%d-%m-%Y")
+def build_payment_message(class_name, due_str):
+    return f"""Sayın üyemiz,
+
+Dans kursuna devamlılığınız için teşekkür ederiz.
+{class_name} dersleri için güncel ödeme tarihi {due_str}’tir.
+Ödeme yaptıysanız lütfen bu mesajı dikkate almayınız.
 
-    students = get_students_with_zero_kalan_gun()
-    if not students:
-        # 🔥 Show a pop-up message if there are no students
-        show_popup_message("Ödeme günü gelen öğrenci yok")
-        print("[INFO] No students with 0 kalan gün.")
-        return
+Saygılarımla,
+111 Dans Stüdyos"""
 
-    for student_id, name, number, class_name in students:
+def enqueue_payment_reminders(days=0):
+    """
+    Put payment reminders for people due today (or within `days` days) into the outbox,
+    one message per person listing all of their due classes.
+    Returns (queued, already_queued, names_without_number).
+    """
+    queued, duplicates, no_number = 0, 0, []
+    for person_id, name, number, class_names, end_time in get_persons_due_within(days):
         if not number:
             print(f"[WARNING] {name} in numarası yok")
+            no_number.append(name)
             continue
+        key = f"odeme:p{person_id}:{end_time}"  # one reminder per person per payment period
+        due_str = datetime.strptime(end_time, "%Y-%m-%d").strftime("%d-%m-%Y")
+        message_text = build_payment_message(class_names, due_str)
+        if enqueue_outbox_message(key, None, clean_number_for_whatsapp(number), message_text):
+            queued += 1
+        else:
+            duplicates += 1
+    return queued, duplicates, no_number
 
-        # 🔥 Insert the class name dynamically!
-        message_text = f"""Sayın üyemiz,
+def main(transport=None, popup=True, days=0):
+    queued, duplicates, no_number = enqueue_payment_reminders(days)
+    summary = OutboxDispatcher(transport or get_transport()).run()
 
-Dans kursuna devamlılığınız için teşekkür ederiz. 
-{class_name} dersleri için güncel ödeme tarihi {today_str}’tir. 
-Ödeme yaptıysanız lütfen bu mesajı dikkate almayınız.
-
-Saygılarımla,
-111 Dans Stüdyos"""
+    if not (queued or duplicates or no_number or summary["sent"] or summary["failed"]):
+        text = "Ödeme günü gelen öğrenci yok"
+    else:
+        text = format_summary(summary, queued=queued, skipped=no_number)
+        if duplicates:
+            text += f"\nDaha önce gönderilmiş/kuyrukta: {duplicates}"
 
-        clean_number = clean_number_for_whatsapp(number)
-        send_whatsapp_message(clean_number, message_text)
+    print("[INFO] " + text.replace("\n", " | "))
+    if popup:
+        show_popup_message(text)
+    return summary
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ödeme hatırlatmalarını gönder")
+    parser.add_argument("--days", type=int, default=0,
+                        help="bugünden itibaren kaç gün içinde ödemesi gelenler (varsayılan: sadece bugün)")
+    main(days=parser.parse_args().days)
@@ -0,0 +1,143 @@
+# sql_trace.py
+"""
+Opt-in SQL tracing for the connection layer.
+
+    DANCE_SQL_TRACE=1 python main.py
+
+Every statement sent to SQLite (trigger bodies included) is counted against
+the current user action, e.g.
+
+    [SQL] #12 ui.refresh_student_table: 43 statements, 18 ms
+
+UI entry points mark themselves with @sql_action("..."). Statements slower than
+DANCE_SQL_SLOW_MS (default 50) are logged with their EXPLAIN QUERY PLAN, and
+an action that issues more than DANCE_SQL_MAX_STATEMENTS (default 100)
+statements is flagged as a likely N+1 loop. With the variable unset,
+get_connection() returns a plain connection and the decorators cost one
+attribute lookup.
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+
+TRACE_ENV = "DANCE_SQL_TRACE"
+SLOW_MS = float(os.environ.get("DANCE_SQL_SLOW_MS", "50"))
+MAX_STATEMENTS = int(os.environ.get("DANCE_SQL_MAX_STATEMENTS", "100"))
+
+_ids = itertools.count(1)
+_local = threading.local()
+_lock = threading.Lock()
+recent_actions = deque(maxlen=200)   # finished action summaries, newest last
+
+
+def enabled():
+    return os.environ.get(TRACE_ENV, "") not in ("", "0")
+
+
+class _Action:
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+        self.statements = 0
+        self.slow = 0
+        self.started = time.perf_counter()
+
+
+def current_action():
+    return getattr(_local, "action", None)
+
+
+class sql_action(ContextDecorator):
+    """
+    Correlate the statements of one user action. Usable as decorator or
+    `with sql_action("name"):`. Nested actions count towards the outermost one.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._owner = False
+
+    def _recreate_cm(self):
+        return sql_action(self.name)  # fresh state per decorated call
+
+    def __enter__(self):
+        self._owner = enabled() and current_action() is None
+        if self._owner:
+            _local.action = _Action(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if not self._owner:
+            return False
+        action = _local.action
+        _local.action = None
+        ms = (time.perf_counter() - action.started) * 1000
+        summary = {"id": action.id, "name": action.name, "statements": action.statements,
+                   "slow": action.slow, "ms": round(ms, 1)}
+        with _lock:
+            recent_actions.append(summary)
+        tag = "[WARNING]" if action.statements > MAX_STATEMENTS else "[SQL]"
+        print(f"{tag} #{action.id} {action.name}: {action.statements} statements, {ms:.0f} ms"
+              + (" (possible N+1)" if action.statements > MAX_STATEMENTS else ""))
+        return False
+
+
+def _on_statement(sql):
+    action = current_action()
+    if action is not None:
+        action.statements += 1
+
+
+def _explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    try:
+        cur = sqlite3.Cursor(conn)  # plain cursor: not timed, not traced as slow
+        return [row[-1] for row in cur.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error:
+        return []
+
+
+def _log_slow(conn, sql, params, ms):
+    action = current_action()
+    if action is not None:
+        action.slow += 1
+    label = f"#{action.id} {action.name}" if action else "-"
+    print(f"[WARNING] Slow query ({ms:.0f} ms, {label}): {' '.join(sql.split())}")
+    for line in _explain(conn, sql, params):
+        print(f"[WARNING]     plan: {line}")
+
+
+class TracedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        result = super().execute(sql, params)
+        ms = (time.perf_counter() - started) * 1000
+        if ms >= SLOW_MS:
+            _log_slow(self.connection, sql, params, ms)
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        result = super().executemany(sql, seq_of_params)
+        ms = (time.perf_counter() - started) * 1000
+        if ms >= SLOW_MS:
+            print(f"[WARNING] Slow executemany ({ms:.0f} ms): {' '.join(sql.split())}")
+        return result
+
+
+class TracedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_on_statement)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+
+def connect(database, **kwargs):
+    return sqlite3.connect(database, factory=TracedConnection, **kwargs)
@@ -0,0 +1,17 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh dance_school.db in tmp_path, migrated to SCHEMA_VERSION."""
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "dance_school.db")
+    database.init_db()
+    return database.DB_PATH
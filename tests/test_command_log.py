@@ -0,0 +1,51 @@
+# tests/test_command_log.py
+import sqlite3
+import threading
+
+import command_log
+from command_log import undoable
+from database import add_class, add_closure, add_student_to_class
+
+TABLES = ("students", "credit_ledger", "persons", "closures")
+
+
+def _rows(db):
+    conn = sqlite3.connect(db)
+    rows = {t: conn.execute(f"SELECT * FROM {t} ORDER BY rowid").fetchall() for t in TABLES}
+    conn.close()
+    return rows
+
+
+def test_undo_then_redo_restores_the_rows(db):
+    add_class("Salsa", "Salı", "20.00", 1000)
+    class_id = sqlite3.connect(db).execute("SELECT id FROM classes").fetchone()[0]
+    before = _rows(db)
+
+    with undoable("Öğrenci ekleme"):
+        add_student_to_class(class_id, "Ayşe Yılmaz", "05551112233", "2026-01-05", "not", 8)
+    after = _rows(db)
+    assert after["students"] and after["credit_ledger"] and after["persons"]
+    assert command_log.state() == ("Öğrenci ekleme", None)
+
+    label, affected = command_log.undo()
+    assert label == "Öğrenci ekleme" and class_id in affected["class_ids"]
+    assert _rows(db) == before
+    assert command_log.state() == (None, "Öğrenci ekleme")
+
+    command_log.redo()
+    assert _rows(db) == after
+    assert command_log.state() == ("Öğrenci ekleme", None)
+
+
+def test_writes_of_other_threads_are_not_part_of_the_command(db):
+    with undoable("Tatil günü ekleme"):
+        add_closure("2026-04-23", "Bayram")
+        worker = threading.Thread(target=add_closure, args=("2026-05-19", "başka iş"))
+        worker.start()
+        worker.join()
+
+    command_log.undo()
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT date FROM closures").fetchall() == [("2026-05-19",)]
+    assert conn.execute("SELECT COUNT(*) FROM command_pending").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,54 @@
+# tests/test_credit_ledger.py
+import sqlite3
+from datetime import date
+
+import database
+from database import add_class, add_student_to_class, delete_student, sweep_credit_consumption
+
+
+def _setup_class(db, swept_until):
+    add_class("Salsa", "Salı", "20.00", 1000)   # Tuesdays
+    conn = sqlite3.connect(db)
+    class_id = conn.execute("SELECT id FROM classes").fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES ('credits_swept_until', ?)", (swept_until,))
+    conn.commit()
+    conn.close()
+    return class_id
+
+
+def _balances(db):
+    """{name: (left_classes, ledger sum)}"""
+    conn = sqlite3.connect(db)
+    rows = conn.execute("""
+        SELECT s.name, s.left_classes, (SELECT SUM(amount) FROM credit_ledger l WHERE l.student_id = s.id)
+        FROM students s
+    """).fetchall()
+    conn.close()
+    return {name: (left, total) for name, left, total in rows}
+
+
+def test_sweep_keeps_ledger_and_balance_equal(db):
+    class_id = _setup_class(db, "2026-01-01")
+    add_student_to_class(class_id, "Ayşe", "", "2026-01-01", "", 8)
+
+    # Tuesdays 6, 13, 20 and 27 January
+    assert sweep_credit_consumption(today=date(2026, 2, 1)) == 4
+    assert sweep_credit_consumption(today=date(2026, 2, 1)) == 0
+    assert _balances(db) == {"Ayşe": (4, 4)}
+
+
+def test_backdated_student_pays_for_swept_lessons(db):
+    class_id = _setup_class(db, "2026-01-01")
+    sweep_credit_consumption(today=date(2026, 2, 1))
+
+    add_student_to_class(class_id, "Mehmet", "", "2026-01-10", "", 8)   # 13, 20, 27 January
+    assert _balances(db)["Mehmet"] == (5, 5)
+
+    student_id = sqlite3.connect(db).execute("SELECT id FROM students").fetchone()[0]
+    database.update_student_start_time_only(student_id, "2026-01-25")   # only the 27th stays
+    assert _balances(db)["Mehmet"] == (7, 7)
+
+    delete_student(student_id)
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM credit_ledger WHERE student_id=?", (student_id,)).fetchone()[0] == 0
+    conn.close()
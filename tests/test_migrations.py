@@ -0,0 +1,51 @@
+# tests/test_migrations.py
+import shutil
+import sqlite3
+from pathlib import Path
+
+import database
+
+BASELINE_DB = Path(__file__).resolve().parent.parent / "dance_school.db"
+COUNTED = ("students", "attendance", "classes", "hesap_records")
+
+
+def _schema(conn):
+    return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+
+
+def _counts(conn):
+    return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in COUNTED}
+
+
+def test_empty_db_reaches_schema_version(db):
+    conn = sqlite3.connect(db)
+    assert database.get_schema_version(conn) == database.SCHEMA_VERSION
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {"students", "change_log", "credit_ledger", "persons", "command_log", "command_pending"} <= tables
+    conn.close()
+
+
+def test_baseline_db_migrates_from_zero_and_again(tmp_path, monkeypatch):
+    path = tmp_path / "dance_school.db"
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    assert database.get_schema_version(conn) == 0
+    before = _counts(conn)
+    conn.close()
+
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.init_db()
+    conn = sqlite3.connect(path)
+    assert database.get_schema_version(conn) == database.SCHEMA_VERSION
+    assert _counts(conn) == before
+    schema, persons = _schema(conn), conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
+
+    # every step must be safe on a DB that already has its change
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    database.init_db()
+    assert database.get_schema_version(conn) == database.SCHEMA_VERSION
+    assert _schema(conn) == schema
+    assert _counts(conn) == before
+    assert conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0] == persons
+    conn.close()
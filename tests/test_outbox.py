@@ -0,0 +1,97 @@
+# tests/test_outbox.py
+import sqlite3
+
+from database import enqueue_outbox_message
+from outbox import OutboxDispatcher
+from whatsapp_sender import FakeTransport
+
+
+class FakeClock:
+    """time.monotonic + time.sleep stand-in; send_seconds passes on every send."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TimedTransport(FakeTransport):
+    def __init__(self, clock, send_seconds=5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.clock = clock
+        self.send_seconds = send_seconds
+        self.times = []
+
+    def send(self, phone, message):
+        self.times.append(self.clock.now)
+        self.clock.now += self.send_seconds
+        super().send(phone, message)
+
+
+def _dispatcher(transport, clock, **kwargs):
+    return OutboxDispatcher(transport, min_interval=20.0, sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def _status(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT phone, status, attempts FROM whatsapp_outbox ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_dedupe_key_queues_once(db):
+    assert enqueue_outbox_message("odeme:p1:2026-01-01", 1, "+905551112233", "merhaba")
+    assert not enqueue_outbox_message("odeme:p1:2026-01-01", 1, "+905551112233", "merhaba")
+    assert len(_status(db)) == 1
+
+
+def test_sends_keep_the_minimum_gap(db):
+    for i in range(3):
+        enqueue_outbox_message(f"k{i}", i, f"+90555000000{i}", "merhaba")
+    clock = FakeClock()
+    transport = TimedTransport(clock)
+
+    summary = _dispatcher(transport, clock).run()
+
+    assert summary["sent"] == 3
+    assert clock.sleeps == [15.0, 15.0]   # 20 s gap minus the 5 s the send took
+    assert [b - a for a, b in zip(transport.times, transport.times[1:])] == [20.0, 20.0]
+
+
+def test_failure_waits_for_the_next_run_then_gives_up(db):
+    enqueue_outbox_message("k-bad", 1, "+905550000001", "merhaba")
+    enqueue_outbox_message("k-ok", 2, "+905550000002", "merhaba")
+    clock = FakeClock()
+    transport = TimedTransport(clock, fail_numbers={"+905550000001"})
+    dispatcher = _dispatcher(transport, clock, max_attempts=3)
+
+    first = dispatcher.run()
+    assert (first["sent"], first["failed"], first["gave_up"]) == (1, 1, 0)
+    assert transport.attempts.count("+905550000001") == 1   # no inline retries
+    assert _status(db)[0] == ("+905550000001", "pending", 1)
+
+    dispatcher.run()
+    third = dispatcher.run()
+    assert third["retried"] == 1 and third["gave_up"] == 1
+    assert _status(db)[0] == ("+905550000001", "failed", 3)
+
+    assert dispatcher.run()["failed"] == 0
+    assert transport.attempts.count("+905550000001") == 3
+
+
+def test_flaky_number_is_sent_on_a_later_run(db):
+    enqueue_outbox_message("k", 1, "+905550000003", "merhaba")
+    clock = FakeClock()
+    transport = TimedTransport(clock, flaky={"+905550000003": 1})
+    dispatcher = _dispatcher(transport, clock)
+
+    assert dispatcher.run()["failed"] == 1
+    summary = dispatcher.run()
+    assert (summary["sent"], summary["retried"]) == (1, 1)
+    assert _status(db) == [("+905550000003", "sent", 2)]
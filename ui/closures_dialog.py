@@ -0,0 +1,74 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
+    QDateEdit, QLineEdit, QHeaderView, QLabel
+)
+from PyQt5.QtCore import Qt, QDate
+from database import get_closures, add_closure, delete_closure
+from sql_trace import sql_action
+from command_log import undoable
+
+
+class ClosuresDialog(QDialog):
+    """Studio closures / public holidays; no lessons are counted on these days."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Tatil Günleri")
+        self.resize(500, 450)
+        self.changed = False   # caller refreshes the class tables when True
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, 2)
+        self.table.setHorizontalHeaderLabels(["Tarih", "Açıklama"])
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.table)
+
+        form = QHBoxLayout()
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDisplayFormat("dd-MM-yyyy")
+        self.reason_edit = QLineEdit()
+        self.reason_edit.setPlaceholderText("Açıklama (ör. Cumhuriyet Bayramı)")
+        form.addWidget(QLabel("Tarih:"))
+        form.addWidget(self.date_edit)
+        form.addWidget(self.reason_edit)
+        layout.addLayout(form)
+
+        buttons = QHBoxLayout()
+        for text, slot in (("Ekle", self.add), ("Seçileni sil", self.delete_selected),
+                           ("Kapat", self.accept)):
+            btn = QPushButton(text)
+            btn.clicked.connect(slot)
+            buttons.addWidget(btn)
+        layout.addLayout(buttons)
+
+        self.refresh()
+
+    def refresh(self):
+        closures = get_closures()
+        self.table.setRowCount(len(closures))
+        for row, (date_str, reason) in enumerate(closures):
+            item = QTableWidgetItem(QDate.fromString(date_str, "yyyy-MM-dd").toString("dd-MM-yyyy"))
+            item.setData(Qt.UserRole, date_str)
+            self.table.setItem(row, 0, item)
+            self.table.setItem(row, 1, QTableWidgetItem(reason or ""))
+
+    @sql_action("ui.add_closure")
+    @undoable("Tatil günü ekleme")
+    def add(self):
+        add_closure(self.date_edit.date().toString("yyyy-MM-dd"), self.reason_edit.text().strip())
+        self.reason_edit.clear()
+        self.changed = True
+        self.refresh()
+
+    @sql_action("ui.delete_closures")
+    @undoable("Tatil günü silme")
+    def delete_selected(self):
+        rows = sorted({i.row() for i in self.table.selectedItems()})
+        for row in rows:
+            delete_closure(self.table.item(row, 0).data(Qt.UserRole))
+        if rows:
+            self.changed = True
+            self.refresh()
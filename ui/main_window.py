@@ -1,24 +1,24 @@
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout,
-    QPushButton, QTabWidget, QSpacerItem, QSizePolicy, QDateEdit,QLineEdit,QMessageBox,QDialog, QLabel,QHBoxLayout,QTableWidget, QTableWidgetItem
+    QPushButton, QTabWidget, QSpacerItem, QSizePolicy, QLineEdit,QMessageBox,QDialog, QLabel,QHBoxLayout,QTableWidget, QTableWidgetItem,
+    QCheckBox, QComboBox
 )
 from PyQt5.QtGui import QIcon
 from class_management import ClassManager
 from student_management import StudentManager
-from functools import partial
-from datetime import datetime,timedelta  # 🟢 Import once at the top!
+from datetime import datetime  # 🟢 Import once at the top!
 from hesap_dialog import HesapDialog
-import pandas as pd
 import os
 from database import get_class_id
 from PyQt5.QtCore import QTimer, QTime, QDateTime,Qt
 import subprocess
 from PyQt5.QtWidgets import QAction
 from PyQt5.QtGui import QKeySequence
-import re
 from pathlib import Path
-from database import get_db_path,get_storage_root
 from utils import tr_norm
+from profiling import profiled
+from sql_trace import sql_action
+import command_log
 
 PROJECT_ROOT = Path(__file__).resolve().parent  # this file's folder
 
@@ -85,13 +85,14 @@ class MainWindow(QMainWindow):
         # Top button layout...
         self.setup_buttons()
 
-        # Load classes on startup
-        self.class_manager.load_classes()
-        self.class_tabs.currentChanged.connect(self.class_manager.load_class_times)
+        # Classes are loaded in on_data_ready(), once main.py finished the DB startup work;
+        # until then Ctrl+Z/Ctrl+Y stay off too, the worker is still archiving and sweeping
+        self._set_branch_ui_enabled(False)
+        self.statusBar().showMessage("⏳ Veritabanı hazırlanıyor...")
 
         save_button = QPushButton("💾 Sınıf başına Excel kaydet")
         save_button.setStyleSheet("font-weight: bold; font-size: 14px; background-color: #cce5ff;")
-        save_button.clicked.connect(self.save_each_class_to_separate_excels)
+        save_button.clicked.connect(lambda: self.save_each_class_to_separate_excels())  # profiled wrapper takes *args
         self.button_layout.addWidget(save_button)
 
         
@@ -101,6 +102,117 @@ class MainWindow(QMainWindow):
         self.button_layout.addWidget(self.backup_button)
         self.setup_auto_save_timer()
 
+        # Developer panel with the profiling spans (see profiling.py)
+        self.profiling_action = QAction("Profil", self)
+        self.profiling_action.setShortcut(QKeySequence("Ctrl+Shift+P"))
+        self.profiling_action.triggered.connect(self.show_profiling_panel)
+        self.addAction(self.profiling_action)
+
+    def show_profiling_panel(self):
+        from ui.profiling_panel import ProfilingPanel
+        if not hasattr(self, "profiling_panel"):
+            self.profiling_panel = ProfilingPanel(self)
+        self.profiling_panel.refresh()
+        self.profiling_panel.show()
+        self.profiling_panel.raise_()
+
+    def on_data_ready(self, archived=0):
+        """Fill the class tabs once migrations and the credit sweep are done."""
+        self.class_manager.load_classes()
+        self.class_tabs.currentChanged.connect(lambda _index: self.class_manager.load_class_times())
+        self._set_branch_ui_enabled(True)
+        command_log.listeners.append(self.update_undo_button_state)
+        self.update_undo_button_state()
+        self.show_upcoming_due_summary()
+        self.report_archived(archived)
+
+    def report_archived(self, archived):
+        """Tell the user which startup run moved students to the archive, and how to get them back."""
+        if archived:
+            QMessageBox.information(
+                self, "Arşiv",
+                f"{archived} pasif öğrenci arşive taşındı.\n"
+                "Genel aramada '(arşiv)' olarak görünürler ve oradan geri alınabilirler.\n"
+                "Açılışta arşivlemeyi kapatmak için: DANCE_AUTO_ARCHIVE=0"
+            )
+
+    def switch_branch(self, name, then=None):
+        """Make another branch the active database and reload the window from it; then() runs afterwards."""
+        from database import (
+            get_active_branch, set_active_branch, init_db, archive_inactive_students, sweep_credit_consumption,
+            auto_archive_enabled,
+        )
+        from ui.workers import FunctionWorker
+        previous = get_active_branch()
+        if name == previous:
+            if then:
+                then()
+            return
+
+        # nothing showing the old branch may stay editable once DB_PATH points at the new one:
+        # close the non-modal dialogs (Hesap saves into the old branch on close) and freeze the window
+        for attr in ("hesap_dialog", "today_dialog"):
+            dialog = getattr(self, attr, None)
+            if dialog is not None and dialog.isVisible():
+                dialog.close()
+        self._set_branch_ui_enabled(False)
+
+        set_active_branch(name)
+        self.branch_combo.setCurrentText(name)
+        self.statusBar().showMessage(f"⏳ {name} şubesi hazırlanıyor...")
+
+        def prepare():
+            # same startup work as main.prepare_database, for the newly active branch
+            init_db()
+            archived = archive_inactive_students() if auto_archive_enabled() else 0
+            sweep_credit_consumption()
+            return archived
+
+        worker = FunctionWorker(prepare, parent=self)
+        worker.succeeded.connect(lambda archived: self._on_branch_ready(name, then, archived))
+        worker.failed.connect(lambda error: self._on_branch_failed(previous, error))
+        self._branch_worker = worker
+        worker.start()
+
+    def _set_branch_ui_enabled(self, enabled):
+        self.class_tabs.setEnabled(enabled)
+        self.button_widget.setEnabled(enabled)
+        self.student_manager.undo_shortcut.setEnabled(enabled)
+        self.student_manager.redo_shortcut.setEnabled(enabled)
+
+    def _on_branch_ready(self, name, then=None, archived=0):
+        self.setWindowTitle(f"111 Dans okulu — {name}")
+        self.class_manager.load_classes()
+        self._set_branch_ui_enabled(True)
+        self.update_undo_button_state()   # the command log lives in each branch's DB
+        self.show_upcoming_due_summary()
+        self.report_archived(archived)
+        if then:
+            then()
+
+    def _on_branch_failed(self, previous, error):
+        """Go back to the branch the window still shows."""
+        from database import set_active_branch
+        set_active_branch(previous)
+        self.branch_combo.setCurrentText(previous)
+        self._set_branch_ui_enabled(True)
+        self.statusBar().showMessage("❌ Şube açılamadı")
+        QMessageBox.critical(self, "Hata", f"Şube veritabanı hazırlanamadı:\n{error}")
+
+    def show_branch_overview(self, days=3):
+        """All branches at a glance (one query over the ATTACHed branch databases)."""
+        from database import get_branch_overview, get_active_branch
+        lines = []
+        for branch, students, persons, due, attended in get_branch_overview(days):
+            marker = " (aktif)" if branch == get_active_branch() else ""
+            lines.append(f"{branch}{marker}: {students} öğrenci, {persons} kişi, "
+                         f"{days} gün içinde ödemesi gelen {due}, bugünkü yoklama {attended}")
+        QMessageBox.information(self, "Şubeler", "\n".join(lines))
+
+    def on_data_failed(self, error):
+        self.statusBar().showMessage("❌ Veritabanı açılamadı")
+        QMessageBox.critical(self, "Hata", f"Veritabanı hazırlanamadı:\n{error}")
+
     def _persist_class_tab_order(self, from_index, to_index):
                 # Save order whenever the user drags a tab
                 from database import normalize_class_key, save_class_tab_order
@@ -118,6 +230,26 @@ class MainWindow(QMainWindow):
         self.button_widget.setLayout(self.button_layout)
         self.layout.insertWidget(0, self.button_widget)
 
+        # 🏢 Branch selector, only shown with several databases in branches.json
+        from database import get_branch_names, get_active_branch
+        multi_branch = len(get_branch_names()) > 1
+        self.branch_combo = QComboBox()
+        self.branch_combo.setStyleSheet("font-weight: bold; font-size: 16px;")
+        self.branch_combo.addItems(get_branch_names())
+        self.branch_combo.setCurrentText(get_active_branch())
+        self.branch_combo.setToolTip("Aktif şube")
+        self.branch_combo.activated.connect(lambda i: self.switch_branch(self.branch_combo.itemText(i)))
+        self.branch_combo.setVisible(multi_branch)
+        self.button_layout.addWidget(self.branch_combo)
+
+        self.branch_overview_button = QPushButton("📊 Şubeler")
+        self.branch_overview_button.setStyleSheet(button_style)
+        self.branch_overview_button.clicked.connect(lambda: self.show_branch_overview())
+        self.branch_overview_button.setVisible(multi_branch)
+        self.button_layout.addWidget(self.branch_overview_button)
+        if multi_branch:
+            self.setWindowTitle(f"111 Dans okulu — {get_active_branch()}")
+
         # 🔥 Buttons on the left
         self.add_class_button = QPushButton("Sınıf Ekle")
         self.add_class_button.setStyleSheet(button_style)
@@ -155,6 +287,15 @@ class MainWindow(QMainWindow):
         self.search_button_all.clicked.connect(self.search_globally)
         self.button_layout.addWidget(self.search_button_all)
 
+        self.search_archive_checkbox = QCheckBox("Arşiv dahil")
+        self.search_archive_checkbox.setToolTip("Arşive taşınmış eski öğrencileri de ara")
+        self.button_layout.addWidget(self.search_archive_checkbox)
+
+        self.search_branches_checkbox = QCheckBox("Tüm şubeler")
+        self.search_branches_checkbox.setToolTip("Diğer şubelerin veritabanlarında da ara")
+        self.search_branches_checkbox.setVisible(multi_branch)
+        self.button_layout.addWidget(self.search_branches_checkbox)
+
         self.send_messages_button = QPushButton("📨 WP Mesaj yolla")
         self.send_messages_button.setStyleSheet(button_style)
         self.send_messages_button.clicked.connect(self.notify_students_with_zero_kalan_gun)
@@ -180,17 +321,48 @@ class MainWindow(QMainWindow):
         self.undo_button.setEnabled(False)  # starts disabled; we’ll toggle it
         self.button_layout.addWidget(self.undo_button)
 
+        self.redo_button = QPushButton()
+        self.redo_button.setIcon(QIcon.fromTheme("edit-redo"))
+        self.redo_button.setToolTip("Yinele (Ctrl+Y)")
+        self.redo_button.setFixedSize(32, 32)
+        self.redo_button.clicked.connect(self.student_manager.redo_last_action)
+        self.redo_button.setEnabled(False)
+        self.button_layout.addWidget(self.redo_button)
+
 
         self.hesap_button = QPushButton("Hesap")
         self.hesap_button.setStyleSheet(button_style)
         self.hesap_button.clicked.connect(self.open_hesap_dialog)
         self.button_layout.addWidget(self.hesap_button)
 
+        self.closures_button = QPushButton("Tatil Günleri")
+        self.closures_button.setStyleSheet(button_style)
+        self.closures_button.clicked.connect(self.open_closures_dialog)
+        self.button_layout.addWidget(self.closures_button)
+
+        self.today_button = QPushButton("📅 Bugün")
+        self.today_button.setStyleSheet(button_style)
+        self.today_button.clicked.connect(self.open_today_dialog)
+        self.button_layout.addWidget(self.today_button)
+
 
     def open_hesap_dialog(self):
         self.hesap_dialog = HesapDialog(self)
         self.hesap_dialog.show()
 
+    def open_today_dialog(self):
+        from ui.today_dialog import TodayDialog
+        self.today_dialog = TodayDialog(self)
+        self.today_dialog.show()
+
+    def open_closures_dialog(self):
+        from ui.closures_dialog import ClosuresDialog
+        dialog = ClosuresDialog(self)
+        dialog.exec_()
+        if dialog.changed:
+            # closures change which lessons get charged -> roll the calendar and redraw
+            self.class_manager.refresh_left_courses()
+
     def get_current_class_id(self):
         current_tab_index = self.class_tabs.currentIndex()
         if current_tab_index == -1:
@@ -208,22 +380,6 @@ class MainWindow(QMainWindow):
         return get_class_id(class_name, day, hour)
 
 
-    def create_date_edit(self, date_str, class_id, table_widget, row, col):
-        date_edit = QDateEdit()
-        date_edit.setCalendarPopup(True)
-        date_edit.setDisplayFormat("dd-MM-yyyy")
-        if date_str:
-            try:
-                date_edit.setDate(datetime.strptime(date_str, "%Y-%m-%d"))
-            except:
-                date_edit.setDate(datetime.today())
-        else:
-            date_edit.setDate(datetime.today())
-        date_edit.dateChanged.connect(
-            partial(self.student_manager.update_student_date_from_calendar, class_id, table_widget, row, col)
-        )
-        return date_edit
-
     def add_student_dialog(self, class_id, table_widget):
         self.student_manager.add_student_dialog(class_id, table_widget)
 
@@ -269,161 +425,31 @@ class MainWindow(QMainWindow):
 
 
 
+    @profiled("export.all_classes_excel")
+    @sql_action("export.all_classes_excel")
     def save_all_classes_to_excel(self):
-        from database import get_unique_class_names, get_class_times_by_name, get_class_id, get_students_by_class_id
-        import pandas as pd, os
-        from datetime import datetime
-        from PyQt5.QtWidgets import QMessageBox
-
-        # --- where to save ---
-        base_path = get_storage_root() / "Dersler"
-        base_path.mkdir(parents=True, exist_ok=True)
-
-        today_str = datetime.today().strftime("%d-%m-%Y")
-        file_path = base_path / f"{today_str}.xlsx"
-        n = 1
-        while file_path.exists():
-            file_path = base_path / f"{today_str} ({n}).xlsx"
-            n += 1
-
-        writer = pd.ExcelWriter(str(file_path), engine="xlsxwriter")
-
+        from excel_export import export_all_classes
 
-        wb = writer.book
-        # Force Excel to recalc formulas on open (supports old & new XlsxWriter)
-        if hasattr(wb, "set_calc_on_load"):
-            wb.set_calc_on_load()   # newer XlsxWriter
-        else:
-            wb.calc_on_load = True  # older XlsxWriter: it's a boolean attribute
-
-
-
-        # ---- formats ----
-        header_fmt = wb.add_format({
-            "bold": True, "font_color": "white", "align": "center",
-            "valign": "vcenter", "bg_color": "#1f4e79", "border": 1
-        })
-        center_y = wb.add_format({"align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-        phone_y  = wb.add_format({"align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-        # Use Turkish-looking format with dashes
-        date_y   = wb.add_format({"num_format": "dd-mm-yyyy", "align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-        blue_col_fmt = wb.add_format({"bg_color": "#1f4e79", "font_color": "white", "align": "center", "valign": "vcenter", "border": 1})
-        blue_center = wb.add_format({
-            "bg_color": "#1f4e79", "font_color": "white",
-            "align": "center", "valign": "vcenter", "border": 1
-        })
-        blue_date = wb.add_format({
-            "bg_color": "#1f4e79", "font_color": "white",
-            "align": "center", "valign": "vcenter", "border": 1,
-            "num_format": "dd-mm-yyyy"
-        })
-        date_mdy = wb.add_format({
-            "num_format": "mm/dd/yyyy",
-            "align": "center", "valign": "vcenter",
-            "border": 1, "bg_color": "#ffe699"
-        })
-                        
-        # conditional colors for KALAN GÜN (F)
-        kalan_green = {"type": "cell", "criteria": ">=", "value": 0, "format": wb.add_format({"bg_color": "#c6efce", "border": 1})}
-        kalan_pink  = {"type": "cell", "criteria": "<",  "value": 0, "format": wb.add_format({"bg_color": "#f8cbad", "border": 1})}
-
-        # columns: A NUMARA, B ADI SOYADI, C TELEFON, D BAŞLANGIÇ, E ÖDEME, F KALAN GÜN, G <TODAY>
-        col_widths = [9, 30, 20, 18, 18, 12, 16]  # a bit wider for phone/dates
-
-        has_data = False
-        today_excel_text = datetime.today().strftime("%m/%d/%Y")
-
-
-
-        for class_name in get_unique_class_names():
-            for day, hour in get_class_times_by_name(class_name):
-                class_id = get_class_id(class_name, day, hour)
-                students = get_students_by_class_id(class_id)
-                if not students:
-                    continue
-                has_data = True
-
-                # build rows
-                rows = []
-                end_dates = []  # <-- add this before the loop
-
-                for i, s in enumerate(students, start=1):
-                    end_dates.append(s[4] or "")  # s[4] = ÖDEME TARİHİ from DB
-                    rows.append({
-                        "NUMARA": i,
-                        "ADI SOYADI": s[1] or "",
-                        "TELEFON": s[2] or "",
-                        "BAŞLANGIÇ TARİHİ": "",   # we'll compute from end date
-                        "ÖDEME TARİHİ": "",        # will be the formula (D + 28)
-                        "KALAN GÜN": "",
-                        "": ""
-                    })
-                df = pd.DataFrame(rows, columns=["NUMARA","ADI SOYADI","TELEFON","BAŞLANGIÇ TARİHİ","ÖDEME TARİHİ","KALAN GÜN",""])
-
-                sheet = f"{class_name}_{day}_{hour}".replace(":", "-")
-                df.to_excel(writer, sheet_name=sheet, index=False)
-                ws = writer.sheets[sheet]
-
-                # set widths
-                for col, width in enumerate(col_widths):
-                    ws.set_column(col, col, width)
-                ws.set_row(0, 20)  # no global style
-
-                # re-write A1..F1 in blue, G1 stays normal (yellow date cell)
-                headers = ["NUMARA","ADI SOYADI","TELEFON","BAŞLANGIÇ TARİHİ","ÖDEME TARİHİ","KALAN GÜN"]
-                for c in range(6):  # A..F
-                    ws.write(0, c, headers[c], header_fmt)
-
-                ws.write(0, 6, "BUGÜN", center_y)          # G1 title (not blue)
-                ws.write_formula(1, 6, "=TODAY()", date_y)   # G2 holds TODAY(); we'll point all rows to $G$2
-
-
-
-                # write body with formulas
-                for r in range(len(df)):
-                    excel_row = r + 1
-                    rownum    = excel_row + 1
-
-                    # A..C
-                    ws.write(excel_row, 0, df.iloc[r, 0], center_y)  # NUMARA
-                    ws.write(excel_row, 1, df.iloc[r, 1], center_y)  # ADI SOYADI
-                    ws.write(excel_row, 2, df.iloc[r, 2], phone_y)   # TELEFON
-
-                    # Compute D from ÖDEME TARİHİ in DB: start = end - 28 days (write as REAL date)
-                    raw_end = students[r][4]  # DB 'end_time' / ÖDEME TARİHİ for this student
-                    end_dt  = self._parse_end_date(raw_end)
-                    if end_dt is not None:
-                        start_dt = end_dt - timedelta(days=28)
-                        ws.write_datetime(excel_row, 3, start_dt, date_mdy)  # REAL date
-                    else:
-                        ws.write_blank(excel_row, 3, None, date_mdy)         # blank cell, not a text ""
-
-
-                    # E (ÖDEME TARİHİ) = SUM(D{row}+28)  — no IF guard, use real date format
-                    ws.write_formula(excel_row, 4, f'=SUM(D{rownum}+28)', date_mdy)
-
-                    # F (KALAN GÜN) = E{row} - $G$2  (remaining days)
-                    ws.write_formula(excel_row, 5, f'=IF(E{rownum}="","",E{rownum}-$G$2)', center_y)
-
-
-
-
-                # conditional formatting for F
-                last_row = len(df) + 1
-                ws.conditional_format(f"F2:F{last_row}", kalan_green)
-                ws.conditional_format(f"F2:F{last_row}", kalan_pink)
-
-                # freeze header
-                ws.freeze_panes(1, 0)
-
-        writer.close()
-
-        if has_data:
-            QMessageBox.information(self, "Export Complete", f"Kaydedildi:\n{file_path}")
+        result = export_all_classes()
+        if result["sheets"]:
+            QMessageBox.information(self, "Export Complete", f"Kaydedildi:\n{result['file']}")
         else:
             QMessageBox.information(self, "No Data", "Kaydedilecek veri bulunamadı.")
 
-
+    def run_nightly_export(self):
+        """The 22:30 export, sharing the job lock and the once-a-day marker with `cli export-all`."""
+        from database import acquire_job_lock, release_job_lock, job_done_today, mark_job_done
+        from excel_export import export_all_classes
+        if job_done_today("export-all") or not acquire_job_lock("export-all"):
+            print("[INFO] Gece Excel çıktısı bugün zaten alındı veya başka yerde alınıyor, atlandı")
+            return
+        try:
+            result = export_all_classes()
+            mark_job_done("export-all")
+        finally:
+            release_job_lock("export-all")
+        if result["sheets"]:
+            self.statusBar().showMessage(f"Gece Excel çıktısı kaydedildi: {result['file']}")
 
     def setup_auto_save_timer(self):
         self.auto_save_timer = QTimer(self)
@@ -433,8 +459,8 @@ class MainWindow(QMainWindow):
     def check_and_save_data(self):
         current_time = QTime.currentTime()
         if current_time.hour() == 22 and current_time.minute() == 30:
-            # 🔥 Save in main window
-            self.save_all_classes_to_excel()
+            # 🔥 Save in main window (unless cron's `python -m cli export-all` already did)
+            self.run_nightly_export()
 
             # 🔥 Also save in Kasa if open
             if hasattr(self, 'hesap_dialog') and self.hesap_dialog.isVisible():
@@ -442,6 +468,19 @@ class MainWindow(QMainWindow):
                 self.hesap_dialog.save_as_png()
 
 
+    def show_upcoming_due_summary(self, days=3):
+        """Status bar hint with the people whose payment is due in the next few days."""
+        from database import get_persons_due_within
+        due = get_persons_due_within(days)
+        if not due:
+            self.statusBar().showMessage(f"Önümüzdeki {days} gün içinde ödemesi gelen öğrenci yok.")
+            return
+        today_count = sum(1 for row in due if row[4] == datetime.today().strftime("%Y-%m-%d"))
+        names = ", ".join(row[1] for row in due[:5]) + (" ..." if len(due) > 5 else "")
+        self.statusBar().showMessage(
+            f"Bugün ödemesi gelen: {today_count} | Önümüzdeki {days} gün: {len(due)} ({names})"
+        )
+
     def notify_students_with_zero_kalan_gun(self):
         subprocess.Popen(["python", "send_whatsapp.py"])
         print("[INFO] Launched WhatsApp messaging script in a separate process.")
@@ -522,9 +561,10 @@ class MainWindow(QMainWindow):
         QMessageBox.information(self, "Sonuç", "Bu alt sekmede eşleşen öğrenci bulunamadı.")
 
 
+    @sql_action("ui.search_globally")
     def search_globally(self):
         from PyQt5.QtWidgets import QMessageBox
-        from database import search_students_by_name_or_number
+        from database import search_persons, search_persons_all_branches, get_active_branch
         from utils import tr_norm
 
         raw = (self.search_bar.text() or "").strip()
@@ -534,8 +574,17 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Bilgi", "En az bir harf veya rakam girin.")
             return
 
+        include_archive = self.search_archive_checkbox.isChecked()
+        all_branches = self.search_branches_checkbox.isChecked()
+
+        def run_search(text):
+            # → [(branch, person_id, name, phone, enrollments), ...]
+            if all_branches:
+                return search_persons_all_branches(text, include_archive)
+            return [(get_active_branch(), *p) for p in search_persons(text, include_archive)]
+
         # --- 1) Normal sorgu
-        rows_main = search_students_by_name_or_number(raw)
+        rows_main = run_search(raw)
 
         # --- 2) İ/ı varyantını dene → İ=I, ı=i eşitliği garantisi
         def flip_i_variants(s: str) -> str:
@@ -548,16 +597,15 @@ class MainWindow(QMainWindow):
         rows_alt = []
         alt = flip_i_variants(raw)
         if alt != raw:
-            rows_alt = search_students_by_name_or_number(alt)
+            rows_alt = run_search(alt)
 
-        # --- 3) Birleştir (id bazlı tekilleme, sırayı koru)
+        # --- 3) Birleştir (kişi bazlı tekilleme, sırayı koru)
         merged = []
         seen = set()
         for lst in (rows_main, rows_alt):
-            for row in lst:  # (sid, sname, phone, cname, day, hour)
-                sid = row[0]
-                if sid not in seen:
-                    seen.add(sid)
+            for row in lst:  # (branch, person_id, name, phone, [(sid, cname, day, hour, archived), ...])
+                if row[:2] not in seen:
+                    seen.add(row[:2])
                     merged.append(row)
 
         # --- 4) Sonuca göre
@@ -565,16 +613,19 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Sonuç", "Eşleşen öğrenci bulunamadı.")
             return
 
-        if len(merged) == 1:
-            sid, sname, phone, cname, day, hour = merged[0]
+        branch, _pid, _name, _phone, enrollments = merged[0]
+        if (len(merged) == 1 and len(enrollments) == 1 and not enrollments[0][4]
+                and branch == get_active_branch()):
+            sid, cname, day, hour, _archived = enrollments[0]
             self.goto_student(sid, cname, day, hour)
             return
 
         # Birden fazla sonuç → TEK KULLANIMLIK POPUP (eski davranış)
-        self._show_search_results_popup(merged)
+        self._show_search_results_popup(merged, show_branch=all_branches)
 
 
 
+    @sql_action("ui.goto_student")
     def goto_student(self, student_id, class_name, day, hour):
         # 1) Switch to the correct CLASS tab
         target_idx = None
@@ -636,204 +687,77 @@ class MainWindow(QMainWindow):
 
 
     def backup_database(self):
-        import shutil, datetime
-        from PyQt5.QtWidgets import QMessageBox
+        """Run an online backup on a worker thread so the UI stays responsive."""
+        from backup import run_backup
+        from ui.workers import FunctionWorker
 
-        db_path = Path(get_db_path())
-        backup_dir = get_storage_root() / "yedek_database"
-        backup_dir.mkdir(parents=True, exist_ok=True)
+        if getattr(self, "_backup_worker", None) is not None and self._backup_worker.isRunning():
+            return
 
-        date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        backup_path = backup_dir / f"dance_school{date_str}.db"
+        self.backup_button.setEnabled(False)
+        self.backup_button.setText("⏳ Yedekleniyor...")
 
-        try:
-            shutil.copy(str(db_path), str(backup_path))
-            QMessageBox.information(self, "Yedekleme Başarılı",
-                                    f"Veritabanı yedeği oluşturuldu:\n{backup_path}")
-        except Exception as e:
-            QMessageBox.warning(self, "Yedekleme Hatası",
-                                f"Yedekleme sırasında bir hata oluştu:\n{e}")
+        self._backup_worker = FunctionWorker(run_backup, parent=self)
+        self._backup_worker.succeeded.connect(self._on_backup_finished)
+        self._backup_worker.failed.connect(self._on_backup_failed)
+        self._backup_worker.start()
+
+    def _reset_backup_button(self):
+        self.backup_button.setEnabled(True)
+        self.backup_button.setText("💾 Yedekle")
+
+    def _on_backup_finished(self, result):
+        backup_path, removed = result
+        self._reset_backup_button()
+        msg = f"Veritabanı yedeği oluşturuldu:\n{backup_path}"
+        if removed:
+            msg += f"\n\n{len(removed)} eski yedek silindi."
+        QMessageBox.information(self, "Yedekleme Başarılı", msg)
+
+    def _on_backup_failed(self, error):
+        self._reset_backup_button()
+        QMessageBox.warning(self, "Yedekleme Hatası",
+                            f"Yedekleme sırasında bir hata oluştu:\n{error}")
 
 
-    def update_undo_button_state(self, has_undo: bool):
+    def update_undo_button_state(self):
+        """Enable Geri Al / Yinele from the persisted command log and name the action in the tooltip."""
         try:
-            self.undo_button.setEnabled(bool(has_undo))
+            undo_label, redo_label = command_log.state()
+            self.undo_button.setEnabled(undo_label is not None)
+            self.undo_button.setToolTip(f"Geri Al: {undo_label} (Ctrl+Z)" if undo_label else "Geri Al (Ctrl+Z)")
+            self.redo_button.setEnabled(redo_label is not None)
+            self.redo_button.setToolTip(f"Yinele: {redo_label} (Ctrl+Y)" if redo_label else "Yinele (Ctrl+Y)")
         except Exception:
             pass
 
-    def _parse_end_date(self, s):
-        if not s:
-            return None
-        txt = str(s).strip()
-        try:
-            from datetime import datetime as _dt
-
-            # 1) ISO: 2025-10-01 or 2025/10/01 or 2025.10.01  -> year-first
-            if re.fullmatch(r"\d{4}[-/.]\d{2}[-/.]\d{2}", txt):
-                t = txt.replace("/", "-").replace(".", "-")
-                return _dt.strptime(t, "%Y-%m-%d")
-
-            # 2) Day-first: 01-10-2025, 01/10/2025, 01.10.2025  -> Turkish style
-            if re.fullmatch(r"\d{2}[-/.]\d{2}[-/.]\d{4}", txt):
-                t = txt.replace("/", "-").replace(".", "-")
-                return _dt.strptime(t, "%d-%m-%Y")
-
-            # 3) Fallback: let pandas try day-first (no warning because ISO already handled)
-            import pandas as pd
-            dt = pd.to_datetime(txt, errors="coerce", dayfirst=True)
-            if pd.isna(dt):
-                return None
-            return dt.to_pydatetime()
-        except Exception:
-            return None
+    def apply_replay(self, affected):
+        """Refresh only the views an undo/redo touched (see command_log._replay)."""
+        if affected["classes"]:
+            self.class_manager.load_classes()
+        else:
+            self.class_manager.refresh_class_tables(affected["class_ids"])
+        if affected["hesap"] and getattr(self, "hesap_dialog", None) and self.hesap_dialog.isVisible():
+            self.hesap_dialog.reload()
 
+    @profiled("export.per_class_excels")
+    @sql_action("export.per_class_excels")
     def save_each_class_to_separate_excels(self):
         """
         Creates one Excel file per CLASS (HipHop.xlsx, Bachata.xlsx, …).
         Each file contains tabs for its sub-classes (e.g., "Cmrtsi 12.00 - Pazar 12.00"),
         with the same formatting + formulas you already use.
         """
-        from database import (
-            get_unique_class_names, get_class_times_by_name, get_class_id, get_students_by_class_id
-        )
-        import pandas as pd, re
-        from datetime import datetime, timedelta
-        from PyQt5.QtWidgets import QMessageBox
-
-        base_path = get_storage_root() / "Dersler"
-        base_path.mkdir(parents=True, exist_ok=True)
-        today_str = datetime.today().strftime("%d-%m-%Y")
+        from excel_export import export_per_class
 
-        total_files = 0
-        total_sheets = 0
-        total_rows = 0
-
-        # ----- iterate top-level classes -----
-        for class_name in get_unique_class_names():
-            times = get_class_times_by_name(class_name)
-            if not times:
-                continue
-
-            # file name: <DATE> - <ClassName>.xlsx  (unique if already exists)
-            safe_name = re.sub(r'[^\w\s\-\u00C0-\u024F]', "_", class_name).strip()
-            file_path = base_path / f"{today_str} - {safe_name}.xlsx"
-            n = 1
-            while file_path.exists():
-                file_path = base_path / f"{today_str} - {safe_name} ({n}).xlsx"
-                n += 1
-
-            writer = pd.ExcelWriter(str(file_path), engine="xlsxwriter")
-            wb = writer.book
-            if hasattr(wb, "set_calc_on_load"):
-                wb.set_calc_on_load()
-            else:
-                wb.calc_on_load = True
-
-            # formats (same palette as before)
-            header_fmt = wb.add_format({
-                "bold": True, "font_color": "white", "align": "center",
-                "valign": "vcenter", "bg_color": "#1f4e79", "border": 1
-            })
-            center_y = wb.add_format({"align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-            phone_y  = wb.add_format({"align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-            date_y   = wb.add_format({"num_format": "dd-mm-yyyy", "align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-            blue_center = wb.add_format({"bg_color": "#1f4e79", "font_color": "white", "align": "center", "valign": "vcenter", "border": 1})
-            date_mdy = wb.add_format({"num_format": "mm/dd/yyyy", "align": "center", "valign": "vcenter", "border": 1, "bg_color": "#ffe699"})
-            kalan_green = {"type": "cell", "criteria": ">=", "value": 0, "format": wb.add_format({"bg_color": "#c6efce", "border": 1})}
-            kalan_pink  = {"type": "cell", "criteria": "<",  "value": 0, "format": wb.add_format({"bg_color": "#f8cbad", "border": 1})}
-            col_widths = [9, 30, 20, 18, 18, 12, 16]
-
-            class_has_data = False
-
-            # ----- each sub-class becomes a sheet -----
-            for (day, hour) in times:
-                class_id = get_class_id(class_name, day, hour)
-                students = get_students_by_class_id(class_id)
-                if not students:
-                    continue
-
-                class_has_data = True
-                total_sheets += 1
-
-                # build rows
-                rows = []
-                for i, s in enumerate(students, start=1):
-                    rows.append({
-                        "NUMARA": i,
-                        "ADI SOYADI": s[1] or "",
-                        "TELEFON": s[2] or "",
-                        "BAŞLANGIÇ TARİHİ": "",   # computed from end date (28 days before)
-                        "ÖDEME TARİHİ": "",        # formula (D + 28)
-                        "KALAN GÜN": "",
-                        "": ""
-                    })
-                df = pd.DataFrame(rows, columns=["NUMARA", "ADI SOYADI", "TELEFON", "BAŞLANGIÇ TARİHİ", "ÖDEME TARİHİ", "KALAN GÜN", ""])
-
-                sheet = f"{day} {hour}".replace(":", "-")
-                df.to_excel(writer, sheet_name=sheet, index=False)
-                ws = writer.sheets[sheet]
-
-                # widths and header styling
-                for col, width in enumerate(col_widths):
-                    ws.set_column(col, col, width)
-                ws.set_row(0, 20)
-
-                headers = ["NUMARA","ADI SOYADI","TELEFON","BAŞLANGIÇ TARİHİ","ÖDEME TARİHİ","KALAN GÜN"]
-                for c in range(6):
-                    ws.write(0, c, headers[c], header_fmt)
-
-                ws.write(0, 6, "BUGÜN", center_y)
-                ws.write_formula(1, 6, "=TODAY()", date_y)  # G2
-
-                # body with formulas
-                for r in range(len(df)):
-                    excel_row = r + 1
-                    rownum    = excel_row + 1
-
-                    # A..C
-                    ws.write(excel_row, 0, df.iloc[r, 0], center_y)  # NUMARA
-                    ws.write(excel_row, 1, df.iloc[r, 1], center_y)  # ADI
-                    ws.write(excel_row, 2, df.iloc[r, 2], phone_y)   # TEL
-
-                    # D = start = (end_from_db - 28) as REAL date (if end present)
-                    raw_end = students[r][4]
-                    end_dt  = self._parse_end_date(raw_end)
-                    if end_dt is not None:
-                        start_dt = end_dt - timedelta(days=28)
-                        ws.write_datetime(excel_row, 3, start_dt, date_mdy)
-                    else:
-                        ws.write_blank(excel_row, 3, None, date_mdy)
-
-                    # E = D + 28
-                    ws.write_formula(excel_row, 4, f'=IF(D{rownum}="", "", D{rownum}+28)', date_mdy)
-                    # F = E - $G$2
-                    ws.write_formula(excel_row, 5, f'=IF(E{rownum}="","",E{rownum}-$G$2)', center_y)
-
-                last_row = len(df) + 1
-                ws.conditional_format(f"F2:F{last_row}", kalan_green)
-                ws.conditional_format(f"F2:F{last_row}", kalan_pink)
-                ws.freeze_panes(1, 0)
-
-                total_rows += len(students)
-
-            writer.close()
-            if class_has_data:
-                total_files += 1
-            else:
-                # remove empty file (no students in any sub-class)
-                try:
-                    import os
-                    os.remove(str(file_path))
-                except Exception:
-                    pass
-
-        if total_files == 0:
+        result = export_per_class()
+        if not result["files"]:
             QMessageBox.information(self, "No Data", "Kaydedilecek veri bulunamadı.")
         else:
             QMessageBox.information(
                 self, "Tamam",
-                f"{total_files} sınıf için Excel oluşturuldu.\n"
-                f"Toplam sayfa: {total_sheets}, toplam öğrenci satırı: {total_rows}"
+                f"{len(result['files'])} sınıf için Excel oluşturuldu.\n"
+                f"Toplam sayfa: {result['sheets']}, toplam öğrenci satırı: {result['rows']}"
             )
 
     def _ensure_results_tab(self):
@@ -898,11 +822,19 @@ class MainWindow(QMainWindow):
         table.resizeColumnsToContents()
         self.class_tabs.setCurrentIndex(idx)
 
-    def _show_search_results_popup(self, rows):
+    def _show_search_results_popup(self, persons, show_branch=False):
         """
-        rows: [(sid, sname, phone, cname, day, hour), ...]
-        Eski davranış: modal POPUP liste, her satırda 'Git' butonu.
+        persons: [(branch, person_id, name, phone, [(sid, cname, day, hour, archived), ...]), ...]
+        Modal POPUP liste: kişi başına bir blok, her kaydı için 'Git' butonu
+        (arşivdeki kayıtlar için 'Arşivden al'); show_branch bir Şube sütunu ekler.
         """
+        rows = []    # (sid, sname, phone, cname, day, hour, archived, branch)
+        spans = []   # (first row, row count) per person
+        for branch, _pid, sname, phone, enrollments in persons:
+            spans.append((len(rows), len(enrollments)))
+            rows.extend((sid, sname, phone, cname, day, hour, archived, branch)
+                        for sid, cname, day, hour, archived in enrollments)
+
         dlg = QDialog(self)
         dlg.setWindowTitle("🔎 Arama Sonuçları")
         dlg.setModal(True)  # modal
@@ -913,7 +845,8 @@ class MainWindow(QMainWindow):
         table = QTableWidget()
         lay.addWidget(table)
 
-        headers = ["Adı Soyadı", "Numara", "Sınıf", "Gün", "Saat", "Git"]
+        headers = ["Adı Soyadı", "Numara", "Sınıf", "Gün", "Saat"] + (["Şube"] if show_branch else []) + ["Git"]
+        go_col = len(headers) - 1
         table.setColumnCount(len(headers))
         table.setRowCount(len(rows))
         table.setHorizontalHeaderLabels(headers)
@@ -922,30 +855,67 @@ class MainWindow(QMainWindow):
         table.setEditTriggers(table.NoEditTriggers)
         table.verticalHeader().setDefaultSectionSize(36)
 
-        for r, (sid, sname, phone, cname, day, hour) in enumerate(rows):
+        for r, (sid, sname, phone, cname, day, hour, archived, branch) in enumerate(rows):
             # metin hücreleri
-            vals = [sname or "", phone or "", cname or "", day or "", hour or ""]
+            vals = [sname or "", phone or "", (cname or "") + (" (arşiv)" if archived else ""),
+                    day or "", hour or ""] + ([branch] if show_branch else [])
             for c, val in enumerate(vals):
                 it = QTableWidgetItem(str(val))
                 it.setTextAlignment(Qt.AlignCenter)
                 table.setItem(r, c, it)
 
             # Git butonu (geç bağlanma hatasına karşı argümanları sabitle)
-            btn = QPushButton("Git")
+            btn = QPushButton("Arşivden al" if archived else "Git")
             btn.setFixedHeight(28)
-            btn.clicked.connect(lambda _=False, _sid=sid, _cn=cname, _d=day, _h=hour: (
+            btn.clicked.connect(lambda _=False, _row=rows[r]: (
                 dlg.accept(),  # önce popup'ı kapat
-                self.goto_student(_sid, _cn, _d, _h)
+                self._open_search_result(_row)
             ))
-            table.setCellWidget(r, 5, btn)
+            table.setCellWidget(r, go_col, btn)
+
+        # ad / numara hücreleri kişinin tüm kayıtlarını kapsasın
+        for first, count in spans:
+            if count > 1:
+                table.setSpan(first, 0, count, 1)
+                table.setSpan(first, 1, count, 1)
 
         # çift tıkla "Git" gibi davran
         def _double_click(row, _col):
             if 0 <= row < len(rows):
-                sid, sname, phone, cname, day, hour = rows[row]
                 dlg.accept()
-                self.goto_student(sid, cname, day, hour)
+                self._open_search_result(rows[row])
         table.cellDoubleClicked.connect(_double_click)
 
         table.resizeColumnsToContents()
         dlg.exec_()  # tek kullanımlık popup
+
+    def _open_search_result(self, row):
+        """
+        Jump to a search hit; an archived one is brought back to its class first,
+        one in another branch makes that branch active first.
+        """
+        from database import unarchive_students, get_class_instance_by_id, get_active_branch
+        sid, sname, _phone, cname, day, hour, archived, branch = row
+        if branch != get_active_branch():
+            if QMessageBox.question(
+                self, "Şube",
+                f"'{sname}' {branch} şubesinde kayıtlı. {branch} şubesine geçilsin mi?",
+                QMessageBox.Yes | QMessageBox.No
+            ) == QMessageBox.Yes:
+                self.switch_branch(branch, then=lambda: self._open_search_result(row))
+            return
+        if archived:
+            if QMessageBox.question(
+                self, "Arşiv",
+                f"'{sname}' arşivde. Eski sınıfına ({cname}) geri alınsın mı?\n"
+                "Kursu uzatılmazsa bir sonraki açılışta yeniden arşivlenir.",
+                QMessageBox.Yes | QMessageBox.No
+            ) != QMessageBox.Yes:
+                return
+            class_id = unarchive_students([sid]).get(sid)
+            instance = get_class_instance_by_id(class_id) if class_id is not None else None
+            if instance is None:
+                QMessageBox.warning(self, "Arşiv", "Öğrenci arşivden alınamadı.")
+                return
+            cname, day, hour = instance.name, instance.day, instance.hour
+        self.goto_student(sid, cname, day, hour)
@@ -0,0 +1,57 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
+    QFileDialog, QHeaderView
+)
+from PyQt5.QtCore import Qt
+import profiling
+
+COLUMNS = [("name", "İşlem"), ("count", "Adet"), ("total_ms", "Toplam ms"),
+           ("avg_ms", "Ort. ms"), ("p95_ms", "p95 ms"), ("max_ms", "Maks ms")]
+
+
+class ProfilingPanel(QDialog):
+    """Developer panel: timing spans collected by profiling.py (Ctrl+Shift+P)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Profil")
+        self.resize(800, 500)
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels([label for _, label in COLUMNS])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        for text, slot in (("Yenile", self.refresh), ("Sıfırla", self.reset),
+                           ("JSON kaydet", self.save_json)):
+            btn = QPushButton(text)
+            btn.clicked.connect(slot)
+            buttons.addWidget(btn)
+        layout.addLayout(buttons)
+
+    def refresh(self):
+        stats = profiling.get_stats()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(stats))
+        for row, entry in enumerate(stats):
+            for col, (key, _) in enumerate(COLUMNS):
+                value = entry[key]
+                item = QTableWidgetItem()
+                if isinstance(value, str):
+                    item.setText(value)
+                else:
+                    item.setData(Qt.DisplayRole, round(value, 2))
+                self.table.setItem(row, col, item)
+        self.table.setSortingEnabled(True)
+
+    def reset(self):
+        profiling.reset()
+        self.refresh()
+
+    def save_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Profili kaydet", "profile.json", "JSON (*.json)")
+        if path:
+            profiling.dump_json(path)
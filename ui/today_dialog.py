@@ -0,0 +1,91 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget, QTreeWidgetItem,
+    QHeaderView, QLabel, QDateEdit
+)
+from PyQt5.QtCore import Qt, QDate
+from PyQt5.QtGui import QColor
+from database import get_today_overview
+
+COLUMNS = ["Ders / Öğrenci", "Numara", "Kalan Ders", "Bitiş Tarihi", "Yoklama"]
+
+
+def _fmt_minute(minute):
+    return "" if minute is None else f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class TodayDialog(QDialog):
+    """'Bugün': the day's lessons, their students and attendance marked so far."""
+
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.setWindowTitle("Bugün")
+        self.resize(750, 600)
+        layout = QVBoxLayout(self)
+
+        top = QHBoxLayout()
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDisplayFormat("dd-MM-yyyy")
+        self.date_edit.dateChanged.connect(lambda _d: self.refresh())
+        self.summary_label = QLabel()
+        refresh_btn = QPushButton("Yenile")
+        refresh_btn.clicked.connect(self.refresh)
+        top.addWidget(QLabel("Tarih:"))
+        top.addWidget(self.date_edit)
+        top.addWidget(self.summary_label, 1)
+        top.addWidget(refresh_btn)
+        layout.addLayout(top)
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(COLUMNS)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.tree.itemDoubleClicked.connect(self.open_student)
+        layout.addWidget(self.tree)
+
+        self.refresh()
+
+    def refresh(self):
+        rows = get_today_overview(self.date_edit.date().toString("yyyy-MM-dd"))
+        self.tree.clear()
+
+        sessions = {}   # class_id -> (item, [expected, present])
+        for (class_id, class_name, day, hour, minute, sid, name, number,
+             left_classes, end_time, present) in rows:
+            if class_id not in sessions:
+                item = QTreeWidgetItem(self.tree)
+                item.setData(0, Qt.UserRole, (class_name, day, hour))
+                sessions[class_id] = (item, [0, 0])
+            item, counts = sessions[class_id]
+            item.setText(0, f"{_fmt_minute(minute)}  {class_name}  ({day} {hour})")
+            if sid is None:
+                continue
+            counts[0] += 1
+            counts[1] += bool(present)
+            child = QTreeWidgetItem(item, [
+                name or "", number or "", str(left_classes if left_classes is not None else ""),
+                QDate.fromString(end_time or "", "yyyy-MM-dd").toString("dd-MM-yyyy"),
+                "✅" if present else "—",
+            ])
+            child.setData(0, Qt.UserRole, sid)
+            if present:
+                child.setBackground(4, QColor("#c6efce"))
+
+        total_expected = total_present = 0
+        for item, (expected, present) in sessions.values():
+            item.setText(4, f"{present}/{expected}")
+            total_expected += expected
+            total_present += present
+        self.tree.expandAll()
+        self.summary_label.setText(
+            f"{len(sessions)} ders, {total_expected} öğrenci, {total_present} yoklama alındı"
+            if sessions else "Bu tarihte ders yok"
+        )
+
+    def open_student(self, item, _column):
+        """Double click on a student: jump to its row in the class tabs."""
+        parent = item.parent()
+        if parent is None:
+            return
+        class_name, day, hour = parent.data(0, Qt.UserRole)
+        self.main_window.goto_student(item.data(0, Qt.UserRole), class_name, day, hour)
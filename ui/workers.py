@@ -0,0 +1,22 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class FunctionWorker(QThread):
+    """Run a callable off the GUI thread and report the outcome through signals."""
+
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, fn, *args, parent=None, **kwargs):
+        super().__init__(parent)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.succeeded.emit(result)
@@ -19,3 +19,49 @@ def tr_norm(s: str) -> str:
 
     # remove spaces for forgiving search
     return s.replace(" ", "")
+
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            import importlib
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Heavy modules (pandas, xlsxwriter, numpy...) are only needed for exports and
+    reports; `pd = lazy_import("pandas")` keeps them off the startup path.
+    """
+    return _LazyModule(name)
+
+
+def phone_key(number) -> str:
+    """Matching key of a phone number: its last 10 digits (drops +90 / leading 0)."""
+    digits = "".join(ch for ch in str(number or "") if ch.isdigit())
+    return digits[-10:] if len(digits) >= 10 else digits
+
+
+def format_phone_number(number):
+    # Remove non-digit characters
+    digits = ''.join(filter(str.isdigit, number))
+    # Format as xxx xxx xx xx
+    if len(digits) == 10:  # e.g., 5304567890
+        return f"{digits[:3]} {digits[3:6]} {digits[6:8]} {digits[8:10]}"
+    return number  # fallback if not 10 digits
@@ -1,10 +1,10 @@
 # whatsapp_sender.py
-import pywhatkit as kit
+import os
 from datetime import datetime
-import tkinter as tk
-from tkinter import messagebox
 
 def show_popup_message(message):
+    import tkinter as tk
+    from tkinter import messagebox
     root = tk.Tk()
     root.withdraw()  # Hide the main window
     messagebox.showinfo("WhatsApp Notification", message)
@@ -17,6 +17,8 @@ def clean_number_for_whatsapp(number):
     return f"+90{digits}"
 
 def send_whatsapp_message(to_number, message, delay_minutes=1):
+    import pywhatkit as kit  # heavy, and it touches the network on import
+
     # Show the info popup
     show_popup_message("30 saniye içerisinde whatsapp açılacak ve 10 saniye içinde mesaj gönderilecek.")
 
@@ -31,3 +33,55 @@ def send_whatsapp_message(to_number, message, delay_minutes=1):
 
     kit.sendwhatmsg(to_number, message, send_hour, send_minute, wait_time=10, tab_close=True)
     print(f"[INFO] Scheduled WhatsApp message to {to_number} at {send_hour}:{send_minute}")
+
+
+# === Transports for the outbox dispatcher ===
+# A transport only needs send(phone, message) that raises on failure.
+
+class PyWhatKitTransport:
+    """Sends through WhatsApp Web right away (no one-minute scheduling, no popups)."""
+
+    def __init__(self, wait_time=15, close_time=3):
+        self.wait_time = wait_time
+        self.close_time = close_time
+
+    def send(self, phone, message):
+        import pywhatkit as kit
+        kit.sendwhatmsg_instantly(phone, message, wait_time=self.wait_time,
+                                  tab_close=True, close_time=self.close_time)
+
+
+class FakeTransport:
+    """
+    Records messages instead of sending them; for tests and dry runs.
+    fail_numbers always fail, flaky={phone: n} fails the first n attempts.
+    """
+
+    def __init__(self, fail_numbers=(), flaky=None):
+        self.sent = []
+        self.attempts = []
+        self.fail_numbers = set(fail_numbers)
+        self.flaky = dict(flaky or {})
+
+    def send(self, phone, message):
+        self.attempts.append(phone)
+        if phone in self.fail_numbers:
+            raise RuntimeError(f"fake transport: {phone} reddedildi")
+        if self.flaky.get(phone, 0) > 0:
+            self.flaky[phone] -= 1
+            raise RuntimeError(f"fake transport: {phone} geçici hata")
+        self.sent.append((phone, message))
+
+
+TRANSPORTS = {
+    "pywhatkit": PyWhatKitTransport,
+    "fake": FakeTransport,
+}
+
+def get_transport(name=None):
+    """Build a transport by name; defaults to $WHATSAPP_TRANSPORT or 'pywhatkit'."""
+    name = name or os.environ.get("WHATSAPP_TRANSPORT", "pywhatkit")
+    try:
+        return TRANSPORTS[name]()
+    except KeyError:
+        raise ValueError(f"unknown WhatsApp transport: {name}") from None